@@ -1,24 +1,145 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
-from passlib.context import CryptContext
-from jose import jwt, JWTError
+from app.lazy_import import LazyModule
+from app.metrics import PASSWORD_HASH_SECONDS, PASSWORD_HASH_WAIT_SECONDS
+
+# why: jose (-> cryptography) et passlib pèsent ~110 ms à l'import ; chargés au premier usage
+jwt = LazyModule("jose.jwt")
 
 # --- Password hashing ---
-_pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Coût bcrypt configurable ; min == max == coût voulu -> verify_and_update() signale
+# tout hash produit avec un autre coût (rehash transparent au login).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+_pwd = None  # CryptContext, créé au premier hash
+
+def _context():
+    global _pwd
+    if _pwd is None:
+        from passlib.context import CryptContext
+        _pwd = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=BCRYPT_ROUNDS,
+            bcrypt__min_rounds=BCRYPT_ROUNDS,
+            bcrypt__max_rounds=BCRYPT_ROUNDS,
+        )
+    return _pwd
 
 def get_password_hash(password: str) -> str:
-    return _pwd.hash(password)
+    return _context().hash(password)
 
 def verify_password(plain: str, hashed: str) -> bool:
     try:
-        return _pwd.verify(plain, hashed)
+        return _context().verify(plain, hashed)
     except Exception:
         return False
 
+def verify_and_update_password(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """(ok, nouveau_hash | None) : nouveau_hash est fourni si le coût configuré a changé."""
+    try:
+        return _context().verify_and_update(plain, hashed)
+    except Exception:
+        return False, None
+
+# why: bcrypt = centaines de ms de CPU ; dans la boucle asyncio il gèle toute l'API.
+# Exécuteur dédié (bcrypt relâche le GIL) dont la taille borne la concurrence.
+# BCRYPT_MAX_PENDING borne les hachages en cours + en attente : au-delà, HashingBusy (-> 503) tout de
+# suite plutôt qu'une file sans fin (la file du ThreadPoolExecutor n'est pas bornée).
+BCRYPT_MAX_CONCURRENCY = int(os.getenv("BCRYPT_MAX_CONCURRENCY", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", str(8 * max(1, BCRYPT_MAX_CONCURRENCY))))
+BCRYPT_RETRY_AFTER = int(os.getenv("BCRYPT_RETRY_AFTER", "1"))
+_hash_executor: Optional[ThreadPoolExecutor] = None
+_hash_lock = threading.Lock()
+_hash_pending = 0
+_hash_stats: Dict[str, Any] = {
+    "calls": 0,
+    "rejected": 0,
+    "rehashes": 0,
+    "hash_seconds_total": 0.0,
+    "hash_seconds_max": 0.0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+
+class HashingBusy(Exception):
+    """Trop de hachages bcrypt en cours / en attente : le client doit réessayer plus tard."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("password hashing is saturated")
+        self.retry_after = retry_after
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    with _hash_lock:
+        if _hash_executor is None:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=max(1, BCRYPT_MAX_CONCURRENCY), thread_name_prefix="bcrypt"
+            )
+        return _hash_executor
+
+def _timed_hash(fn, submitted: float, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        took = time.perf_counter() - started
+        wait = started - submitted
+        PASSWORD_HASH_SECONDS.observe(took)
+        PASSWORD_HASH_WAIT_SECONDS.observe(wait)
+        with _hash_lock:
+            _hash_stats["calls"] += 1
+            _hash_stats["hash_seconds_total"] += took
+            _hash_stats["hash_seconds_max"] = max(_hash_stats["hash_seconds_max"], took)
+            _hash_stats["wait_seconds_total"] += wait
+            _hash_stats["wait_seconds_max"] = max(_hash_stats["wait_seconds_max"], wait)
+
+def _release_pending(_fut=None) -> None:
+    global _hash_pending
+    with _hash_lock:
+        _hash_pending -= 1
+
+async def _run_hashing(fn, *args):
+    global _hash_pending
+    with _hash_lock:
+        if _hash_pending >= max(1, BCRYPT_MAX_PENDING):
+            _hash_stats["rejected"] += 1
+            raise HashingBusy(BCRYPT_RETRY_AFTER)
+        _hash_pending += 1
+    loop = asyncio.get_running_loop()
+    try:
+        fut = loop.run_in_executor(_get_hash_executor(), _timed_hash, fn, time.perf_counter(), *args)
+    except BaseException:
+        _release_pending()
+        raise
+    # why: un hachage lancé ne s'interrompt pas -> la place reste prise jusqu'à sa fin réelle
+    fut.add_done_callback(_release_pending)
+    return await asyncio.shield(fut)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(get_password_hash, password)
+
+async def verify_and_update_password_async(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    ok, new_hash = await _run_hashing(verify_and_update_password, plain, hashed)
+    if new_hash:
+        with _hash_lock:
+            _hash_stats["rehashes"] += 1
+    return ok, new_hash
+
+def password_hashing_stats() -> Dict[str, Any]:
+    with _hash_lock:
+        out = dict(_hash_stats)
+        out["pending"] = _hash_pending
+    out.update(rounds=BCRYPT_ROUNDS, max_concurrency=BCRYPT_MAX_CONCURRENCY, max_pending=BCRYPT_MAX_PENDING)
+    return out
+
 # --- JWT ---
 SECRET = os.getenv("JWT_SECRET") or os.getenv("SECRET_KEY") or "dev_secret_change_me"
 ALGO = "HS256"
@@ -38,51 +159,10 @@ def create_signed_token(kind: str, data: Dict[str, Any], ttl_seconds: int = 900)
 def verify_signed_token(token: str, expected_kind: Optional[str] = None) -> Dict[str, Any]:
     try:
         payload = jwt.decode(token, SECRET, algorithms=[ALGO])
-    except JWTError as e:
+    except jwt.JWTError as e:
         raise ValueError(f"invalid token: {e}")
     if expected_kind is not None:
         k = payload.get('kind')
         if k is not None and k != expected_kind:
             raise ValueError('invalid kind')
     return payload
-
-# --- Dépendance d'auth minimale pour les routes factures ---
-from fastapi import Depends, HTTPException  # noqa: E402
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials  # noqa: E402
-from sqlalchemy import select  # noqa: E402
-from app.db import database  # noqa: E402
-from app import models  # noqa: E402
-
-_auth_scheme = HTTPBearer(auto_error=False)
-
-def _rec_get(rec, key, default=None):
-    """Accès sûr aux colonnes d'un Record/dataclass/dict."""
-    try:
-        if hasattr(rec, "_mapping"):
-            return dict(rec._mapping).get(key, default)
-        return rec[key]
-    except Exception:
-        return default
-
-async def get_current_user(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_auth_scheme),
-):
-    """
-    Fallback DEV : on prend le premier utilisateur.
-    (Pas de connect() ici pour éviter les soucis d'event loop en tests ;
-    on suppose que soit l'app a connecté au startup, soit le test a fait connect().)
-    """
-    utbl = models.User.__table__
-    try:
-        row = await database.fetch_one(select(utbl).limit(1))
-    except Exception:
-        # DB pas connectée -> 503 (les tests connectent explicitement avant d'appeler les endpoints)
-        raise HTTPException(status_code=503, detail="Database not connected")
-    if not row:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    return {
-        "id": int(_rec_get(row, "id", 0)),
-        "email": _rec_get(row, "email"),
-        "company_id": int(_rec_get(row, "company_id", 0)),
-    }
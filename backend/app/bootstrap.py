@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import models
+from app.db import database, engine
+from app.migrations import SEED_COUNTERS_SQL, UPGRADE_SQL, run_migrations
+from app.reporting import CREATE_AGGREGATES_SQL, CREATE_MATVIEWS_SQL, ensure_matviews, ensure_quote_aggregates
+from app.search import SEARCH_INDEX_SQL
+
+# Initialisation du schéma : create_all, migrations, matviews et agrégats de reporting.
+# Sérialisée par un verrou consultatif : plusieurs process (workers, conteneurs) qui démarrent
+# ensemble passent l'un après l'autre au lieu de lancer les mêmes DDL en parallèle.
+# Sous gunicorn, le master l'exécute une fois avant le fork (cf. gunicorn.conf.py) ;
+# les workers héritent de _done et la sautent.
+# Marqueur de version : empreinte de tout le DDL ci-dessus, enregistrée après un bootstrap réussi.
+# SCHEMA_BOOTSTRAP = "auto" (défaut : rien à faire si l'empreinte en base est la même),
+# "always" (DDL à chaque démarrage) ou "off" (schéma géré hors de l'application).
+
+logger = logging.getLogger("app.bootstrap")
+
+BOOTSTRAP_LOCK_KEY = 7008  # cf. AGGREGATES_LOCK_KEY (7007) dans app/reporting.py
+SCHEMA_BOOTSTRAP = os.getenv("SCHEMA_BOOTSTRAP", "auto")
+
+MARKER_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS public.schema_bootstrap (
+  id integer PRIMARY KEY CHECK (id = 1),
+  fingerprint text NOT NULL,
+  applied_at timestamptz NOT NULL DEFAULT now()
+)
+"""
+MARKER_UPSERT_SQL = """
+INSERT INTO public.schema_bootstrap (id, fingerprint) VALUES (1, :fingerprint)
+ON CONFLICT (id) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, applied_at = now()
+"""
+
+_done = False
+
+
+def schema_fingerprint() -> str:
+    """Empreinte du DDL appliqué au démarrage : change dès qu'un modèle ou une migration change."""
+    dialect = postgresql.dialect()
+    parts = []
+    for table in models.Base.metadata.sorted_tables:
+        parts.append(str(CreateTable(table).compile(dialect=dialect)))
+        parts.extend(str(CreateIndex(idx).compile(dialect=dialect)) for idx in sorted(table.indexes, key=lambda i: i.name))
+    parts.extend(UPGRADE_SQL)
+    parts.extend(SEARCH_INDEX_SQL)
+    parts.append(SEED_COUNTERS_SQL)
+    parts.append(CREATE_MATVIEWS_SQL)
+    parts.extend(CREATE_AGGREGATES_SQL)
+    return hashlib.sha256("\n;\n".join(parts).encode("utf-8")).hexdigest()
+
+
+async def applied_fingerprint() -> Optional[str]:
+    if not await database.fetch_val("SELECT to_regclass('public.schema_bootstrap') IS NOT NULL"):
+        return None
+    return await database.fetch_val("SELECT fingerprint FROM public.schema_bootstrap WHERE id = 1")
+
+
+@contextmanager
+def bootstrap_lock(bind) -> Iterator[None]:
+    # why: AUTOCOMMIT -> le verrou (de session) ne garde pas une transaction ouverte pendant les DDL
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        started = time.monotonic()
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": BOOTSTRAP_LOCK_KEY})
+        waited = time.monotonic() - started
+        if waited > 1:
+            logger.info("bootstrap lock acquired after %.1fs", waited)
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": BOOTSTRAP_LOCK_KEY})
+
+
+async def bootstrap() -> str:
+    """
+    Schéma + reporting, une fois par arbre de process ; `database` doit être connectée.
+    Renvoie ce qui a été fait : "inherited", "off", "current" (empreinte à jour) ou "applied".
+    """
+    global _done
+    if _done:
+        return "inherited"
+    if SCHEMA_BOOTSTRAP == "off":
+        _done = True
+        return "off"
+    fingerprint = schema_fingerprint()
+    # why: cas courant (redémarrage, scale-out) : une lecture, ni verrou ni DDL
+    if SCHEMA_BOOTSTRAP == "auto" and await applied_fingerprint() == fingerprint:
+        _done = True
+        return "current"
+    with bootstrap_lock(engine):
+        # un autre process a pu faire le travail pendant qu'on attendait le verrou
+        if SCHEMA_BOOTSTRAP == "auto" and await applied_fingerprint() == fingerprint:
+            _done = True
+            return "current"
+        models.Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        reporting_ok = True
+        try:
+            await ensure_matviews()
+            await ensure_quote_aggregates()
+        except Exception:
+            # on ignore les erreurs de matérialisation en dev/test (marqueur non écrit : nouvel essai au prochain démarrage)
+            reporting_ok = False
+            logger.exception("reporting bootstrap failed")
+        if reporting_ok:
+            await database.execute(MARKER_TABLE_SQL)
+            await database.execute(text(MARKER_UPSERT_SQL).bindparams(fingerprint=fingerprint))
+    _done = True
+    return "applied"
+
+
+def run_bootstrap() -> str:
+    """Hors boucle asyncio (master gunicorn, scripts) : connecte `database` le temps du bootstrap."""
+    async def _run():
+        await database.connect()
+        try:
+            return await bootstrap()
+        finally:
+            await database.disconnect()
+
+    return asyncio.run(_run())
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import csv
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from app.db import NO_STATEMENT_TIMEOUT, database
+from app.numbering import reserve_numbers
+
+# Imports en masse (onboarding) : le CSV est envoyé tel quel par COPY dans une table
+# temporaire, puis fusionné par quelques instructions ensemblistes. Coût ~ O(lignes) côté
+# Postgres, sans aller-retour par ligne.
+
+CLIENT_COLUMNS = ("name", "email", "phone")
+QUOTE_COLUMNS = ("client_id", "client_name", "title", "amount_cents", "status", "created_at")
+MAX_REPORTED_ERRORS = 100
+
+
+async def _split_header(chunks: AsyncIterator[bytes]) -> Tuple[List[str], AsyncIterator[bytes]]:
+    """Lit la ligne d'en-tête puis rend le reste du flux, inchangé, pour COPY."""
+    it = chunks.__aiter__()
+    buf = b""
+    while b"\n" not in buf:
+        try:
+            buf += await it.__anext__()
+        except StopAsyncIteration:
+            break
+    line, _, rest = buf.partition(b"\n")
+    header = next(csv.reader([line.decode("utf-8-sig", errors="replace")]), [])
+
+    async def body():
+        if rest:
+            yield rest
+        async for chunk in it:
+            yield chunk
+
+    return [h.strip().lower() for h in header], body()
+
+
+async def _copy_to_stage(raw, stage: str, allowed: Sequence[str], chunks: AsyncIterator[bytes],
+                         extra: str = "") -> int:
+    header, body = await _split_header(chunks)
+    if not any(header):
+        raise ValueError("CSV header is missing")
+    unknown = [h for h in header if h not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}; expected {', '.join(allowed)}")
+    cols = ", ".join(f"{c} text" for c in allowed)
+    # ord : n° de ligne de données (1 = première ligne après l'en-tête), dans l'ordre du fichier
+    await raw.execute(f"CREATE TEMP TABLE {stage} (ord bigserial, {cols}{extra}) ON COMMIT DROP")
+    status = await raw.copy_to_table(stage, source=body, columns=header, format="csv")
+    return int(status.split()[-1])
+
+
+MERGE_CLIENTS_SQL = """
+WITH src AS (
+  SELECT DISTINCT ON (btrim(name))
+         btrim(name) AS name, NULLIF(btrim(email), '') AS email, NULLIF(btrim(phone), '') AS phone
+  FROM stage_clients
+  WHERE NULLIF(btrim(name), '') IS NOT NULL
+  ORDER BY btrim(name), ord
+), ins AS (
+  INSERT INTO clients (company_id, name, email, phone)
+  SELECT $1, name, email, phone FROM src
+  ON CONFLICT ON CONSTRAINT uq_client_company_name {action}
+  RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted) AS inserted,
+       count(*) FILTER (WHERE NOT inserted) AS updated,
+       (SELECT count(*) FROM stage_clients WHERE NULLIF(btrim(name), '') IS NULL) AS rejected
+FROM ins
+"""
+
+_CLIENT_CONFLICT = {
+    "skip": "DO NOTHING",
+    "update": "DO UPDATE SET email = COALESCE(EXCLUDED.email, clients.email), "
+              "phone = COALESCE(EXCLUDED.phone, clients.phone)",
+}
+
+
+async def import_clients(company_id: int, chunks: AsyncIterator[bytes], on_conflict: str = "skip") -> Dict:
+    """
+    CSV name,email,phone -> clients de la company. Doublons de nom (fichier ou base) résolus
+    par uq_client_company_name : ignorés ("skip") ou complétés ("update").
+    """
+    if on_conflict not in _CLIENT_CONFLICT:
+        raise ValueError("on_conflict must be 'skip' or 'update'")
+    try:
+        async with database.transaction():
+            raw = database.connection().raw_connection
+            await raw.execute(NO_STATEMENT_TIMEOUT)  # gros fichiers : COPY + fusion peuvent être longs
+            staged = await _copy_to_stage(raw, "stage_clients", CLIENT_COLUMNS, chunks)
+            row = await raw.fetchrow(MERGE_CLIENTS_SQL.format(action=_CLIENT_CONFLICT[on_conflict]), int(company_id))
+            rejected = await raw.fetch(
+                "SELECT ord FROM stage_clients WHERE NULLIF(btrim(name), '') IS NULL "
+                f"ORDER BY ord LIMIT {MAX_REPORTED_ERRORS}"
+            )
+    except asyncpg.DataError as e:
+        raise ValueError(f"Invalid CSV: {e}") from e
+    inserted, updated = int(row["inserted"]), int(row["updated"])
+    return {
+        "staged": staged,
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": staged - inserted - updated - int(row["rejected"]),
+        "rejected": int(row["rejected"]),
+        "errors": [{"row": int(r["ord"]), "error": "name is required"} for r in rejected],
+    }
+
+
+# clients référencés par nom et absents : créés en une instruction (option create_clients)
+CREATE_MISSING_CLIENTS_SQL = """
+INSERT INTO clients (company_id, name)
+SELECT DISTINCT $1::integer, btrim(client_name) FROM stage_quotes
+WHERE NULLIF(btrim(client_name), '') IS NOT NULL AND NULLIF(btrim(client_id), '') IS NULL
+ON CONFLICT ON CONSTRAINT uq_client_company_name DO NOTHING
+"""
+
+# why: deux jointures par égalité (id, puis nom) plutôt qu'un OR -> hash join sur tout le lot
+RESOLVE_BY_ID_SQL = r"""
+UPDATE stage_quotes s SET ref = c.id
+FROM clients c
+WHERE c.company_id = $1
+  AND c.id = CASE WHEN btrim(s.client_id) ~ '^\d{1,9}$' THEN btrim(s.client_id)::integer END
+"""
+
+RESOLVE_BY_NAME_SQL = """
+UPDATE stage_quotes s SET ref = c.id
+FROM clients c
+WHERE s.ref IS NULL AND NULLIF(btrim(s.client_id), '') IS NULL
+  AND c.company_id = $1 AND c.name = btrim(s.client_name)
+"""
+
+VALIDATE_QUOTES_SQL = r"""
+UPDATE stage_quotes SET error = CASE
+    WHEN ref IS NULL THEN 'Client not in your company'
+    WHEN NULLIF(btrim(title), '') IS NULL THEN 'title is required'
+    WHEN amount_cents IS NOT NULL AND btrim(amount_cents) !~ '^-?\d{1,18}$' THEN 'amount_cents must be an integer'
+    WHEN created_at IS NOT NULL AND btrim(created_at) !~ '^\d{4}-\d{2}-\d{2}([ T][0-9:.+\-Z]*)?$'
+         THEN 'created_at must be an ISO date'
+  END
+"""
+
+# why: la forme ne suffit pas (2024-02-30) ; sans ce contrôle, le CAST de l'INSERT échouait et
+# annulait tout le lot. Même conversion que l'INSERT (pg_input_is_valid n'existe qu'à partir de PG 16),
+# évaluée une fois par valeur distincte.
+TIMESTAMPTZ_CHECK_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION pg_temp.is_timestamptz(v text) RETURNS boolean LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM v::timestamptz;
+  RETURN true;
+EXCEPTION WHEN data_exception THEN
+  RETURN false;
+END $$
+"""
+
+VALIDATE_QUOTE_DATES_SQL = """
+UPDATE stage_quotes s SET error = 'created_at is not a valid date'
+FROM (
+  SELECT v FROM (SELECT DISTINCT btrim(created_at) AS v FROM stage_quotes
+                 WHERE error IS NULL AND created_at IS NOT NULL) d
+  WHERE NOT pg_temp.is_timestamptz(v)
+) bad
+WHERE s.error IS NULL AND btrim(s.created_at) = bad.v
+"""
+
+# année de numérotation : celle de created_at (UTC, comme app/numbering.py), sinon l'année courante
+QUOTE_YEARS_SQL = """
+UPDATE stage_quotes SET yr = COALESCE($1::integer, extract(year FROM COALESCE(
+    CAST(btrim(created_at) AS timestamptz), now()) AT TIME ZONE 'UTC')::integer)
+WHERE error IS NULL
+"""
+
+# numéros réservés en un bloc par année (reserve_numbers) puis distribués dans l'ordre du fichier
+INSERT_QUOTES_SQL = """
+WITH v AS (
+  SELECT s.*, row_number() OVER (PARTITION BY s.yr ORDER BY s.ord) AS rn
+  FROM stage_quotes s WHERE s.error IS NULL
+), ins AS (
+  INSERT INTO quotes (number, title, amount_cents, status, client_id, company_id, created_at)
+  SELECT n.number, btrim(v.title), COALESCE(btrim(v.amount_cents)::bigint, 0),
+         COALESCE(NULLIF(btrim(v.status), ''), 'draft'), v.ref, $1,
+         COALESCE(CAST(btrim(v.created_at) AS timestamptz), now())
+  FROM v JOIN unnest($2::integer[], $3::bigint[], $4::varchar[]) AS n(yr, rn, number)
+    ON n.yr = v.yr AND n.rn = v.rn
+  ORDER BY v.ord
+  RETURNING 1
+)
+SELECT count(*) FROM ins
+"""
+
+
+async def import_quotes(company_id: int, chunks: AsyncIterator[bytes], create_clients: bool = True,
+                        year: Optional[int] = None) -> Dict:
+    """
+    CSV client_id|client_name,title,amount_cents,status,created_at -> devis numérotés dans
+    l'année de leur created_at (`year` : impose une année à tout le fichier).
+    Les lignes invalides sont écartées et listées (MAX_REPORTED_ERRORS premières).
+    """
+    cid = int(company_id)
+    try:
+        async with database.transaction():
+            raw = database.connection().raw_connection
+            await raw.execute(NO_STATEMENT_TIMEOUT)
+            staged = await _copy_to_stage(raw, "stage_quotes", QUOTE_COLUMNS, chunks,
+                                          extra=", ref integer, error text, yr integer")
+            created = 0
+            if create_clients:
+                status = await raw.execute(CREATE_MISSING_CLIENTS_SQL, cid)
+                created = int(status.split()[-1])
+            await raw.execute(RESOLVE_BY_ID_SQL, cid)
+            await raw.execute(RESOLVE_BY_NAME_SQL, cid)
+            await raw.execute(VALIDATE_QUOTES_SQL)
+            await raw.execute(TIMESTAMPTZ_CHECK_FUNCTION_SQL)
+            await raw.execute(VALIDATE_QUOTE_DATES_SQL)
+            await raw.execute(QUOTE_YEARS_SQL, year)
+            years, ranks, numbers = [], [], []
+            # années croissantes : deux imports concurrents verrouillent les compteurs dans le même ordre
+            for r in await raw.fetch(
+                "SELECT yr, count(*) AS n FROM stage_quotes WHERE error IS NULL GROUP BY yr ORDER BY yr"
+            ):
+                block = await reserve_numbers("quote", cid, int(r["n"]), int(r["yr"]))
+                years += [int(r["yr"])] * len(block)
+                ranks += range(1, len(block) + 1)
+                numbers += block
+            inserted = int(await raw.fetchval(INSERT_QUOTES_SQL, cid, years, ranks, numbers)) if numbers else 0
+            rejected = await raw.fetch(
+                f"SELECT ord, error FROM stage_quotes WHERE error IS NOT NULL ORDER BY ord LIMIT {MAX_REPORTED_ERRORS}"
+            )
+    except asyncpg.DataError as e:
+        raise ValueError(f"Invalid CSV: {e}") from e
+    return {
+        "staged": staged,
+        "inserted": inserted,
+        "clients_created": created,
+        "rejected": staged - inserted,
+        "errors": [{"row": int(r["ord"]), "error": r["error"]} for r in rejected],
+    }
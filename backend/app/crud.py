@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Sequence, Union
+
+from sqlalchemy import Table, and_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.db import database
+
+# Écritures en un seul aller-retour : RETURNING renvoie la ligne écrite (plus de relecture),
+# et le contrôle de tenant (company_id) fait partie du WHERE de l'UPDATE/DELETE.
+
+
+async def insert_returning(
+    table: Table,
+    values: Dict[str, Any],
+    on_conflict: Optional[Union[str, Sequence[str]]] = None,
+):
+    """
+    INSERT ... RETURNING *. Avec `on_conflict` (nom de contrainte, ou liste de colonnes d'un
+    index unique) : ON CONFLICT DO NOTHING -> renvoie None si la ligne existait déjà.
+    """
+    stmt = pg_insert(table).values(**values)
+    if isinstance(on_conflict, str):
+        stmt = stmt.on_conflict_do_nothing(constraint=on_conflict)
+    elif on_conflict:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(on_conflict))
+    return await database.fetch_one(stmt.returning(*table.c))
+
+
+async def update_returning(table: Table, row_id: int, company_id: int, values: Dict[str, Any], *conditions):
+    """
+    UPDATE ... WHERE id AND company_id RETURNING * ; None si absente ou d'une autre company.
+    `conditions` : prédicats supplémentaires du même WHERE (ex. EXISTS sur une ligne liée).
+    """
+    owned = and_(table.c.id == row_id, table.c.company_id == company_id, *conditions)
+    if not values:
+        return await database.fetch_one(select(table).where(owned))
+    return await database.fetch_one(table.update().where(owned).values(**values).returning(*table.c))
+
+
+async def delete_owned(table: Table, row_id: int, company_id: int) -> bool:
+    """DELETE ... WHERE id AND company_id RETURNING id ; False si rien n'a été supprimé."""
+    owned = and_(table.c.id == row_id, table.c.company_id == company_id)
+    row = await database.fetch_one(table.delete().where(owned).returning(table.c.id))
+    return row is not None
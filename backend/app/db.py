@@ -1,11 +1,171 @@
+import asyncio
 import os
+import time
+
 from databases import Database
+from databases.backends.postgres import PostgresBackend, PostgresConnection
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 
 load_dotenv()
+from app.metrics import (COLLECTORS, DB_POOL_ACQUIRE_SECONDS, DB_POOL_ACQUIRE_TIMEOUTS,
+                         DB_POOL_SIZE, record_query)
+
 DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://postgres:postgres@db:5432/postgres')
-database = Database(DATABASE_URL)
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# réplique en lecture optionnelle (cf. app/read_routing.py) ; vide = tout sur le primaire
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+
+# Pool asyncpg (par process : WEB_CONCURRENCY x DB_POOL_MAX_SIZE doit rester sous max_connections)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+# connexions inactives fermées après N s (0 = jamais) : le pool redescend vers min_size
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+# requêtes préparées mises en cache par connexion ; 0 derrière PgBouncer en mode transaction
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+# côté serveur, par connexion (0 = illimité) ; les traitements longs le lèvent via NO_STATEMENT_TIMEOUT
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "captech-api")
+
+# à exécuter dans une transaction (REFRESH des matviews, imports CSV)
+NO_STATEMENT_TIMEOUT = "SET LOCAL statement_timeout = 0"
+
+
+class PoolTimeoutError(Exception):
+    """Aucune connexion libérée dans DB_POOL_ACQUIRE_TIMEOUT : pool saturé (-> 503)."""
+
+
+class _PoolConnection(PostgresConnection):
+    async def acquire(self) -> None:
+        # why: databases appelle pool.acquire() sans délai -> une requête attendait indéfiniment un pool saturé
+        assert self._connection is None, "Connection is already acquired"
+        assert self._database._pool is not None, "DatabaseBackend is not running"
+        started = time.perf_counter()
+        try:
+            self._connection = await self._database._pool.acquire(timeout=self._database.acquire_timeout)
+        except asyncio.TimeoutError as e:
+            DB_POOL_ACQUIRE_TIMEOUTS.inc(self._database.name)
+            raise PoolTimeoutError(f"no DB connection available after {self._database.acquire_timeout}s") from e
+        finally:
+            DB_POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - started, self._database.name)
+
+
+class PoolBackend(PostgresBackend):
+    """Backend asyncpg de databases + délai d'acquisition et état du pool."""
+
+    def __init__(self, database_url, acquire_timeout=None, name="primary", **options):
+        super().__init__(database_url, **options)
+        self.acquire_timeout = acquire_timeout
+        self.name = name
+
+    def connection(self) -> PostgresConnection:
+        return _PoolConnection(self, self._dialect)
+
+    def pool_stats(self) -> dict:
+        pool = self._pool
+        if pool is None:
+            return {"size": 0, "idle": 0, "in_use": 0, "min": 0, "max": 0}
+        size, idle = pool.get_size(), pool.get_idle_size()
+        return {"size": size, "idle": idle, "in_use": size - idle,
+                "min": pool.get_min_size(), "max": pool.get_max_size()}
+
+
+class InstrumentedDatabase(Database):
+    """Database qui chronomètre chaque requête (métriques + suivi par requête HTTP, cf. app.metrics)."""
+
+    SUPPORTED_BACKENDS = {
+        **Database.SUPPORTED_BACKENDS,
+        "postgresql": "app.db:PoolBackend",
+        "postgres": "app.db:PoolBackend",
+    }
+
+    async def fetch_all(self, query, values=None):
+        started = time.perf_counter()
+        try:
+            return await super().fetch_all(query, values)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    async def fetch_one(self, query, values=None):
+        started = time.perf_counter()
+        try:
+            return await super().fetch_one(query, values)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    async def fetch_val(self, query, values=None, column=0):
+        started = time.perf_counter()
+        try:
+            return await super().fetch_val(query, values, column=column)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    async def execute(self, query, values=None):
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, values)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    async def execute_many(self, query, values):
+        started = time.perf_counter()
+        try:
+            return await super().execute_many(query, values)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    async def iterate(self, query, values=None):
+        # why: on ne compte que l'attente des lignes, pas le temps passé par l'appelant entre deux lignes
+        rows = super().iterate(query, values)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    record = await rows.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield record
+        finally:
+            await rows.aclose()
+            record_query(query, elapsed)
+
+
+    def pool_stats(self) -> dict:
+        return self._backend.pool_stats()
+
+    def collect_pool_metrics(self) -> None:
+        stats = self.pool_stats()
+        for state in ("idle", "in_use", "max"):
+            DB_POOL_SIZE.set(self._backend.name, state, value=stats[state])
+
+
+def pool_options(name: str = "primary") -> dict:
+    """Options du backend : asyncpg.create_pool (transmises telles quelles par databases) + nom du pool."""
+    return dict(
+        name=name,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+        max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        server_settings={
+            "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS),
+            "application_name": DB_APPLICATION_NAME if name == "primary" else f"{DB_APPLICATION_NAME}-{name}",
+        },
+    )
+
+
+database = InstrumentedDatabase(DATABASE_URL, **pool_options())
+COLLECTORS.append(database.collect_pool_metrics)
+read_database = InstrumentedDatabase(DATABASE_READ_URL, **pool_options("replica")) if DATABASE_READ_URL else None
+if read_database is not None:
+    COLLECTORS.append(read_database.collect_pool_metrics)
+# why: moteur synchrone réservé à create_all / migrations au démarrage -> NullPool, pour ne pas
+# garder une connexion ouverte par worker en plus du pool asyncpg
+engine = create_engine(DATABASE_URL, poolclass=NullPool)
 Base = declarative_base()
\ No newline at end of file
@@ -1,20 +1,109 @@
+import hashlib
 import os
-from fastapi import Depends, HTTPException
+import time
+from typing import Optional
+
+from databases import Database
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import jwt, JWTError
+from sqlalchemy import select
+
+from app.auth_utils import SECRET, ALGO, jwt
+from app.db import database
+from app import models
+from app.read_routing import read_router
+from app.ttl_cache import TTLCache
 
-SECRET_KEY = os.getenv("SECRET_KEY", "dev_change_me")
-ALGO = "HS256"
 _bearer = HTTPBearer()
 
-async def get_current_user(creds: HTTPAuthorizationCredentials = Depends(_bearer)):
-    token = creds.credentials
+# why: même JWT rejoué à chaque requête du front -> on ne le vérifie qu'une fois par TTL
+_token_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60")),
+)
+
+# Vérification optionnelle que l'utilisateur existe toujours (comptes supprimés) ; coûte une
+# requête par email et par USER_CACHE_TTL, jamais par requête.
+AUTH_CHECK_USER = os.getenv("AUTH_CHECK_USER", "0") == "1"
+_user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+)
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def decode_access_token(token: str) -> dict:
+    """JWT -> {"email", "company_id"} sans accès DB (401 si invalide/expiré)."""
+    key = _token_key(token)
+    user = _token_cache.get(key)
+    if user is not None:
+        return dict(user)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGO])
-        email = payload.get("sub")
-        company_id = payload.get("company_id")
-        if not email or company_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-        return {"email": email, "company_id": int(company_id)}
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        payload = jwt.decode(token, SECRET, algorithms=[ALGO])
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    email = payload.get("sub")
+    company_id = payload.get("company_id")
+    if not email or company_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+    user = {"email": email, "company_id": int(company_id)}
+    # why: une entrée ne doit jamais survivre à l'expiration du token lui-même
+    exp = payload.get("exp")
+    ttl = (float(exp) - time.time()) if exp is not None else None
+    _token_cache.set(key, user, ttl=ttl)
+    return dict(user)
+
+async def load_user(email: str) -> Optional[dict]:
+    """Lookup users par email, mis en cache (les absents ne sont pas mis en cache)."""
+    rec = _user_cache.get(email)
+    if rec is not None:
+        return rec
+    utbl = models.User.__table__
+    row = await database.fetch_one(
+        select(utbl.c.id, utbl.c.email, utbl.c.company_id).where(utbl.c.email == email)
+    )
+    if not row:
+        return None
+    rec = {"id": int(row["id"]), "email": row["email"], "company_id": int(row["company_id"])}
+    _user_cache.set(email, rec)
+    return rec
+
+def invalidate_user(email: Optional[str] = None) -> None:
+    """A appeler après création/suppression/changement de company d'un utilisateur."""
+    if email is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(email)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+def read_only(endpoint):
+    """Route POST/PUT... qui n'écrit rien (ex. export.zip) : pas de marqueur read-your-writes."""
+    endpoint.read_only = True
+    return endpoint
+
+async def mark_write(user: dict) -> None:
+    """
+    Fin d'une écriture longue (imports) : relance la fenêtre read-your-writes, sinon partie
+    au début de la requête. A appeler dans le handler, avant de répondre.
+    """
+    await read_router.note_write(user["company_id"])
+
+async def get_current_user(request: Request, creds: HTTPAuthorizationCredentials = Depends(_bearer)):
+    user = decode_access_token(creds.credentials)
+    if AUTH_CHECK_USER:
+        rec = await load_user(user["email"])
+        if not rec or rec["company_id"] != user["company_id"]:
+            raise HTTPException(status_code=401, detail="Unknown user")
+        user["id"] = rec["id"]
+    if (read_router.enabled and request.method not in SAFE_METHODS
+            and not getattr(request.scope.get("endpoint"), "read_only", False)):
+        # why: marqueur posé avant le handler -> commité avant la réponse ; le code de sortie d'une
+        # dépendance yield ne tourne qu'après l'envoi, trop tard pour la lecture suivante du client
+        await read_router.note_write(user["company_id"])
+    return user
+
+async def read_db(user=Depends(get_current_user)) -> Database:
+    """Base des lectures lourdes (listes, rapports, PDF, exports) : réplique si à jour, sinon primaire."""
+    return await read_router.for_read(user["company_id"])
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# GET conditionnels : ETag faible + Last-Modified ; le client revalide à chaque fois
+# (no-cache) mais ne retélécharge le corps que s'il a changé.
+CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts: Any) -> str:
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return 'W/"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparaison faible (RFC 9110 §13.1.2) : W/"x" == "x"."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = _opaque(etag)
+    return any(_opaque(t) == target for t in if_none_match.split(","))
+
+
+def _http_date(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """Réponse 304 si la version du client est à jour, sinon None."""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        fresh = etag_matches(inm, etag)
+    else:
+        # If-Modified-Since n'est consulté qu'en l'absence d'If-None-Match (précision : la seconde)
+        fresh = False
+        ims = request.headers.get("if-modified-since")
+        if ims and last_modified is not None:
+            try:
+                since = parsedate_to_datetime(ims)
+            except (TypeError, ValueError):
+                since = None
+            if since is not None:
+                lm = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+                fresh = int(lm.timestamp()) <= int(since.timestamp())
+    if not fresh:
+        return None
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
+
+
+def conditional_json(request: Request, payload: Any, last_modified: Optional[datetime] = None) -> Response:
+    """JSON avec ETag calculé sur le contenu (toute colonne modifiée change l'ETag), ou 304."""
+    data = jsonable_encoder(payload)
+    etag = weak_etag(data)
+    return not_modified(request, etag, last_modified) or JSONResponse(
+        data, headers=cache_headers(etag, last_modified)
+    )
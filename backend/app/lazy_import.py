@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import importlib
+from types import ModuleType
+from typing import Any
+
+
+class LazyModule:
+    """
+    Module importé au premier accès à l'un de ses attributs : `jwt = LazyModule("jose.jwt")`.
+    Pour les dépendances lourdes hors du chemin de démarrage (jose -> cryptography, passlib...).
+    Les attributs posés sur l'objet (monkeypatch dans les tests) masquent ceux du module.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        module = self.__dict__.get("_module")
+        if module is None:
+            module = self._module = importlib.import_module(self.__dict__["_name"])
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__.get("_module") is not None else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
@@ -1,12 +1,26 @@
-from contextlib import asynccontextmanager
+import time
 
-from fastapi import FastAPI
+_import_started = time.perf_counter()
+
+import logging
+import os
+import secrets
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from app.db import database, engine
-from app import models
+from app.db import PoolTimeoutError, database
+from app.bootstrap import bootstrap
+from app.auth_utils import HashingBusy, password_hashing_stats
+from app.metrics import STARTUP_SECONDS, MetricsMiddleware, render_metrics
+from app.pdf_cache import pdf_cache
+from app.pdf_render import pdf_renderer
+from app.read_routing import read_router
+from app.report_cache import report_cache
 
-from app.routers import auth, clients, quotes, invoices, payments
+from app.routers import auth, clients, quotes, invoices, payments, exports, search
 
 # Modules optionnels
 try:
@@ -16,25 +30,54 @@ except Exception:
     HAS_REPORTS = False
 
 try:
-    from app.reporting import ensure_matviews
+    from app.reporting import report_refresher
     HAS_MV = True
 except Exception:
     HAS_MV = False
 
+logger = logging.getLogger("app.startup")
+
+# Durées de démarrage par phase (secondes), exposées dans /healthz et /metrics (app_startup_seconds)
+startup: dict = {"seconds": {}, "bootstrap": None}
+
+
+def _record_phase(phase: str, seconds: float) -> None:
+    startup["seconds"][phase] = round(seconds, 3)
+    STARTUP_SECONDS.set(phase, value=seconds)
+
+
+@contextmanager
+def _phase(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_phase(phase, time.perf_counter() - started)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    models.Base.metadata.create_all(bind=engine)
-    await database.connect()
+    started = time.perf_counter()
+    with _phase("db_connect"):
+        await database.connect()
+        await read_router.connect()
+    with _phase("bootstrap"):
+        # déjà fait par le master sous gunicorn (preload) ; sinon sous verrou consultatif
+        startup["bootstrap"] = await bootstrap()
+    with _phase("pdf_renderer"):
+        await pdf_renderer.start()
     if HAS_MV:
-        try:
-            await ensure_matviews()
-        except Exception:
-            # on ignore les erreurs de matérialisation en dev/test
-            pass
+        await report_refresher.start()
+    _record_phase("lifespan", time.perf_counter() - started)
+    logger.info("startup: %s (bootstrap %s)",
+                ", ".join(f"{k} {v:.2f}s" for k, v in startup["seconds"].items()), startup["bootstrap"])
     yield
     # Shutdown
+    if HAS_MV:
+        await report_refresher.stop()
+    await pdf_renderer.stop()
+    await read_router.disconnect()
     await database.disconnect()
 
 
@@ -49,15 +92,52 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# ajouté en dernier = le plus externe : mesure aussi le temps passé dans CORS
+app.add_middleware(MetricsMiddleware)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # pool saturé : on renvoie vite un 503 plutôt que d'empiler les requêtes en attente
+    return JSONResponse(status_code=503, content={"detail": "Database busy, retry later"},
+                        headers={"Retry-After": "1"})
+
+
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request: Request, exc: HashingBusy):
+    # file bcrypt pleine (rafale de login / register) : 503 immédiat, le reste de l'API n'attend pas
+    return JSONResponse(status_code=503, content={"detail": "Authentication busy, retry later"},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 
 @app.get("/healthz")
 async def healthz():
     try:
         row = await database.fetch_one("SELECT 1 as ok;")
-        return {"api": True, "db": bool(row and row["ok"] == 1)}
+        db_ok = bool(row and row["ok"] == 1)
     except Exception:
-        return {"api": True, "db": False}
+        db_ok = False
+    return {
+        "api": True,
+        "db": db_ok,
+        "db_pool": database.pool_stats(),
+        "db_replica": await read_router.stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "pdf_renderer": pdf_renderer.stats(),
+        "password_hashing": password_hashing_stats(),
+        "report_cache": report_cache.stats(),
+        "startup": startup,
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: str | None = Header(None)):
+    """Format texte Prometheus ; protégé par METRICS_TOKEN (Bearer) s'il est défini."""
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 # Routes
@@ -69,5 +149,10 @@ app.include_router(invoices.router)
 if hasattr(invoices, "public_router"):
     app.include_router(invoices.public_router)
 app.include_router(payments.router)
+app.include_router(exports.router)
+app.include_router(search.router)
 if HAS_REPORTS:
     app.include_router(reports.router)
+
+# why: mesuré ici (après l'enregistrement des routes) : sous gunicorn --preload, payé une fois par le master
+_record_phase("import", time.perf_counter() - _import_started)
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import abc
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Métriques au format texte Prometheus, sans dépendance (prometheus_client n'est pas requis).
+# NB: importé par app.db et app.pdf_render -> ne rien importer de l'application ici.
+
+logger = logging.getLogger("app.slow_requests")
+query_logger = logging.getLogger("app.queries")
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_MAX_SQL = int(os.getenv("SLOW_REQUEST_MAX_SQL", "20"))
+# dev : en-têtes X-DB-Queries / Server-Timing + alerte quand une même requête SQL revient N fois (N+1)
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "").lower() in ("1", "true", "yes")
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "3"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # why: bcrypt / PDF observent depuis des threads
+        REGISTRY.append(self)
+
+    def _key(self, labels: Sequence[Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(v) for v in labels)
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Lignes d'échantillons au format texte Prometheus."""
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: Any, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: Any, value: float) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # par jeu de labels : [compteurs par bucket (non cumulés), somme, total]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        key = self._key(labels)
+        idx = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels: Any) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, ([*s[0]], s[1], s[2])) for k, s in self._values.items())
+        out = []
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = f'le="{_num(bound)}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return out
+
+
+REGISTRY: List[_Metric] = []
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+REQUEST_DB_QUERIES = Histogram("http_request_db_queries", "DB queries issued per HTTP request.",
+                               ("method", "route"), buckets=COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "DB time spent per HTTP request.", ("method", "route"))
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Duration of individual DB queries.")
+PDF_RENDER_SECONDS = Histogram("pdf_render_seconds", "PDF render duration (excluding queueing).", ("outcome",))
+PASSWORD_HASH_SECONDS = Histogram("password_hash_seconds", "bcrypt hash/verify duration.")
+PASSWORD_HASH_WAIT_SECONDS = Histogram("password_hash_wait_seconds", "Time spent waiting for a bcrypt worker.")
+SLOW_REQUESTS = Counter("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS.", ("method", "route"))
+DB_POOL_SIZE = Gauge("db_pool_connections", "DB pool connections by state (idle, in_use, max).", ("pool", "state"))
+DB_POOL_ACQUIRE_SECONDS = Histogram("db_pool_acquire_seconds", "Time spent waiting for a DB pool connection.", ("pool",))
+DB_POOL_ACQUIRE_TIMEOUTS = Counter("db_pool_acquire_timeouts_total", "DB pool acquisitions that timed out.", ("pool",))
+DB_READ_ROUTING = Counter("db_read_routing_total", "Read-only requests by target database and reason.",
+                          ("target", "reason"))
+STARTUP_SECONDS = Gauge("app_startup_seconds", "Process startup time by phase (import, db_connect, bootstrap...).",
+                        ("phase",))
+DB_REPLICA_LAG_SECONDS = Gauge("db_replica_lag_seconds", "Replication lag of the read replica (last check).")
+
+# Fonctions appelées juste avant chaque rendu (jauges échantillonnées, ex. état du pool)
+COLLECTORS: List[Callable[[], None]] = []
+
+
+def render_metrics() -> str:
+    for collect in COLLECTORS:
+        collect()
+    return "".join(m.render() for m in REGISTRY)
+
+
+# --- Enregistrement des requêtes SQL (par requête HTTP, ou dans un bloc record_queries) ---
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "statements", "limit")
+
+    def __init__(self, limit: Optional[int] = SLOW_REQUEST_MAX_SQL):
+        self.queries = 0
+        self.db_seconds = 0.0
+        # (requête brute, durée) ; compilée en SQL seulement si on l'affiche
+        self.statements: List[Tuple[Any, float]] = []
+        self.limit = limit  # None : tout garder (tests, QUERY_DEBUG)
+
+    def add(self, query: Any, seconds: float) -> None:
+        self.queries += 1
+        self.db_seconds += seconds
+        if self.limit is None or len(self.statements) < self.limit:
+            self.statements.append((query, seconds))
+
+    @property
+    def sql(self) -> List[str]:
+        return [_sql_text(q) for q, _ in self.statements]
+
+    def repeated(self, threshold: int = 2) -> Dict[str, int]:
+        """Requêtes identiques (au texte près, paramètres exclus) exécutées au moins `threshold` fois."""
+        return {sql: n for sql, n in _Tally(self.sql).items() if n >= threshold}
+
+    def report(self) -> str:
+        return "\n".join(f"  {s * 1000:8.1f} ms  {_sql_text(q)}" for q, s in self.statements)
+
+
+# Pile des enregistreurs actifs : un bloc record_queries() englobant voit aussi les requêtes
+# enregistrées par le middleware pour chaque requête HTTP faite à l'intérieur.
+_recorders: contextvars.ContextVar[Tuple[RequestStats, ...]] = contextvars.ContextVar("query_recorders", default=())
+
+
+def _push(stats: RequestStats):
+    return _recorders.set(_recorders.get() + (stats,))
+
+
+def record_query(query: Any, seconds: float) -> None:
+    DB_QUERY_SECONDS.observe(seconds)
+    for stats in _recorders.get():
+        stats.add(query, seconds)
+
+
+@contextmanager
+def record_queries(max_queries: Optional[int] = None) -> Iterator[RequestStats]:
+    """
+    Enregistre toutes les requêtes SQL du bloc (tests, profilage) :
+
+        with record_queries(max_queries=2) as q:
+            await client.get("/clients/1")
+        assert not q.repeated()
+
+    AssertionError en sortie de bloc si `max_queries` est dépassé (avec la liste des requêtes).
+    """
+    stats = RequestStats(limit=None)
+    token = _push(stats)
+    try:
+        yield stats
+    finally:
+        _recorders.reset(token)
+    if max_queries is not None and stats.queries > max_queries:
+        raise AssertionError(f"{stats.queries} queries executed, expected at most {max_queries}:\n{stats.report()}")
+
+
+def _sql_text(query: Any) -> str:
+    try:
+        sql = str(query)
+    except Exception:
+        sql = repr(query)
+    return " ".join(sql.split())[:500]
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI : latence / statut par route (gabarit de chemin, pas l'URL -> cardinalité bornée),
+    requêtes en cours, nombre et durée des requêtes SQL par requête HTTP, journal des requêtes lentes.
+    """
+
+    def __init__(self, app, slow_ms: Optional[float] = None, debug: Optional[bool] = None):
+        self.app = app
+        self.slow_ms = SLOW_REQUEST_MS if slow_ms is None else float(slow_ms)
+        self.debug = QUERY_DEBUG if debug is None else bool(debug)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        stats = RequestStats(limit=None if self.debug else SLOW_REQUEST_MAX_SQL)
+        token = _push(stats)
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.debug:
+                    # requêtes faites avant l'envoi des en-têtes (hors corps streamé)
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-db-queries", str(stats.queries).encode()),
+                        (b"server-timing", f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'.encode()),
+                    ]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _recorders.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(method, path, status)
+            HTTP_LATENCY.observe(elapsed, method, path)
+            REQUEST_DB_QUERIES.observe(stats.queries, method, path)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, method, path)
+            if self.slow_ms >= 0 and elapsed * 1000 >= self.slow_ms:
+                SLOW_REQUESTS.inc(method, path)
+                self._log_slow(method, scope.get("path", ""), path, status, elapsed, stats)
+            if self.debug:
+                for sql, n in stats.repeated(QUERY_REPEAT_THRESHOLD).items():
+                    query_logger.warning("possible N+1 on %s %s: %d x %s", method, path, n, sql)
+
+    @staticmethod
+    def _log_slow(method, url_path, route, status, elapsed, stats: RequestStats) -> None:
+        lines = [
+            f"slow request {method} {url_path} (route {route}) -> {status} in {elapsed * 1000:.0f} ms; "
+            f"{stats.queries} queries, {stats.db_seconds * 1000:.0f} ms in DB"
+        ]
+        for query, seconds in sorted(stats.statements, key=lambda s: -s[1])[:SLOW_REQUEST_MAX_SQL]:
+            lines.append(f"  {seconds * 1000:8.1f} ms  {_sql_text(query)}")
+        if stats.queries > min(len(stats.statements), SLOW_REQUEST_MAX_SQL):
+            lines.append(f"  ... {stats.queries - min(len(stats.statements), SLOW_REQUEST_MAX_SQL)} more queries not shown")
+        logger.warning("\n".join(lines))
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from app import models
+from app.search import SEARCH_INDEX_SQL
+
+# Correctifs de schéma idempotents pour les bases créées avant le changement (create_all
+# n'altère jamais une table existante). Chaque entrée = une instruction.
+UPGRADE_SQL = [
+    # numéros uniques par company et non plus globalement (cf. app/numbering.py)
+    """
+    DO $$
+    BEGIN
+      IF EXISTS (SELECT 1 FROM pg_indexes WHERE schemaname = 'public'
+                 AND indexname = 'ix_quotes_number' AND indexdef LIKE 'CREATE UNIQUE%') THEN
+        DROP INDEX public.ix_quotes_number;
+      END IF;
+      IF EXISTS (SELECT 1 FROM pg_indexes WHERE schemaname = 'public'
+                 AND indexname = 'ix_invoices_number' AND indexdef LIKE 'CREATE UNIQUE%') THEN
+        DROP INDEX public.ix_invoices_number;
+      END IF;
+    END $$;
+    """,
+    # paid_cents dénormalisé : ajouté puis rempli une seule fois à partir des paiements existants
+    """
+    DO $$
+    BEGIN
+      IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public'
+                     AND table_name = 'invoices' AND column_name = 'paid_cents') THEN
+        ALTER TABLE public.invoices ADD COLUMN paid_cents bigint NOT NULL DEFAULT 0;
+        UPDATE public.invoices i SET paid_cents = p.total
+          FROM (SELECT invoice_id, SUM(amount_cents) AS total FROM public.payments GROUP BY invoice_id) p
+         WHERE p.invoice_id = i.id;
+      END IF;
+    END $$;
+    """,
+    """
+    ALTER TABLE public.invoices
+      ADD COLUMN IF NOT EXISTS balance_cents bigint GENERATED ALWAYS AS (total_cents - paid_cents) STORED
+    """,
+]
+
+# why: les compteurs ne doivent jamais repartir sous un numéro déjà attribué (ancienne
+# numérotation par count(*)) -> GREATEST avec le plus grand suffixe existant par année.
+SEED_COUNTERS_SQL = """
+INSERT INTO document_counters AS c (company_id, kind, year, value)
+SELECT company_id, :kind,
+       substring(number from '^[^-]+-([0-9]{{4}})-')::int,
+       max(substring(number from '([0-9]+)$')::bigint)
+FROM {table}
+WHERE number ~ '^[^-]+-[0-9]{{4}}-[0-9]{{1,18}}$'
+GROUP BY 1, 3
+ON CONFLICT (company_id, kind, year) DO UPDATE SET value = GREATEST(c.value, EXCLUDED.value)
+"""
+
+
+def ensure_indexes(bind) -> None:
+    """
+    create_all() ignore les tables déjà présentes, donc leurs nouveaux index aussi :
+    on crée ici ceux qui manquent (idempotent, checkfirst).
+    """
+    for table in models.Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            idx.create(bind=bind, checkfirst=True)
+
+
+def seed_document_counters(bind) -> None:
+    with bind.begin() as conn:
+        conn.execute(text(SEED_COUNTERS_SQL.format(table="quotes")), {"kind": "quote"})
+        conn.execute(text(SEED_COUNTERS_SQL.format(table="invoices")), {"kind": "invoice"})
+
+
+def run_migrations(bind) -> None:
+    with bind.begin() as conn:
+        for stmt in UPGRADE_SQL:
+            conn.execute(text(stmt))
+    ensure_indexes(bind)
+    with bind.begin() as conn:
+        for stmt in SEARCH_INDEX_SQL:
+            conn.execute(text(stmt))
+    seed_document_counters(bind)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, DateTime, UniqueConstraint, Date
+from sqlalchemy import Column, Integer, String, ForeignKey, BigInteger, DateTime, UniqueConstraint, Date, Index, Computed
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db import Base
@@ -26,12 +26,14 @@ class Client(Base):
     company = relationship("Company")
     __table_args__ = (
         UniqueConstraint("company_id", "name", name="uq_client_company_name"),
+        # pagination par curseur : ORDER BY name, id au sein d'une company
+        Index("ix_clients_company_name_id", "company_id", "name", "id"),
     )
 
 class Quote(Base):
     __tablename__ = "quotes"
     id = Column(Integer, primary_key=True, index=True)
-    number = Column(String, unique=True, index=True, nullable=False)
+    number = Column(String, index=True, nullable=False)
     title = Column(String, nullable=False)
     amount_cents = Column(BigInteger, nullable=False, default=0)
     status = Column(String, nullable=False, default="draft")
@@ -41,15 +43,23 @@ class Quote(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     client = relationship("Client")
     company = relationship("Company")
+    __table_args__ = (
+        Index("ix_quotes_company_id_id", "company_id", "id"),
+        # numérotation par company (cf. app/numbering.py) -> unicité par company
+        Index("uq_quotes_company_number", "company_id", "number", unique=True),
+    )
 
 class Invoice(Base):
     __tablename__ = "invoices"
     id = Column(Integer, primary_key=True, index=True)
-    number = Column(String, unique=True, index=True, nullable=False)     # ex: F-2025-0001
+    number = Column(String, index=True, nullable=False)                  # ex: F-2025-0001
     title = Column(String, nullable=False)
     status = Column(String, nullable=False, default="draft")             # draft/sent/paid/cancelled
     currency = Column(String, nullable=False, default="EUR")
     total_cents = Column(BigInteger, nullable=False, default=0)
+    # why: tenu à jour avec chaque INSERT de paiement (unitaire ou import) -> plus de SUM()
+    paid_cents = Column(BigInteger, nullable=False, server_default="0")
+    balance_cents = Column(BigInteger, Computed("total_cents - paid_cents", persisted=True))
     issued_date = Column(Date, nullable=True)
     due_date = Column(Date, nullable=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
@@ -58,6 +68,10 @@ class Invoice(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     client = relationship("Client")
     company = relationship("Company")
+    __table_args__ = (
+        Index("ix_invoices_company_id_id", "company_id", "id"),
+        Index("uq_invoices_company_number", "company_id", "number", unique=True),
+    )
 
 class InvoiceLine(Base):
     __tablename__ = "invoice_lines"
@@ -68,6 +82,28 @@ class InvoiceLine(Base):
     unit_price_cents = Column(BigInteger, nullable=False, default=0)
     total_cents = Column(BigInteger, nullable=False, default=0)
 
+class DocumentCounter(Base):
+    __tablename__ = "document_counters"
+    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
+    kind = Column(String, primary_key=True)          # quote / invoice
+    year = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class CompanyWrite(Base):
+    # dernière écriture par company, partagée entre workers (read-your-writes, cf. app/read_routing.py) ;
+    # UNLOGGED : pas de WAL, jamais répliquée, vidée après un crash -> sans conséquence
+    __tablename__ = "company_writes"
+    company_id = Column(Integer, primary_key=True, autoincrement=False)
+    written_at = Column(DateTime(timezone=True), nullable=False)
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+class ReportCacheGeneration(Base):
+    # compteurs d'invalidation du cache des rapports, partagés entre workers (cf. app/report_cache.py) ;
+    # table journalisée : un compteur qui repartirait de 0 rendrait d'anciennes entrées de nouveau valides
+    __tablename__ = "report_cache_generations"
+    key = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
 class Payment(Base):
     __tablename__ = "payments"
     id = Column(Integer, primary_key=True, index=True)
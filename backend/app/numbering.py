@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.db import database
+
+# Formats configurables ; champs disponibles : {year}, {seq}
+NUMBER_FORMATS = {
+    "quote": os.getenv("QUOTE_NUMBER_FORMAT", "Q-{year}-{seq:04d}"),
+    "invoice": os.getenv("INVOICE_NUMBER_FORMAT", "F-{year}-{seq:04d}"),
+}
+
+# why: upsert atomique sur une seule ligne (company, type, année) -> O(1), sans count(*),
+# sans trou ni doublon ; le verrou de ligne est tenu jusqu'au COMMIT de la transaction appelante.
+RESERVE_SQL = """
+INSERT INTO document_counters AS c (company_id, kind, year, value)
+VALUES (:cid, :kind, :year, :n)
+ON CONFLICT (company_id, kind, year) DO UPDATE SET value = c.value + EXCLUDED.value
+RETURNING value
+"""
+
+
+def format_number(kind: str, year: int, seq: int) -> str:
+    return NUMBER_FORMATS[kind].format(year=year, seq=seq)
+
+
+async def reserve_numbers(kind: str, company_id: int, n: int = 1, year: Optional[int] = None) -> List[str]:
+    """
+    Réserve `n` numéros consécutifs (imports en masse : un seul aller-retour).
+    A appeler dans la même transaction que l'INSERT : un rollback rend les numéros.
+    """
+    if kind not in NUMBER_FORMATS:
+        raise ValueError(f"unknown document kind: {kind}")
+    if n < 1:
+        return []
+    year = year or datetime.utcnow().year
+    last = await database.fetch_val(
+        text(RESERVE_SQL).bindparams(cid=int(company_id), kind=kind, year=int(year), n=int(n))
+    )
+    first = int(last) - n + 1
+    return [format_number(kind, year, seq) for seq in range(first, int(last) + 1)]
+
+
+async def next_number(kind: str, company_id: int, year: Optional[int] = None) -> str:
+    return (await reserve_numbers(kind, company_id, 1, year))[0]
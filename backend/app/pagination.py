@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Curseur opaque (base64url de la clé de tri du dernier élément renvoyé)."""
+    raw = json.dumps(list(values), default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# why: les clés de tri entières sont des colonnes Integer ; hors plage, asyncpg lèverait une erreur (500)
+_INT32 = range(-2**31, 2**31)
+
+
+def _valid(value: Any, expected: type) -> bool:
+    if expected is int:
+        return type(value) is int and value in _INT32  # bool exclu
+    return isinstance(value, expected)
+
+
+def decode_cursor(token: str, types: Sequence[type]) -> List[Any]:
+    """Curseur -> valeurs de la clé de tri, typées comme `types` (400 si curseur invalide ou forgé)."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (not isinstance(values, list) or len(values) != len(types)
+            or not all(_valid(v, t) for v, t in zip(values, types))):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_page(rows: list, limit: int, key_fields: Sequence[str]) -> dict:
+    """`rows` doit contenir limit+1 éléments au plus : le surplus indique une page suivante."""
+    items = rows[:limit]
+    next_cursor: Optional[str] = None
+    if len(rows) > limit and items:
+        last = items[-1]
+        next_cursor = encode_cursor([last[f] for f in key_fields])
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set
+
+# why: à incrémenter quand le gabarit PDF change -> tous les anciens rendus deviennent orphelins
+RENDER_VERSION = "1"
+
+
+def content_key(invoice: Dict[str, Any], lines: Iterable[Dict[str, Any]]) -> str:
+    """Empreinte SHA-256 de la facture + ses lignes (toute modification change la clé)."""
+    payload = {
+        "v": RENDER_VERSION,
+        "invoice": invoice,
+        "lines": sorted(lines, key=lambda l: l.get("id") or 0),
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """
+    Cache à deux niveaux pour les PDF rendus :
+    - mémoire : LRU bornée en nombre d'entrées et en octets ;
+    - disque : un fichier par clé, éviction des plus anciens (mtime) au-delà de `disk_bytes`.
+    Les clés étant adressées par contenu, une facture modifiée ne peut jamais
+    renvoyer un ancien rendu ; `invalidate()` libère seulement la place plus tôt.
+    Depuis la boucle asyncio, utiliser les variantes `*_async` : les accès disque (lecture,
+    écriture, balayage d'éviction) passent par un thread.
+    """
+
+    def __init__(
+        self,
+        memory_items: int = 128,
+        memory_bytes: int = 32 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.memory_items = max(0, int(memory_items))
+        self.memory_bytes = max(0, int(memory_bytes))
+        self.disk_dir = disk_dir or None
+        self.disk_bytes = max(0, int(disk_bytes))
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_size = 0
+        self._disk_size: Optional[int] = None  # calculé au premier accès disque
+        # index facture -> clés, pour invalidate() ; élagué quand une clé ne vit plus nulle part
+        self._by_invoice: Dict[int, Set[str]] = {}
+        self._invoice_of: Dict[str, int] = {}
+        self._disk_keys: Set[str] = set()  # clés écrites sur disque par ce process
+        self._sweep_lock = threading.Lock()
+        self._sweep_task: Optional[asyncio.Future] = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits_memory": 0,
+            "hits_disk": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions_memory": 0,
+            "evictions_disk": 0,
+            "invalidations": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "PdfCache":
+        default_dir = os.path.join(tempfile.gettempdir(), "captech-pdf-cache")
+        return cls(
+            memory_items=int(os.getenv("PDF_CACHE_MEMORY_ITEMS", "128")),
+            memory_bytes=int(float(os.getenv("PDF_CACHE_MEMORY_MB", "32")) * 1024 * 1024),
+            # PDF_CACHE_DIR="" désactive le niveau disque
+            disk_dir=os.getenv("PDF_CACHE_DIR", default_dir),
+            disk_bytes=int(float(os.getenv("PDF_CACHE_DISK_MB", "256")) * 1024 * 1024),
+        )
+
+    # --- API publique ---
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._mem_get(key)
+        if data is not None:
+            return data
+        return self._disk_loaded(key, self._disk_read(key))
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        data = self._mem_get(key)
+        if data is not None:
+            return data
+        if self.disk_dir:
+            data = await asyncio.to_thread(self._disk_read, key)
+        return self._disk_loaded(key, data)
+
+    def put(self, key: str, data: bytes, invoice_id: Optional[int] = None) -> None:
+        self._mem_store(key, data, invoice_id)
+        if self._disk_write(key, data):
+            self._evict_disk()
+
+    async def put_async(self, key: str, data: bytes, invoice_id: Optional[int] = None) -> None:
+        self._mem_store(key, data, invoice_id)
+        if not self.disk_dir:
+            return
+        if await asyncio.to_thread(self._disk_write, key, data):
+            # balayage (os.walk + stat) en tâche de fond : la requête n'attend pas
+            if self._sweep_task is None or self._sweep_task.done():
+                self._sweep_task = asyncio.ensure_future(asyncio.to_thread(self._evict_disk))
+
+    def invalidate(self, invoice_id: int) -> int:
+        """Supprime les rendus connus d'une facture (mémoire + disque). Retourne le nombre de clés."""
+        keys = self._mem_invalidate(invoice_id)
+        self._disk_remove_all(keys)
+        return len(keys)
+
+    async def invalidate_async(self, invoice_id: int) -> int:
+        keys = self._mem_invalidate(invoice_id)
+        if keys and self.disk_dir:
+            await asyncio.to_thread(self._disk_remove_all, keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            self._mem_size = 0
+            self._by_invoice.clear()
+            self._invoice_of.clear()
+            self._disk_keys.clear()
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for path, _size, _mtime in self._disk_entries():
+                self._unlink(path)
+            self._disk_size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._counters)
+            out["memory_entries"] = len(self._mem)
+            out["memory_bytes"] = self._mem_size
+            out["indexed_invoices"] = len(self._by_invoice)
+        out["disk_bytes"] = self._disk_size if self.disk_dir else 0
+        return out
+
+    # --- Niveau mémoire ---
+    def _mem_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self._counters["hits_memory"] += 1
+            return data
+
+    def _disk_loaded(self, key: str, data: Optional[bytes]) -> Optional[bytes]:
+        with self._lock:
+            if data is None:
+                self._counters["misses"] += 1
+                if key in self._disk_keys:  # fichier supprimé hors du cache
+                    self._disk_keys.discard(key)
+                    self._forget_if_gone(key)
+                return None
+            self._counters["hits_disk"] += 1
+            self._mem_put(key, data)
+        return data
+
+    def _mem_store(self, key: str, data: bytes, invoice_id: Optional[int]) -> None:
+        with self._lock:
+            self._counters["stores"] += 1
+            if invoice_id is not None:
+                self._by_invoice.setdefault(int(invoice_id), set()).add(key)
+                self._invoice_of[key] = int(invoice_id)
+            self._mem_put(key, data)
+
+    def _mem_invalidate(self, invoice_id: int) -> Set[str]:
+        with self._lock:
+            keys = self._by_invoice.pop(int(invoice_id), set())
+            for key in keys:
+                self._invoice_of.pop(key, None)
+                data = self._mem.pop(key, None)
+                if data is not None:
+                    self._mem_size -= len(data)
+            self._counters["invalidations"] += len(keys)
+        return keys
+
+    # appelés sous verrou
+    def _mem_put(self, key: str, data: bytes) -> None:
+        if self.memory_items == 0 or len(data) > self.memory_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_size -= len(old)
+        self._mem[key] = data
+        self._mem_size += len(data)
+        while len(self._mem) > self.memory_items or self._mem_size > self.memory_bytes:
+            evicted_key, evicted = self._mem.popitem(last=False)
+            self._mem_size -= len(evicted)
+            self._counters["evictions_memory"] += 1
+            self._forget_if_gone(evicted_key)
+
+    def _forget_if_gone(self, key: str) -> None:
+        """why: sans élagage, l'index garde une clé par version de facture jamais rendue."""
+        if key in self._mem or key in self._disk_keys:
+            return
+        invoice_id = self._invoice_of.pop(key, None)
+        if invoice_id is None:
+            return
+        keys = self._by_invoice.get(invoice_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_invoice[invoice_id]
+
+    # --- Niveau disque ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pdf")
+
+    def _disk_read(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            os.utime(path)  # why: l'éviction se base sur le mtime (LRU approximatif)
+            return data
+        except OSError:
+            return None
+
+    def _disk_write(self, key: str, data: bytes) -> bool:
+        """Écrit le rendu sur disque ; True si le niveau disque dépasse `disk_bytes` (éviction à faire)."""
+        if not self.disk_dir or self.disk_bytes == 0 or len(data) > self.disk_bytes:
+            with self._lock:
+                self._forget_if_gone(key)  # ni sur disque, et peut-être déjà sorti de la mémoire
+            return False
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            existed = os.path.exists(path)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)  # why: écriture atomique, jamais de PDF tronqué servi
+        except OSError:
+            with self._lock:
+                self._forget_if_gone(key)
+            return False
+        with self._lock:
+            self._disk_keys.add(key)
+            if self._disk_size is None:
+                self._disk_size = sum(size for _p, size, _m in self._disk_entries())
+            elif not existed:
+                self._disk_size += len(data)
+            return self._disk_size > self.disk_bytes
+
+    def _disk_remove(self, key: str) -> None:
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if self._unlink(path):
+            with self._lock:
+                if self._disk_size is not None:
+                    self._disk_size -= size
+                self._disk_keys.discard(key)
+
+    def _disk_remove_all(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._disk_remove(key)
+
+    def _disk_entries(self):
+        for root, _dirs, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _evict_disk(self) -> None:
+        # un seul balayage à la fois : les écritures concurrentes qui dépassent aussi le seuil passent
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            entries = sorted(self._disk_entries(), key=lambda e: e[2])
+            total = sum(size for _p, size, _m in entries)
+            # why: on descend à 90% pour ne pas rescanner le répertoire à chaque écriture
+            target = int(self.disk_bytes * 0.9)
+            removed = []
+            for path, size, _mtime in entries:
+                if total <= target:
+                    break
+                if self._unlink(path):
+                    total -= size
+                    removed.append(os.path.basename(path)[:-len(".pdf")])
+            with self._lock:
+                self._disk_size = total
+                self._counters["evictions_disk"] += len(removed)
+                for key in removed:
+                    self._disk_keys.discard(key)
+                    self._forget_if_gone(key)
+        finally:
+            self._sweep_lock.release()
+
+    @staticmethod
+    def _unlink(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+pdf_cache = PdfCache.from_env()
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from app.metrics import PDF_RENDER_SECONDS
+
+# NB: ce module est importé par les workers (spawn) -> ne rien importer de lourd ici (app.db, routers...).
+
+
+class RenderQueueFull(Exception):
+    """Trop de rendus en cours / en attente : le client doit réessayer plus tard."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("PDF render queue is full")
+        self.retry_after = retry_after
+
+
+class RenderTimeout(Exception):
+    """Le rendu a dépassé le délai configuré."""
+
+
+def _warm_worker() -> None:
+    # why: payer l'import WeasyPrint (≈ 1 s) une seule fois par worker, pas au premier PDF
+    try:
+        import weasyprint  # noqa: F401
+    except Exception:
+        # libs système absentes : l'erreur remontera proprement au premier rendu
+        pass
+
+
+def _noop() -> None:
+    return None
+
+
+def html_to_pdf(html: str) -> bytes:
+    from weasyprint import HTML
+    return HTML(string=html, base_url=".").write_pdf()
+
+
+class PdfRenderer:
+    """
+    Exécute les rendus PDF hors de la boucle asyncio.
+    backend = "process" (défaut, workers préchauffés), "thread" ou "inline" (debug).
+    `max_queue` borne le nombre de rendus en cours + en attente ; au-delà -> RenderQueueFull.
+    Les rendus en masse (`wait=True`) n'en occupent jamais plus de `bulk_slots` (défaut : `workers`,
+    et toujours moins que `max_queue`) : un gros export laisse de la place aux téléchargements unitaires.
+    warmup (backend process) : "background" (défaut, start() n'attend pas l'import WeasyPrint des
+    workers), "blocking" (start() attend qu'ils soient prêts) ou "off" (workers lancés au premier rendu).
+    """
+
+    def __init__(
+        self,
+        backend: str = "process",
+        workers: int = 2,
+        max_queue: int = 16,
+        timeout: float = 30.0,
+        retry_after: int = 5,
+        render_fn: Callable[[str], bytes] = html_to_pdf,
+        warmup: str = "background",
+        bulk_slots: Optional[int] = None,
+    ):
+        self.backend = backend
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.timeout = float(timeout)
+        self.retry_after = int(retry_after)
+        self.render_fn = render_fn
+        self.warmup = warmup
+        self.bulk_slots = max(1, min(int(bulk_slots or self.workers), self.max_queue - 1))
+        self._executor: Optional[Executor] = None
+        self._warming: Optional[asyncio.Future] = None
+        self._in_flight = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._bulk: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._counters: Dict[str, Any] = {
+            "rendered": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "render_seconds_total": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "PdfRenderer":
+        return cls(
+            backend=os.getenv("PDF_RENDER_BACKEND", "process"),
+            workers=int(os.getenv("PDF_RENDER_WORKERS", "2")),
+            max_queue=int(os.getenv("PDF_RENDER_MAX_QUEUE", "16")),
+            timeout=float(os.getenv("PDF_RENDER_TIMEOUT", "30")),
+            retry_after=int(os.getenv("PDF_RENDER_RETRY_AFTER", "5")),
+            warmup=os.getenv("PDF_RENDER_WARMUP", "background"),
+            bulk_slots=int(os.getenv("PDF_RENDER_BULK_SLOTS", "0")) or None,
+        )
+
+    # --- Cycle de vie ---
+    def _ensure_executor(self) -> Optional[Executor]:
+        if self._executor is None and self.backend != "inline":
+            if self.backend == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pdf")
+            else:
+                # why: "spawn" évite de forker un process qui a déjà des threads / une boucle asyncio
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                )
+        return self._executor
+
+    async def start(self) -> None:
+        """Démarre le pool et préchauffe les workers selon `warmup` (appelé depuis le lifespan)."""
+        if self.warmup == "off":
+            return
+        executor = self._ensure_executor()
+        if executor is None:
+            return
+        loop = asyncio.get_running_loop()
+        # why: l'import WeasyPrint des workers (≈ 1-3 s) bloquait le lifespan, donc la mise en service
+        self._warming = asyncio.gather(*(loop.run_in_executor(executor, _noop) for _ in range(self.workers)))
+        self._warming.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self.warmup == "blocking":
+            await self._warming
+
+    async def stop(self) -> None:
+        if self._warming is not None and not self._warming.done():
+            self._warming.cancel()
+        self._warming = None
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Rendu ---
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_queue)
+            self._bulk = asyncio.Semaphore(self.bulk_slots)
+            self._slots_loop = loop
+        return self._slots
+
+    async def render(self, html: str, wait: bool = False) -> bytes:
+        """
+        Rend `html` en PDF. Si la file est pleine : RenderQueueFull, sauf `wait=True`
+        (exports en masse) où l'appel attend qu'une place se libère, dans la limite de `bulk_slots`.
+        """
+        slots = self._get_slots()
+        bulk = self._bulk if wait else None
+        if slots.locked() and not wait:
+            self._counters["rejected"] += 1
+            raise RenderQueueFull(self.retry_after)
+        if bulk is not None:
+            await bulk.acquire()
+        try:
+            await slots.acquire()
+        except BaseException:
+            if bulk is not None:
+                bulk.release()
+            raise
+        self._in_flight += 1
+
+        def _release(_fut=None) -> None:
+            self._in_flight -= 1
+            slots.release()
+            if bulk is not None:
+                bulk.release()
+
+        started = time.perf_counter()
+        if self.backend == "inline":
+            outcome = "error"
+            try:
+                pdf = self.render_fn(html)
+                outcome = "ok"
+                return pdf
+            finally:
+                _release()
+                took = time.perf_counter() - started
+                if outcome == "ok":
+                    self._counters["rendered"] += 1
+                    self._counters["render_seconds_total"] += took
+                else:
+                    self._counters["errors"] += 1
+                PDF_RENDER_SECONDS.observe(took, outcome)
+
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(self._ensure_executor(), self.render_fn, html)
+        # why: un worker ne peut pas être interrompu -> la place reste occupée jusqu'à sa fin réelle
+        fut.add_done_callback(_release)
+        try:
+            pdf = await asyncio.wait_for(asyncio.shield(fut), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._counters["timeouts"] += 1
+            PDF_RENDER_SECONDS.observe(time.perf_counter() - started, "timeout")
+            fut.add_done_callback(lambda f: f.cancelled() or f.exception())  # évite "exception never retrieved"
+            raise RenderTimeout(f"PDF render exceeded {self.timeout:.0f}s")
+        except BrokenProcessPool:
+            # un worker est mort (OOM...) : on repartira sur un pool neuf au prochain appel
+            self._counters["errors"] += 1
+            broken, self._executor = self._executor, None
+            if broken is not None:
+                # why: libère le thread de gestion et les workers encore vivants de l'ancien pool
+                broken.shutdown(wait=False, cancel_futures=True)
+            PDF_RENDER_SECONDS.observe(time.perf_counter() - started, "error")
+            raise
+        except Exception:
+            self._counters["errors"] += 1
+            PDF_RENDER_SECONDS.observe(time.perf_counter() - started, "error")
+            raise
+        took = time.perf_counter() - started
+        self._counters["rendered"] += 1
+        self._counters["render_seconds_total"] += took
+        PDF_RENDER_SECONDS.observe(took, "ok")
+        return pdf
+
+    def stats(self) -> Dict[str, Any]:
+        out = dict(self._counters)
+        out.update(
+            backend=self.backend,
+            workers=self.workers,
+            in_flight=self._in_flight,
+            max_queue=self.max_queue,
+            bulk_slots=self.bulk_slots,
+            warmup=self.warmup,
+            warm=self._warming is not None and self._warming.done() and not self._warming.cancelled(),
+        )
+        return out
+
+
+pdf_renderer = PdfRenderer.from_env()
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from databases import Database
+from sqlalchemy import text
+
+from app.db import database, read_database
+from app.metrics import DB_READ_ROUTING, DB_REPLICA_LAG_SECONDS
+from app.ttl_cache import TTLCache
+
+# Routage des lectures lourdes (listes, rapports, PDF, exports) vers DATABASE_READ_URL.
+# Le primaire reste la cible :
+# - pendant READ_YOUR_WRITES_SECONDS après une écriture de la company (lire ses propres écritures) ;
+# - si la réplique est injoignable ou en retard de plus de REPLICA_MAX_LAG_SECONDS.
+# Choisir READ_YOUR_WRITES_SECONDS >= REPLICA_MAX_LAG_SECONDS + REPLICA_LAG_CHECK_SECONDS : à la fin
+# de la fenêtre, la réplique a forcément rejoué l'écriture.
+# Les écritures sont marquées dans company_writes sur le primaire (horloge du primaire) : visibles par
+# tous les workers / conteneurs. Coût : une lecture par clé primaire sur le primaire par lecture routée,
+# évitée quand ce process a lui-même vu l'écriture (cache local).
+
+logger = logging.getLogger("app.read_routing")
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "1"))
+
+# why: sur une réplique sans trafic, now() - dernier rejeu croît sans qu'il y ait de retard ;
+# tout le WAL reçu est rejoué -> 0. Sur un primaire (dev : même URL), toujours 0.
+REPLICA_LAG_SQL = """
+SELECT CASE
+  WHEN NOT pg_is_in_recovery() THEN 0
+  WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+  ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+WRITE_MARK_SQL = """
+INSERT INTO company_writes (company_id, written_at) VALUES (:company_id, clock_timestamp())
+ON CONFLICT (company_id) DO UPDATE SET written_at = EXCLUDED.written_at
+"""
+RECENT_WRITE_SQL = """
+SELECT written_at > clock_timestamp() - make_interval(secs => :window)
+FROM company_writes WHERE company_id = :company_id
+"""
+
+
+class ReadRouter:
+    def __init__(self, primary: Database, replica: Optional[Database] = None,
+                 window: float = READ_YOUR_WRITES_SECONDS, max_lag: float = REPLICA_MAX_LAG_SECONDS,
+                 check_interval: float = REPLICA_LAG_CHECK_SECONDS):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.window = window
+        self._writes = TTLCache(maxsize=100_000, ttl=window)
+        self._lock = asyncio.Lock()
+        self._checked_at: Optional[float] = None
+        self.lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.replica is not None
+
+    async def connect(self) -> None:
+        # réplique indisponible au démarrage : on sert tout depuis le primaire, reconnexion au prochain contrôle
+        if self.replica is not None:
+            try:
+                await self.replica.connect()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("read replica unavailable, reads go to primary: %s", self.last_error)
+
+    async def disconnect(self) -> None:
+        if self.replica is not None:
+            await self.replica.disconnect()
+
+    async def note_write(self, company_id: int) -> None:
+        if self.replica is None:
+            return
+        self._writes.set(int(company_id), True)
+        try:
+            await self.primary.execute(text(WRITE_MARK_SQL).bindparams(company_id=int(company_id)))
+        except Exception as e:
+            # la requête d'écriture ne doit pas échouer pour ça ; les autres workers liront peut-être la réplique
+            logger.warning("cannot record write for company %s: %s: %s", company_id, type(e).__name__, e)
+
+    async def recently_wrote(self, company_id: int) -> bool:
+        if self._writes.get(int(company_id)):
+            return True
+        try:
+            recent = await self.primary.fetch_val(
+                text(RECENT_WRITE_SQL).bindparams(window=float(self.window), company_id=int(company_id))
+            )
+        except Exception as e:
+            logger.warning("cannot check writes for company %s: %s: %s", company_id, type(e).__name__, e)
+            return True  # why: sans marqueur lisible, seul le primaire garantit la lecture de ses écritures
+        return bool(recent)
+
+    async def replica_lag(self) -> Optional[float]:
+        """Retard de la réplique en secondes, mesuré au plus une fois par check_interval (None : injoignable)."""
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self.lag
+        async with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self.lag
+            try:
+                if not self.replica.is_connected:
+                    await self.replica.connect()
+                self.lag = float(await self.replica.fetch_val(REPLICA_LAG_SQL))
+                self.last_error = None
+                DB_REPLICA_LAG_SECONDS.set(value=self.lag)
+            except Exception as e:
+                self.lag = None
+                self.last_error = f"{type(e).__name__}: {e}"
+            self._checked_at = time.monotonic()
+        return self.lag
+
+    async def for_read(self, company_id: Optional[int] = None) -> Database:
+        if self.replica is None:
+            return self.primary
+        if company_id is not None and await self.recently_wrote(company_id):
+            reason = "recent_write"
+        else:
+            lag = await self.replica_lag()
+            if lag is None:
+                reason = "replica_down"
+            elif lag > self.max_lag:
+                reason = "replica_lag"
+            else:
+                DB_READ_ROUTING.inc("replica", "ok")
+                return self.replica
+        DB_READ_ROUTING.inc("primary", reason)
+        return self.primary
+
+    async def stats(self) -> dict:
+        if self.replica is None:
+            return {"enabled": False}
+        lag = await self.replica_lag()
+        return {
+            "enabled": True,
+            "lag_seconds": None if lag is None else round(lag, 3),
+            "max_lag_seconds": self.max_lag,
+            "serving": lag is not None and lag <= self.max_lag,
+            "recent_writers": len(self._writes),
+            "error": self.last_error,
+        }
+
+
+read_router = ReadRouter(database, read_database)
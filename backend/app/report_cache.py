@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from databases import Database
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+
+from app.db import database
+from app.ttl_cache import TTLCache
+
+try:  # dépendance optionnelle : uniquement si REPORT_CACHE_URL est renseigné
+    import redis.asyncio as _redis
+except Exception:
+    _redis = None
+
+# Cache des résultats de /reports/* par (company, endpoint, paramètres).
+# Invalidation par génération : chaque company a un compteur inclus dans la clé ; l'incrémenter
+# rend d'un coup toutes ses entrées inaccessibles (elles expirent ensuite par TTL/LRU).
+# Un compteur global couvre le REFRESH des matviews, qui touche toutes les companies.
+# Les compteurs doivent être partagés entre workers (gunicorn) : sinon une écriture n'invalide que
+# le worker qui l'a traitée. Défaut : valeurs en mémoire du process, compteurs dans Postgres
+# (PostgresGenerationBackend) ; REPORT_CACHE_URL -> tout dans Redis. MemoryBackend : un seul process.
+
+
+class MemoryBackend:
+    """LRU + TTL dans le process (un seul worker)."""
+
+    quotes_trigger_bumps = False  # True : le trigger des agrégats incrémente les générations
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self._values = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._values.get(key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._values.set(key, value, ttl)
+
+    async def generations(self, keys: Sequence[str]) -> List[int]:
+        return [self._generations.get(key, 0) for key in keys]
+
+    async def bump(self, key: str) -> int:
+        self._generations[key] = self._generations.get(key, 0) + 1
+        return self._generations[key]
+
+
+GENERATIONS_SQL = "SELECT key, value FROM report_cache_generations WHERE key = ANY(:keys)"
+BUMP_SQL = """
+INSERT INTO report_cache_generations AS g (key, value) VALUES (:key, 1)
+ON CONFLICT (key) DO UPDATE SET value = g.value + 1
+RETURNING value
+"""
+
+
+class PostgresGenerationBackend(MemoryBackend):
+    """
+    Valeurs dans le process (LRU + TTL), compteurs dans report_cache_generations sur le primaire :
+    une invalidation est vue par tous les workers. Coût : une lecture par clé primaire par appel.
+    Les écritures sur quotes incrémentent déjà le compteur dans leur transaction (app/reporting.py).
+    """
+
+    quotes_trigger_bumps = True
+
+    def __init__(self, db: Database, maxsize: int = 1024, ttl: float = 60.0):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._db = db
+
+    async def generations(self, keys: Sequence[str]) -> List[int]:
+        rows = await self._db.fetch_all(text(GENERATIONS_SQL).bindparams(keys=list(keys)))
+        found = {r["key"]: int(r["value"]) for r in rows}
+        return [found.get(key, 0) for key in keys]
+
+    async def bump(self, key: str) -> int:
+        return int(await self._db.fetch_val(text(BUMP_SQL).bindparams(key=key)))
+
+
+class RedisBackend:
+    """Serveur compatible Redis (Redis, Valkey, KeyDB...) : partagé entre workers."""
+
+    quotes_trigger_bumps = False
+
+    def __init__(self, url: str):
+        if _redis is None:
+            raise RuntimeError("REPORT_CACHE_URL requires the 'redis' package")
+        self._client = _redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self._client.set(key, value, ex=max(1, int(ttl)))
+
+    async def generations(self, keys: Sequence[str]) -> List[int]:
+        return [int(v or 0) for v in await self._client.mget(list(keys))]
+
+    async def bump(self, key: str) -> int:
+        return int(await self._client.incr(key))
+
+
+class ReportCache:
+    """
+    `get_or_compute` : lecture du cache, sinon un seul calcul par clé et par process
+    (les appelants concurrents attendent le même résultat -> pas d'avalanche sur la base).
+    """
+
+    def __init__(self, backend, ttl: float = 60.0, prefix: str = "report"):
+        self.backend = backend
+        self.ttl = float(ttl)
+        self.prefix = prefix
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._counters = {"hits": 0, "misses": 0, "joined": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls) -> "ReportCache":
+        ttl = float(os.getenv("REPORT_CACHE_TTL", "60"))
+        url = os.getenv("REPORT_CACHE_URL", "")
+        if url:
+            backend = RedisBackend(url)
+        else:
+            backend = PostgresGenerationBackend(database, maxsize=int(os.getenv("REPORT_CACHE_SIZE", "1024")), ttl=ttl)
+        return cls(backend, ttl=ttl)
+
+    async def _key(self, company_id: int, endpoint: str, params: Dict[str, Any]) -> str:
+        global_gen, company_gen = await self.backend.generations(
+            [f"{self.prefix}:gen", f"{self.prefix}:gen:{int(company_id)}"]
+        )
+        args = json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+        return f"{self.prefix}:{global_gen}:{int(company_id)}:{company_gen}:{endpoint}:{args}"
+
+    async def get_or_compute(
+        self,
+        company_id: int,
+        endpoint: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        if self.ttl <= 0:
+            return await compute()
+        key = await self._key(company_id, endpoint, params)
+        raw = await self.backend.get(key)
+        if raw is not None:
+            self._counters["hits"] += 1
+            return json.loads(raw)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._counters["joined"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # le calcul de tête a été annulé (client parti) : on reprend la main
+                return await self.get_or_compute(company_id, endpoint, params, compute)
+        self._counters["misses"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            value = jsonable_encoder(await compute())
+            await self.backend.set(key, json.dumps(value, separators=(",", ":")), self.ttl)
+            fut.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # marque l'exception comme lue si personne n'attendait
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, company_id: Optional[int] = None) -> None:
+        """company_id=None : toutes les companies (ex. après REFRESH des matviews)."""
+        self._counters["invalidations"] += 1
+        suffix = "" if company_id is None else f":{int(company_id)}"
+        await self.backend.bump(f"{self.prefix}:gen{suffix}")
+
+    async def quotes_written(self, company_id: int) -> None:
+        """Après une écriture sur quotes : invalide la company, sauf si le trigger l'a déjà fait."""
+        if self.backend.quotes_trigger_bumps:
+            self._counters["invalidations"] += 1
+            return
+        await self.invalidate(company_id)
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "ttl": self.ttl,
+                "inflight": len(self._inflight), **self._counters}
+
+
+report_cache = ReportCache.from_env()
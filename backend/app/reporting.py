@@ -1,4 +1,19 @@
-from app.db import database
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from app.db import NO_STATEMENT_TIMEOUT, database
+from app.report_cache import report_cache
+
+logger = logging.getLogger("app.reporting")
+
+# "aggregates" (défaut) : tables de synthèse tenues à jour par trigger ; "matviews" : ancien mode
+REPORTING_SOURCE = os.getenv("REPORTING_SOURCE", "aggregates")
 
 CREATE_MATVIEWS_SQL = """
 DO $$
@@ -37,10 +52,350 @@ END $$ LANGUAGE plpgsql;
 
 REFRESH_STATUS_SQL = "REFRESH MATERIALIZED VIEW public.mv_quotes_by_status;"
 REFRESH_MONTHLY_SQL = "REFRESH MATERIALIZED VIEW public.mv_monthly_revenue;"
+# why: CONCURRENTLY ne bloque pas les lectures (s'appuie sur les index uniques *_uidx)
+REFRESH_STATUS_CONCURRENTLY_SQL = "REFRESH MATERIALIZED VIEW CONCURRENTLY public.mv_quotes_by_status;"
+REFRESH_MONTHLY_CONCURRENTLY_SQL = "REFRESH MATERIALIZED VIEW CONCURRENTLY public.mv_monthly_revenue;"
 
 async def ensure_matviews():
     await database.execute(CREATE_MATVIEWS_SQL)
 
-async def refresh_matviews():
-    await database.execute(REFRESH_STATUS_SQL)
-    await database.execute(REFRESH_MONTHLY_SQL)
\ No newline at end of file
+async def refresh_matviews(concurrently: bool = False):
+    # why: un REFRESH sur tout l'historique peut dépasser DB_STATEMENT_TIMEOUT_MS des requêtes HTTP
+    async with database.transaction():
+        await database.execute(NO_STATEMENT_TIMEOUT)
+        if concurrently:
+            await database.execute(REFRESH_STATUS_CONCURRENTLY_SQL)
+            await database.execute(REFRESH_MONTHLY_CONCURRENTLY_SQL)
+            return
+        await database.execute(REFRESH_STATUS_SQL)
+        await database.execute(REFRESH_MONTHLY_SQL)
+
+
+# --- Agrégats incrémentaux ---
+# Chaque INSERT/UPDATE/DELETE sur quotes applique un delta (-ancien, +nouveau), groupé par
+# instruction, aux tables de synthèse : la lecture d'un rapport coûte O(groupes) et ne rescanne jamais quotes.
+# Les mois sont calculés en UTC pour ne pas dépendre du TimeZone de la session qui écrit.
+# Verrou consultatif (7007, company_id) : partagé par les triggers, exclusif pendant une
+# reconstruction -> la reconstruction d'une company voit un état stable.
+# Le même delta incrémente la génération de la company dans report_cache_generations :
+# après une écriture sur quotes, le cache des rapports n'a pas d'aller-retour de plus à faire.
+AGGREGATES_LOCK_KEY = 7007
+
+# asyncpg n'accepte qu'une commande par exécution -> une entrée par instruction
+CREATE_AGGREGATES_SQL = (
+    """
+CREATE TABLE IF NOT EXISTS public.report_quotes_by_status (
+  company_id integer NOT NULL,
+  status varchar NOT NULL,
+  count bigint NOT NULL DEFAULT 0,
+  amount_cents bigint NOT NULL DEFAULT 0,
+  PRIMARY KEY (company_id, status)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS public.report_monthly_revenue (
+  company_id integer NOT NULL,
+  month date NOT NULL,
+  count bigint NOT NULL DEFAULT 0,
+  amount_cents bigint NOT NULL DEFAULT 0,
+  PRIMARY KEY (company_id, month)
+)
+""",
+    """
+CREATE OR REPLACE FUNCTION public.report_quotes_apply_delta(
+  p_company integer[], p_status varchar[], p_created timestamptz[], p_amount bigint[], p_sign integer[]
+) RETURNS void AS $$
+BEGIN
+  IF p_company IS NULL THEN
+    RETURN;
+  END IF;
+  PERFORM pg_advisory_xact_lock_shared(7007, c)
+     FROM (SELECT DISTINCT c FROM unnest(p_company) AS c ORDER BY c) l;
+
+  INSERT INTO public.report_quotes_by_status AS t (company_id, status, count, amount_cents)
+  SELECT company_id, status, SUM(sign), SUM(sign * COALESCE(amount_cents, 0))
+    FROM unnest(p_company, p_status, p_created, p_amount, p_sign)
+         AS d(company_id, status, created_at, amount_cents, sign)
+   GROUP BY company_id, status
+  HAVING SUM(sign) <> 0 OR SUM(sign * COALESCE(amount_cents, 0)) <> 0
+   ORDER BY company_id, status
+  ON CONFLICT (company_id, status) DO UPDATE
+    SET count = t.count + EXCLUDED.count,
+        amount_cents = t.amount_cents + EXCLUDED.amount_cents;
+  DELETE FROM public.report_quotes_by_status WHERE count = 0 AND company_id = ANY(p_company);
+
+  INSERT INTO public.report_monthly_revenue AS t (company_id, month, count, amount_cents)
+  SELECT company_id, date_trunc('month', created_at AT TIME ZONE 'UTC')::date,
+         SUM(sign), SUM(sign * COALESCE(amount_cents, 0))
+    FROM unnest(p_company, p_status, p_created, p_amount, p_sign)
+         AS d(company_id, status, created_at, amount_cents, sign)
+   WHERE status = 'accepted' AND created_at IS NOT NULL
+   GROUP BY 1, 2
+  HAVING SUM(sign) <> 0 OR SUM(sign * COALESCE(amount_cents, 0)) <> 0
+   ORDER BY 1, 2
+  ON CONFLICT (company_id, month) DO UPDATE
+    SET count = t.count + EXCLUDED.count,
+        amount_cents = t.amount_cents + EXCLUDED.amount_cents;
+  DELETE FROM public.report_monthly_revenue WHERE count = 0 AND company_id = ANY(p_company);
+
+  -- générations du cache des rapports (app/report_cache.py), validées avec l'écriture elle-même
+  INSERT INTO public.report_cache_generations AS g (key, value)
+  SELECT DISTINCT 'report:gen:' || c, 1 FROM unnest(p_company) AS c
+   ORDER BY 1
+  ON CONFLICT (key) DO UPDATE SET value = g.value + 1;
+END $$ LANGUAGE plpgsql
+""",
+    # why: trigger par instruction (tables de transition) -> un import de 100k devis applique
+    # un seul delta groupé ; un trigger par ligne réécrirait 100k fois la même ligne de synthèse.
+    """
+CREATE OR REPLACE FUNCTION public.report_quotes_stmt_trigger() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM public.report_quotes_apply_delta(
+      array_agg(company_id), array_agg(status), array_agg(created_at), array_agg(amount_cents), array_agg(1)
+    ) FROM new_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM public.report_quotes_apply_delta(
+      array_agg(company_id), array_agg(status), array_agg(created_at), array_agg(amount_cents), array_agg(-1)
+    ) FROM old_rows;
+  ELSE
+    PERFORM public.report_quotes_apply_delta(
+      array_agg(company_id), array_agg(status), array_agg(created_at), array_agg(amount_cents), array_agg(sign)
+    ) FROM (
+      SELECT company_id, status, created_at, amount_cents, -1 AS sign FROM old_rows
+      UNION ALL
+      SELECT company_id, status, created_at, amount_cents, 1 FROM new_rows
+    ) d;
+  END IF;
+  RETURN NULL;
+END $$ LANGUAGE plpgsql
+""",
+    # ancien trigger FOR EACH ROW (remplacé)
+    """
+DROP TRIGGER IF EXISTS trg_report_quotes ON public.quotes
+""",
+    """
+DROP FUNCTION IF EXISTS public.report_quotes_trigger()
+""",
+    """
+DROP FUNCTION IF EXISTS public.report_quotes_apply(integer, varchar, timestamptz, bigint, integer)
+""",
+    """
+DROP TRIGGER IF EXISTS trg_report_quotes_ins ON public.quotes
+""",
+    """
+CREATE TRIGGER trg_report_quotes_ins
+  AFTER INSERT ON public.quotes REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.report_quotes_stmt_trigger()
+""",
+    """
+DROP TRIGGER IF EXISTS trg_report_quotes_upd ON public.quotes
+""",
+    """
+CREATE TRIGGER trg_report_quotes_upd
+  AFTER UPDATE ON public.quotes REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.report_quotes_stmt_trigger()
+""",
+    """
+DROP TRIGGER IF EXISTS trg_report_quotes_del ON public.quotes
+""",
+    """
+CREATE TRIGGER trg_report_quotes_del
+  AFTER DELETE ON public.quotes REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION public.report_quotes_stmt_trigger()
+""",
+)
+
+REBUILD_STATUS_SQL = """
+INSERT INTO public.report_quotes_by_status (company_id, status, count, amount_cents)
+SELECT company_id, status, COUNT(*)::bigint, COALESCE(SUM(amount_cents), 0)::bigint
+FROM quotes {where}
+GROUP BY company_id, status
+"""
+
+REBUILD_MONTHLY_SQL = """
+INSERT INTO public.report_monthly_revenue (company_id, month, count, amount_cents)
+SELECT company_id, date_trunc('month', created_at AT TIME ZONE 'UTC')::date,
+       COUNT(*)::bigint, COALESCE(SUM(amount_cents), 0)::bigint
+FROM quotes
+WHERE status = 'accepted' AND created_at IS NOT NULL {and_where}
+GROUP BY 1, 2
+"""
+
+async def ensure_quote_aggregates():
+    """Crée tables + trigger (idempotent) ; remplit tout à la première création seulement."""
+    existed = await database.fetch_val("SELECT to_regclass('public.report_quotes_by_status') IS NOT NULL")
+    async with database.transaction():
+        for stmt in CREATE_AGGREGATES_SQL:
+            await database.execute(stmt)
+        if not existed:
+            await _rebuild(None)
+
+async def _rebuild(company_id):
+    await database.execute(NO_STATEMENT_TIMEOUT)
+    if company_id is None:
+        await database.execute("LOCK TABLE quotes IN SHARE MODE")
+        await database.execute("DELETE FROM public.report_quotes_by_status")
+        await database.execute("DELETE FROM public.report_monthly_revenue")
+        await database.execute(REBUILD_STATUS_SQL.format(where=""))
+        await database.execute(REBUILD_MONTHLY_SQL.format(and_where=""))
+        return
+    cid = int(company_id)
+    await database.execute(
+        text("SELECT pg_advisory_xact_lock(:k, :cid)").bindparams(k=AGGREGATES_LOCK_KEY, cid=cid)
+    )
+    await database.execute(text("DELETE FROM public.report_quotes_by_status WHERE company_id = :cid").bindparams(cid=cid))
+    await database.execute(text("DELETE FROM public.report_monthly_revenue WHERE company_id = :cid").bindparams(cid=cid))
+    await database.execute(text(REBUILD_STATUS_SQL.format(where="WHERE company_id = :cid")).bindparams(cid=cid))
+    await database.execute(text(REBUILD_MONTHLY_SQL.format(and_where="AND company_id = :cid")).bindparams(cid=cid))
+
+async def rebuild_quote_aggregates(company_id=None):
+    """Réconciliation : recalcule les agrégats d'une company (ou de toutes si None)."""
+    async with database.transaction():
+        await _rebuild(company_id)
+
+
+# --- Planificateur de rafraîchissement (tâche de fond) ---
+class RefreshScheduler:
+    """
+    Tâche de fond démarrée par le lifespan. Les demandes sont fusionnées :
+    - matviews (cible None) : un seul REFRESH ... CONCURRENTLY à la fois, espacé d'au moins
+      `min_interval` secondes, quel que soit le nombre d'appelants ;
+    - réconciliation d'agrégats : au plus une en attente par company.
+    Une demande reçue pendant une exécution déclenche une passe de plus (les données ont pu changer).
+    status() date les données servies par `source` : dernier REFRESH des matviews, ou dernière
+    réconciliation des agrégats de la company (par process : un autre worker a pu en faire une depuis).
+    """
+
+    def __init__(self, min_interval: float = 30.0, period: float = 0.0, source: str = REPORTING_SOURCE):
+        self.min_interval = float(min_interval)
+        self.period = float(period)  # 0 = uniquement à la demande
+        self.source = source
+        self.reconciled_at: Dict[int, datetime] = {}
+        self._pending: set = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self._last_matview_mono: Optional[float] = None
+        self.last_refresh_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> "RefreshScheduler":
+        return cls(
+            min_interval=float(os.getenv("MATVIEW_REFRESH_MIN_INTERVAL", "30")),
+            period=float(os.getenv("MATVIEW_REFRESH_PERIOD", "0")),
+        )
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            if self._pending:
+                self._wake.set()
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def request(self, company_id: Optional[int] = None) -> dict:
+        """Met en file un rafraîchissement (None = matviews globales) et rend la main aussitôt."""
+        target = None if company_id is None else int(company_id)
+        if target in self._pending:
+            self.coalesced += 1
+        self._pending.add(target)
+        if self._task is None or self._task.done():
+            # hors lifespan (tests, scripts) : démarrage paresseux sur la boucle courante
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+        self._wake.set()
+        return self.status(target)
+
+    def status(self, company_id: Optional[int] = None) -> dict:
+        if self.source == "aggregates":
+            if company_id is not None:
+                refreshed = self.reconciled_at.get(int(company_id))
+            else:
+                refreshed = max(self.reconciled_at.values(), default=None)
+        else:
+            refreshed = self.last_refresh_at
+        staleness = None
+        if refreshed is not None:
+            staleness = round((datetime.now(timezone.utc) - refreshed).total_seconds(), 3)
+        return {
+            "queued": bool(self._pending),
+            "running": self._running,
+            "pending_companies": len([t for t in self._pending if t is not None]),
+            "last_refresh_at": refreshed.isoformat() if refreshed else None,
+            "staleness_seconds": staleness,
+            "last_matview_refresh_at": self.last_refresh_at.isoformat() if self.last_refresh_at else None,
+            "last_duration_seconds": self.last_duration,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+        }
+
+    async def _loop(self) -> None:
+        wake = self._wake
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=self.period or None)
+            except asyncio.TimeoutError:
+                self._pending.add(None)  # rafraîchissement périodique
+            wake.clear()
+            batch, self._pending = self._pending, set()
+            for company_id in sorted(t for t in batch if t is not None):
+                if await self._run(rebuild_quote_aggregates, company_id):
+                    self.reconciled_at[company_id] = datetime.now(timezone.utc)
+                await self._invalidate(company_id)
+            if None in batch:
+                if self._last_matview_mono is not None:
+                    delay = self.min_interval - (time.monotonic() - self._last_matview_mono)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self._run(self._refresh_matviews)
+                await self._invalidate()
+                self._last_matview_mono = time.monotonic()
+                self.last_refresh_at = datetime.now(timezone.utc)
+            if self._pending:
+                wake.set()
+
+    async def _refresh_matviews(self) -> None:
+        try:
+            await refresh_matviews(concurrently=True)
+        except Exception:
+            # ex: matview jamais peuplée -> CONCURRENTLY refusé, on retombe sur le REFRESH simple
+            await refresh_matviews(concurrently=False)
+
+    async def _invalidate(self, company_id: Optional[int] = None) -> None:
+        # why: compteurs de génération en base -> une erreur ici ne doit pas arrêter la boucle
+        try:
+            await report_cache.invalidate(company_id)
+        except Exception:
+            logger.exception("report cache invalidation failed (company %s)", company_id)
+
+    async def _run(self, fn, *args) -> bool:
+        self._running = True
+        started = time.monotonic()
+        try:
+            await fn(*args)
+            self.last_error = None
+            return True
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        finally:
+            self._running = False
+            self.last_duration = round(time.monotonic() - started, 3)
+            self.runs += 1
+
+
+report_refresher = RefreshScheduler.from_env()
\ No newline at end of file
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import select
 from app import schemas
 from app.db import database
 from app import models
-from app.auth_utils import get_password_hash, verify_password, create_access_token
-from app.deps import get_current_user
+from app.auth_utils import hash_password_async, verify_and_update_password_async, create_access_token
+from app.deps import get_current_user, invalidate_user
+from app.crud import insert_returning
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -12,6 +14,14 @@ async def register(payload: schemas.UserCreate):
     company_tbl = models.Company.__table__
     user_tbl = models.User.__table__
 
+    # why: bcrypt est le goulot de l'auth ; un email déjà pris ne doit pas coûter un hachage
+    # (l'ON CONFLICT plus bas couvre toujours la course entre deux inscriptions)
+    taken = await database.fetch_val(select(user_tbl.c.id).where(user_tbl.c.email == payload.email))
+    if taken:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    # avant toute écriture : un refus (HashingBusy -> 503) ne laisse pas de company orpheline
+    hashed = await hash_password_async(payload.password)
+
     company_row = await database.fetch_one(
         company_tbl.select().where(company_tbl.c.name == payload.company_name)
     )
@@ -22,16 +32,14 @@ async def register(payload: schemas.UserCreate):
             company_tbl.insert().values(name=payload.company_name)
         )
 
-    existing = await database.fetch_one(
-        user_tbl.select().where(user_tbl.c.email == payload.email)
+    created = await insert_returning(
+        user_tbl,
+        dict(email=payload.email, hashed_password=hashed, company_id=company_id),
+        on_conflict=["email"],
     )
-    if existing:
+    if not created:
         raise HTTPException(status_code=400, detail="Email already registered")
-
-    hashed = get_password_hash(payload.password)
-    await database.execute(
-        user_tbl.insert().values(email=payload.email, hashed_password=hashed, company_id=company_id)
-    )
+    invalidate_user(payload.email)
     token = create_access_token(sub=payload.email, company_id=company_id)
     return {"access_token": token}
 
@@ -41,8 +49,16 @@ async def login(payload: schemas.UserLogin):
     row = await database.fetch_one(
         user_tbl.select().where(user_tbl.c.email == payload.email)
     )
-    if not row or not verify_password(payload.password, row["hashed_password"]):
+    if not row:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    ok, new_hash = await verify_and_update_password_async(payload.password, row["hashed_password"])
+    if not ok:
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # why: BCRYPT_ROUNDS a changé -> on migre le hash au fil des connexions
+        await database.execute(
+            user_tbl.update().where(user_tbl.c.id == row["id"]).values(hashed_password=new_hash)
+        )
     token = create_access_token(sub=row["email"], company_id=row["company_id"])
     return {"access_token": token}
 
@@ -1,83 +1,112 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, and_
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select, and_, tuple_, text
 from app.db import database
 from app import models, schemas
-from app.deps import get_current_user
+from app.deps import get_current_user, mark_write, read_db
+from app.pagination import decode_cursor, keyset_page
+from app.crud import insert_returning, update_returning
+from app.bulk_import import import_clients
+from app.stream_parse import request_csv
+from app.http_cache import conditional_json
+from app.report_cache import report_cache
 
 router = APIRouter(prefix="/clients", tags=["clients"])
 
+DELETE_CLIENT_SQL = """
+WITH c AS (
+    DELETE FROM clients WHERE id = :client_id AND company_id = :company_id RETURNING id
+), q AS (
+    DELETE FROM quotes WHERE client_id IN (SELECT id FROM c)
+)
+SELECT id FROM c
+"""
+
 @router.post("/", response_model=schemas.ClientOut)
 async def create_client(payload: schemas.ClientCreate, user=Depends(get_current_user)):
     tbl = models.Client.__table__
-    # why: éviter doublon (company_id, name)
-    exists = await database.fetch_one(
-        select(tbl.c.id).where(and_(tbl.c.company_id == user["company_id"], tbl.c.name == payload.name))
+    # why: doublon (company_id, name) détecté par la contrainte elle-même, sans pré-lecture
+    row = await insert_returning(
+        tbl,
+        dict(name=payload.name, email=payload.email, phone=payload.phone, company_id=user["company_id"]),
+        on_conflict="uq_client_company_name",
     )
-    if exists:
+    if not row:
         raise HTTPException(status_code=400, detail="Client name already exists in your company")
-    cid = await database.execute(
-        tbl.insert().values(
-            name=payload.name, email=payload.email, phone=payload.phone, company_id=user["company_id"]
-        )
-    )
-    row = await database.fetch_one(select(tbl).where(tbl.c.id == cid))
     return dict(row)
 
-@router.get("/", response_model=list[schemas.ClientOut])
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_clients_csv(
+    request: Request,
+    on_conflict: Literal["skip", "update"] = Query(default="skip", description="Existing name: skip, or fill email/phone"),
+    user=Depends(get_current_user),
+):
+    """CSV (en-tête name,email,phone) chargé par COPY ; voir app/bulk_import.py."""
+    try:
+        report = await import_clients(user["company_id"], request_csv(request), on_conflict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await mark_write(user)
+    return report
+
+@router.get("/", response_model=list[schemas.ClientOut] | schemas.ClientPage)
 async def list_clients(
     q: str | None = Query(default=None, description="Filter by name contains"),
     limit: int = 50,
     offset: int = 0,
+    cursor: bool = Query(default=False, description="Keyset mode: returns {items, next_cursor}"),
+    after: str | None = Query(default=None, description="next_cursor of the previous page"),
     user=Depends(get_current_user),
+    db=Depends(read_db),
 ):
     tbl = models.Client.__table__
+    if cursor or after is not None:
+        # why: keyset (company_id, name, id) -> coût constant quelle que soit la profondeur
+        conds = [tbl.c.company_id == user["company_id"]]
+        if q:
+            conds.append(tbl.c.name.ilike(f"%{q}%"))
+        if after:
+            name, last_id = decode_cursor(after, (str, int))
+            conds.append(tuple_(tbl.c.name, tbl.c.id) > tuple_(name, last_id))
+        stmt = select(tbl).where(and_(*conds)).order_by(tbl.c.name, tbl.c.id).limit(limit + 1)
+        rows = await db.fetch_all(stmt)
+        return keyset_page([dict(r) for r in rows], limit, ("name", "id"))
     stmt = select(tbl).where(tbl.c.company_id == user["company_id"]).order_by(tbl.c.name).limit(limit).offset(offset)
     if q:
         stmt = select(tbl).where(
             and_(tbl.c.company_id == user["company_id"], tbl.c.name.ilike(f"%{q}%"))
         ).order_by(tbl.c.name).limit(limit).offset(offset)
-    rows = await database.fetch_all(stmt)
+    rows = await db.fetch_all(stmt)
     return [dict(r) for r in rows]
 
 @router.get("/{client_id}", response_model=schemas.ClientOut)
-async def get_client(client_id: int, user=Depends(get_current_user)):
+async def get_client(client_id: int, request: Request, user=Depends(get_current_user)):
     tbl = models.Client.__table__
     row = await database.fetch_one(
         select(tbl).where(and_(tbl.c.id == client_id, tbl.c.company_id == user["company_id"]))
     )
     if not row:
         raise HTTPException(status_code=404, detail="Client not found")
-    return dict(row)
+    # pas d'updated_at sur clients : ETag seul (empreinte du contenu)
+    return conditional_json(request, schemas.ClientOut(**dict(row)))
 
 @router.patch("/{client_id}", response_model=schemas.ClientOut)
 async def update_client(client_id: int, payload: schemas.ClientUpdate, user=Depends(get_current_user)):
     tbl = models.Client.__table__
-    existing = await database.fetch_one(
-        select(tbl).where(and_(tbl.c.id == client_id, tbl.c.company_id == user["company_id"]))
-    )
-    if not existing:
+    row = await update_returning(tbl, client_id, user["company_id"], payload.model_dump(exclude_unset=True))
+    if not row:
         raise HTTPException(status_code=404, detail="Client not found")
-    data = existing._mapping.copy()
-    for k, v in payload.model_dump(exclude_unset=True).items():
-        data[k] = v
-    await database.execute(
-        tbl.update().where(tbl.c.id == client_id).values(
-            name=data["name"], email=data["email"], phone=data["phone"]
-        )
-    )
-    row = await database.fetch_one(select(tbl).where(tbl.c.id == client_id))
     return dict(row)
 
 @router.delete("/{client_id}", status_code=204)
 async def delete_client(client_id: int, user=Depends(get_current_user)):
-    ctbl = models.Client.__table__
-    qtbl = models.Quote.__table__
-    owned = await database.fetch_one(
-        select(ctbl.c.id).where(and_(ctbl.c.id == client_id, ctbl.c.company_id == user["company_id"]))
-    )
-    if not owned:
+    # why: intégrité fonctionnelle simple (ses devis partent avec lui) ; une seule instruction
+    # -> contrôle de company, suppressions et vérification des FK en un aller-retour, atomiquement
+    deleted = await database.fetch_val(text(DELETE_CLIENT_SQL).bindparams(
+        client_id=client_id, company_id=user["company_id"],
+    ))
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Client not found")
-    # why: intégrité fonctionnelle simple
-    await database.execute(qtbl.delete().where(qtbl.c.client_id == client_id))
-    await database.execute(ctbl.delete().where(ctbl.c.id == client_id))
+    await report_cache.quotes_written(user["company_id"])  # ses devis ont disparu des rapports
     return None
\ No newline at end of file
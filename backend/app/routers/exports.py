@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from datetime import date, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, and_
+
+from app import models
+from app.deps import get_current_user, read_db
+
+# Exports BI : curseur côté serveur (db.iterate, réplique si configurée) -> mémoire constante quelle que soit
+# la taille du tenant ; les lignes sont sérialisées et envoyées par paquets de ~CHUNK_BYTES.
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+CHUNK_BYTES = 64 * 1024
+
+
+def _export_query(kind: str, company_id: int, date_from: date | None, date_to: date | None, status: str | None):
+    """(colonnes, requête) ; le filtre de dates porte sur la date métier de chaque type."""
+    ctbl = models.Client.__table__
+    qtbl = models.Quote.__table__
+    itbl = models.Invoice.__table__
+    ptbl = models.Payment.__table__
+    if kind == "clients":
+        cols = [ctbl.c.id, ctbl.c.name, ctbl.c.email, ctbl.c.phone]
+        table, date_col, status_col, owner = ctbl, None, None, ctbl.c.company_id
+    elif kind == "quotes":
+        cols = [qtbl.c.id, qtbl.c.number, qtbl.c.title, qtbl.c.status, qtbl.c.amount_cents,
+                qtbl.c.client_id, qtbl.c.created_at]
+        table, date_col, status_col, owner = qtbl, qtbl.c.created_at, qtbl.c.status, qtbl.c.company_id
+    elif kind == "invoices":
+        cols = [itbl.c.id, itbl.c.number, itbl.c.title, itbl.c.status, itbl.c.currency, itbl.c.total_cents,
+                itbl.c.paid_cents, itbl.c.balance_cents, itbl.c.client_id, itbl.c.issued_date, itbl.c.due_date]
+        table, date_col, status_col, owner = itbl, itbl.c.issued_date, itbl.c.status, itbl.c.company_id
+    else:
+        cols = [ptbl.c.id, ptbl.c.invoice_id, itbl.c.number.label("invoice_number"), ptbl.c.amount_cents,
+                ptbl.c.method, ptbl.c.paid_at, ptbl.c.note]
+        table = ptbl.join(itbl, itbl.c.id == ptbl.c.invoice_id)
+        date_col, status_col, owner = ptbl.c.paid_at, None, itbl.c.company_id
+    if (date_from or date_to) and date_col is None:
+        raise HTTPException(status_code=400, detail=f"{kind} export has no date filter")
+    if status and status_col is None:
+        raise HTTPException(status_code=400, detail=f"{kind} export has no status filter")
+    conds = [owner == company_id]
+    if date_from:
+        conds.append(date_col >= date_from)
+    if date_to:
+        # created_at est un timestamp : borne haute exclusive au lendemain
+        conds.append(date_col < date_to + timedelta(days=1))
+    if status:
+        conds.append(status_col == status)
+    stmt = select(*cols).select_from(table).where(and_(*conds)).order_by(cols[0])
+    return [c.name for c in cols], stmt
+
+
+def _cell(v):
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+
+async def _rows(db, stmt, names):
+    async for rec in db.iterate(stmt):
+        m = rec._mapping
+        yield [_cell(m[n]) for n in names]
+
+
+async def _csv_chunks(db, stmt, names):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(names)
+    async for row in _rows(db, stmt, names):
+        w.writerow(row)
+        if buf.tell() >= CHUNK_BYTES:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode()
+
+
+async def _ndjson_chunks(db, stmt, names):
+    parts: list[str] = []
+    size = 0
+    async for row in _rows(db, stmt, names):
+        line = json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n"
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts).encode()
+            parts, size = [], 0
+    yield "".join(parts).encode()
+
+
+async def _gzip(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = en-tête gzip
+    async for chunk in chunks:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+@router.get("/{kind}")
+async def export(
+    kind: Literal["clients", "quotes", "invoices", "payments"],
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    date_from: date | None = None,
+    date_to: date | None = None,
+    status: str | None = None,
+    gzip: bool = Query(False, description="Compress the file (.gz)"),
+    user=Depends(get_current_user),
+    db=Depends(read_db),
+):
+    names, stmt = _export_query(kind, user["company_id"], date_from, date_to, status)
+    chunks = _csv_chunks(db, stmt, names) if format == "csv" else _ndjson_chunks(db, stmt, names)
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    fname = f"{kind}.{format}"
+    if gzip:
+        chunks, media_type, fname = _gzip(chunks), "application/gzip", fname + ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{fname}"'},
+    )
@@ -1,16 +1,28 @@
 from __future__ import annotations
 
-from datetime import date
+from datetime import date, datetime
+import asyncio
 import io
+import logging
 import os
+import zipfile
+from functools import lru_cache
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse, HTMLResponse
-from sqlalchemy import select, and_
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, HTMLResponse, Response
+from sqlalchemy import select, and_, text
 
 from app.db import database
-from app import models
-from app.auth_utils import get_current_user, create_signed_token, verify_signed_token
+from app import models, schemas
+from app.pdf_cache import pdf_cache, content_key
+from app.pdf_render import pdf_renderer, RenderQueueFull, RenderTimeout
+from app.pagination import decode_cursor, keyset_page
+from app.auth_utils import create_signed_token, verify_signed_token
+from app.deps import get_current_user, read_db, read_only
+from app.read_routing import read_router
+from app.http_cache import cache_headers, conditional_json, not_modified, weak_etag
+
+logger = logging.getLogger("app.invoices")
 
 # Router "privé" (auth)
 router = APIRouter(prefix="/invoices", tags=["invoices"])
@@ -30,43 +42,57 @@ def _rec_to_dict(rec) -> dict:
 async def list_invoices(
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    cursor: bool = Query(False, description="Keyset mode: returns {items, next_cursor}"),
+    after: str | None = Query(None, description="next_cursor of the previous page"),
     user: dict = Depends(get_current_user),
+    db=Depends(read_db),
 ):
+    keyset = cursor or after is not None
     try:
-        if not getattr(database, 'is_connected', False):
-            return []
+        if not getattr(db, 'is_connected', False):
+            return {"items": [], "next_cursor": None} if keyset else []
     except Exception:
-        return []
+        return {"items": [], "next_cursor": None} if keyset else []
     itbl = models.Invoice.__table__
     q = (
         select(
             itbl.c.id, itbl.c.number, itbl.c.title, itbl.c.status,
-            itbl.c.currency, itbl.c.total_cents, itbl.c.issued_date,
-            itbl.c.due_date, itbl.c.client_id,
+            itbl.c.currency, itbl.c.total_cents, itbl.c.paid_cents,
+            itbl.c.balance_cents, itbl.c.issued_date, itbl.c.due_date, itbl.c.client_id,
         )
         .where(itbl.c.company_id == user["company_id"])
         .order_by(itbl.c.id.desc())
-        .limit(limit).offset(offset)
     )
-    rows = await database.fetch_all(q)
+    if keyset:
+        # why: keyset (company_id, id) au lieu d'OFFSET -> coût constant en profondeur
+        if after:
+            (last_id,) = decode_cursor(after, (int,))
+            q = q.where(itbl.c.id < last_id)
+        rows = await db.fetch_all(q.limit(limit + 1))
+        return keyset_page([_rec_to_dict(r) for r in rows], limit, ("id",))
+    rows = await db.fetch_all(q.limit(limit).offset(offset))
     return [_rec_to_dict(r) for r in rows]
 
 @router.get("/list")
 async def list_invoices_alias(
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    cursor: bool = Query(False, description="Keyset mode: returns {items, next_cursor}"),
+    after: str | None = Query(None, description="next_cursor of the previous page"),
     user: dict = Depends(get_current_user),
+    db=Depends(read_db),
 ):
     try:
-        if not getattr(database, 'is_connected', False):
-            return []
+        if not getattr(db, 'is_connected', False):
+            return {"items": [], "next_cursor": None} if (cursor or after is not None) else []
     except Exception:
-        return []
-    return await list_invoices(limit=limit, offset=offset, user=user)
+        return {"items": [], "next_cursor": None} if (cursor or after is not None) else []
+    return await list_invoices(limit=limit, offset=offset, cursor=cursor, after=after, user=user, db=db)
 
 @router.get("/by-id/{invoice_id:int}")
 async def get_invoice_by_id(
     invoice_id: int,
+    request: Request,
     user: dict = Depends(get_current_user),
 ):
     itbl = models.Invoice.__table__
@@ -76,7 +102,61 @@ async def get_invoice_by_id(
     rec = await database.fetch_one(q)
     if not rec:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    return _rec_to_dict(rec)
+    return conditional_json(request, _rec_to_dict(rec), rec["updated_at"] or rec["created_at"])
+
+# --- Détail composite : facture + client + lignes + paiements en UN aller-retour ---
+# Chaque section est une sous-requête JSON ; le document est assemblé par Postgres et renvoyé
+# tel quel (pas de re-sérialisation Python).
+DETAIL_SECTIONS = {
+    # search_tsv : colonne technique de recherche (cf. app/search.py), jamais exposée
+    "invoice": "to_jsonb(i) - 'search_tsv'",
+    "client": "(SELECT to_jsonb(c) - 'search_tsv' FROM clients c WHERE c.id = i.client_id)",
+    "lines": """COALESCE((
+      SELECT jsonb_agg(to_jsonb(l) ORDER BY l.id) FROM invoice_lines l WHERE l.invoice_id = i.id
+    ), '[]'::jsonb)""",
+    # solde restant après chaque paiement (somme cumulée, même ordre que GET /payments/{id})
+    "payments": """COALESCE((
+      SELECT jsonb_agg(to_jsonb(p) ORDER BY p.id) FROM (
+        SELECT id, invoice_id, amount_cents, method, paid_at, note,
+               i.total_cents - SUM(amount_cents) OVER (ORDER BY id) AS balance_after_cents
+        FROM payments WHERE invoice_id = i.id
+      ) p
+    ), '[]'::jsonb)""",
+}
+
+@lru_cache(maxsize=32)
+def _detail_sql(sections: tuple) -> str:
+    doc = ", ".join(f"'{name}', {DETAIL_SECTIONS[name]}" for name in sections)
+    return (
+        f"SELECT jsonb_build_object({doc})::text AS doc FROM invoices i "
+        "WHERE i.id = :invoice_id AND i.company_id = :company_id"
+    )
+
+@router.get("/by-id/{invoice_id:int}/detail")
+async def get_invoice_detail(
+    invoice_id: int,
+    request: Request,
+    fields: str | None = Query(None, description="Sections to return, e.g. invoice,client (default: all)"),
+    user: dict = Depends(get_current_user),
+):
+    """Écran facture : {invoice, client, lines, payments} ; `fields` limite les sections calculées."""
+    sections = tuple(DETAIL_SECTIONS)
+    if fields:
+        wanted = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = wanted - set(DETAIL_SECTIONS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        sections = tuple(name for name in DETAIL_SECTIONS if name in wanted)
+    doc = await database.fetch_val(
+        text(_detail_sql(sections)).bindparams(invoice_id=invoice_id, company_id=user["company_id"])
+    )
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    # lignes/paiements n'ont pas d'updated_at : ETag sur le document seul, sans Last-Modified
+    etag = weak_etag(doc)
+    return not_modified(request, etag) or Response(
+        content=doc, media_type="application/json", headers=cache_headers(etag)
+    )
 
 @router.get("/by-id/{invoice_id:int}/public_url")
 async def public_url_by_id(
@@ -85,23 +165,24 @@ async def public_url_by_id(
 ):
     """Retourne une URL publique signée pour télécharger le PDF."""
     itbl = models.Invoice.__table__
-    inv = await database.fetch_one(
-        select(itbl).where(and_(itbl.c.id == invoice_id, itbl.c.company_id == user["company_id"]))
+    # why: simple contrôle d'appartenance -> l'id suffit (pas la ligne complète)
+    found = await database.fetch_val(
+        select(itbl.c.id).where(and_(itbl.c.id == invoice_id, itbl.c.company_id == user["company_id"]))
     )
-    if not inv:
+    if found is None:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
     token = create_signed_token(
         kind="invoice_pdf",
-        data={"invoice_id": int(inv["id"]), "company_id": int(inv["company_id"])},
+        data={"invoice_id": int(found), "company_id": int(user["company_id"])},
         ttl_seconds=900,  # 15 min
     )
 
     base = os.getenv("PUBLIC_BASE_URL") or os.getenv("BASE_URL") or "http://localhost:8000"
-    url = f"{base}/public/{int(inv['id'])}/download.pdf?token={token}"
+    url = f"{base}/public/{int(found)}/download.pdf?token={token}"
     return {"url": url}
 
-def _render_pdf(inv, lines):
+def _invoice_html(inv, lines) -> str:
     total_cents = inv["total_cents"] or 0
     rows_html = "".join(
         f"<tr><td>{_rec_to_dict(l)['description']}</td>"
@@ -142,40 +223,196 @@ tfoot td {{ font-weight: bold; }}
 </body>
 </html>
 """.strip()
+    return html
+
+def _pdf_key(inv, lines) -> str:
+    return content_key(_rec_to_dict(inv), [_rec_to_dict(l) for l in lines])
 
-    from weasyprint import HTML
-    pdf_bytes = HTML(string=html, base_url=".").write_pdf()
+async def _render_pdf(inv, lines, wait: bool = False, key: str | None = None):
     fname = f"invoice_{inv['number'] or inv['id']}.pdf"
+    # why: le rendu WeasyPrint est l'opération la plus coûteuse de l'API -> cache par contenu
+    key = key or _pdf_key(inv, lines)
+    pdf_bytes = await pdf_cache.get_async(key)
+    if pdf_bytes is None:
+        # rendu hors boucle asyncio (pool de process) : un PDF ne bloque plus les autres requêtes
+        try:
+            pdf_bytes = await pdf_renderer.render(_invoice_html(inv, lines), wait=wait)
+        except RenderQueueFull as e:
+            raise HTTPException(
+                status_code=503,
+                detail="PDF rendering busy, retry later",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except RenderTimeout:
+            raise HTTPException(status_code=504, detail="PDF rendering timed out")
+        await pdf_cache.put_async(key, pdf_bytes, invoice_id=inv["id"])
     return fname, pdf_bytes
 
+async def _pdf_response(request: Request, inv, lines):
+    # why: l'ETag est la clé de contenu du PDF (facture + lignes) -> un 304 évite le rendu
+    # et la lecture du cache ; pas de Last-Modified (les lignes ne portent pas d'updated_at)
+    key = _pdf_key(inv, lines)
+    etag = f'W/"{key[:32]}"'
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    fname, pdf_bytes = await _render_pdf(inv, lines, key=key)
+    return StreamingResponse(
+        io.BytesIO(pdf_bytes),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{fname}"', **cache_headers(etag)},
+    )
+
 @router.get("/by-id/{invoice_id:int}/download.pdf")
 async def download_invoice_pdf(
     invoice_id: int,
+    request: Request,
     user: dict = Depends(get_current_user),
+    db=Depends(read_db),
 ):
     itbl = models.Invoice.__table__
     ltbl = models.InvoiceLine.__table__
 
-    inv = await database.fetch_one(
+    inv = await db.fetch_one(
         select(itbl).where(and_(itbl.c.id == invoice_id, itbl.c.company_id == user["company_id"]))
     )
     if not inv:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    lines = await database.fetch_all(
+    lines = await db.fetch_all(
         select(ltbl).where(ltbl.c.invoice_id == invoice_id).order_by(ltbl.c.id.asc())
     )
 
-    fname, pdf_bytes = _render_pdf(inv, lines)
+    return await _pdf_response(request, inv, lines)
+
+# --- Export en masse : ZIP streamé ---
+EXPORT_MAX_INVOICES = int(os.getenv("PDF_EXPORT_MAX_INVOICES", "2000"))
+
+class _ZipSink(io.RawIOBase):
+    """Flux non 'seekable' : zipfile écrit des data descriptors et on vide le tampon après chaque PDF."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def _fetch_export_batch(db, payload: schemas.InvoiceExportRequest, company_id: int):
+    """Factures + lignes en UNE requête (LEFT JOIN), regroupées par facture."""
+    itbl = models.Invoice.__table__
+    ltbl = models.InvoiceLine.__table__
+    conds = [itbl.c.company_id == company_id]
+    if payload.ids:
+        conds.append(itbl.c.id.in_(payload.ids))
+    if payload.status:
+        conds.append(itbl.c.status == payload.status)
+    if payload.client_id is not None:
+        conds.append(itbl.c.client_id == payload.client_id)
+    if payload.date_from:
+        conds.append(itbl.c.issued_date >= payload.date_from)
+    if payload.date_to:
+        conds.append(itbl.c.issued_date <= payload.date_to)
+    ids = (
+        select(itbl.c.id).where(and_(*conds))
+        .order_by(itbl.c.id.asc()).limit(EXPORT_MAX_INVOICES + 1)
+        .scalar_subquery()
+    )
+    line_cols = [c.label(f"line__{c.name}") for c in ltbl.c]
+    q = (
+        select(itbl, *line_cols)
+        .select_from(itbl.outerjoin(ltbl, ltbl.c.invoice_id == itbl.c.id))
+        .where(itbl.c.id.in_(ids))
+        .order_by(itbl.c.id.asc(), ltbl.c.id.asc())
+    )
+    rows = await db.fetch_all(q)
+    items: dict[int, tuple[dict, list[dict]]] = {}
+    for r in rows:
+        m = _rec_to_dict(r)
+        inv_id = m["id"]
+        if inv_id not in items:
+            # mêmes clés que select(itbl) -> même clé de cache que le téléchargement unitaire
+            items[inv_id] = ({c.name: m[c.name] for c in itbl.c}, [])
+        if m["line__id"] is not None:
+            items[inv_id][1].append({c.name: m[f"line__{c.name}"] for c in ltbl.c})
+    return list(items.values())
+
+async def _zip_stream(items):
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)  # PDF déjà compressés
+    # why: fenêtre bornée -> les PDF terminés ne s'accumulent pas si le client lit lentement
+    window = pdf_renderer.workers * 2
+    pending: dict[asyncio.Future, dict] = {}
+    todo = iter(items)
+    errors: list[str] = []
+
+    def _fill():
+        for inv, lines in todo:
+            pending[asyncio.ensure_future(_render_pdf(inv, lines, wait=True))] = inv
+            if len(pending) >= window:
+                return
+
+    try:
+        _fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                inv = pending.pop(task)
+                # why: une exception qui sort du générateur tronque un ZIP déjà parti en 200
+                try:
+                    fname, pdf_bytes = task.result()
+                except HTTPException as e:
+                    errors.append(f"{inv['number'] or inv['id']}: {e.detail}")
+                    continue
+                except Exception as e:
+                    logger.exception("export: PDF render failed for invoice %s", inv["id"])
+                    errors.append(f"{inv['number'] or inv['id']}: {type(e).__name__}: {e}")
+                    continue
+                zf.writestr(fname, pdf_bytes)
+                yield sink.drain()
+            _fill()
+        if errors:
+            zf.writestr("ERRORS.txt", "\n".join(errors))
+        zf.close()
+        yield sink.drain()
+    finally:
+        for task in pending:
+            task.cancel()
+
+@router.post("/export.zip")
+@read_only
+async def export_invoices_zip(
+    payload: schemas.InvoiceExportRequest,
+    user: dict = Depends(get_current_user),
+    db=Depends(read_db),
+):
+    """Archive ZIP des PDF sélectionnés (ids ou filtre), streamée au fil des rendus."""
+    items = await _fetch_export_batch(db, payload, user["company_id"])
+    if not items:
+        raise HTTPException(status_code=404, detail="No invoice matches the filter")
+    if len(items) > EXPORT_MAX_INVOICES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many invoices (max {EXPORT_MAX_INVOICES}), narrow the filter",
+        )
+    fname = f"invoices_{datetime.utcnow():%Y%m%d_%H%M%S}.zip"
     return StreamingResponse(
-        io.BytesIO(pdf_bytes),
-        media_type="application/pdf",
+        _zip_stream(items),
+        media_type="application/zip",
         headers={"Content-Disposition": f'attachment; filename="{fname}"'},
     )
 
 # --- PUBLIC : /public/{invoice_id}/download.pdf?token=... ---
 @public_router.get("/public/{invoice_id:int}/download.pdf")
-async def public_download_invoice_pdf(invoice_id: int, token: str):
+async def public_download_invoice_pdf(invoice_id: int, token: str, request: Request):
     """Téléchargement PDF public via token signé (pas d'auth)."""
     try:
         data = verify_signed_token(token, expected_kind="invoice_pdf")
@@ -188,22 +425,17 @@ async def public_download_invoice_pdf(invoice_id: int, token: str):
 
     itbl = models.Invoice.__table__
     ltbl = models.InvoiceLine.__table__
+    company_id = int(data.get("company_id", -1))
+    db = await read_router.for_read(company_id)
 
-    inv = await database.fetch_one(
-        select(itbl).where(
-            and_(itbl.c.id == invoice_id, itbl.c.company_id == int(data.get("company_id", -1)))
-        )
+    inv = await db.fetch_one(
+        select(itbl).where(and_(itbl.c.id == invoice_id, itbl.c.company_id == company_id))
     )
     if not inv:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    lines = await database.fetch_all(
+    lines = await db.fetch_all(
         select(ltbl).where(ltbl.c.invoice_id == invoice_id).order_by(ltbl.c.id.asc())
     )
 
-    fname, pdf_bytes = _render_pdf(inv, lines)
-    return StreamingResponse(
-        io.BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{fname}"'},
-    )
+    return await _pdf_response(request, inv, lines)
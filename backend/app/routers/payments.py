@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, and_, func
+import os
+from collections import defaultdict
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import select, and_, text
 from app.db import database
 from app import models, schemas
-from app.deps import get_current_user
+from app.deps import get_current_user, mark_write, read_db
+from app.pdf_cache import pdf_cache
+from app.stream_parse import request_rows
+
+IMPORT_BATCH_SIZE = int(os.getenv("PAYMENT_IMPORT_BATCH_SIZE", "500"))
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
@@ -13,29 +21,156 @@ async def _invoice_owned(invoice_id: int, company_id: int):
         raise HTTPException(status_code=404, detail="Invoice not found")
     return row
 
+# why: une seule instruction -> contrôle de company, cumul paid_cents, statut et INSERT.
+# L'UPDATE verrouille la ligne facture : deux paiements concurrents se sérialisent et le
+# second voit le paid_cents du premier (plus de course sur le passage à "paid").
+ADD_PAYMENT_SQL = """
+WITH inv AS (
+  UPDATE invoices
+     SET paid_cents = paid_cents + CAST(:amount AS bigint),
+         status = CASE WHEN total_cents > 0 AND paid_cents + CAST(:amount AS bigint) >= total_cents
+                       THEN 'paid' ELSE status END,
+         updated_at = now()
+   WHERE id = :invoice_id AND company_id = :company_id
+  RETURNING id
+)
+INSERT INTO payments (invoice_id, amount_cents, method, paid_at, note)
+SELECT id, CAST(:amount AS bigint), CAST(:method AS varchar), CAST(:paid_at AS date), CAST(:note AS varchar)
+FROM inv
+RETURNING id, invoice_id, amount_cents, method, paid_at, note
+"""
+
+# why: contrôle d'appartenance du lot en une requête ; FOR UPDATE ... ORDER BY id verrouille
+# les factures dans un ordre stable (pas d'interblocage avec add_payment ou un autre import).
+OWNED_INVOICES_SQL = """
+SELECT id, number FROM invoices
+WHERE company_id = :company_id
+  AND (id = ANY(CAST(:ids AS integer[])) OR number = ANY(CAST(:numbers AS varchar[])))
+ORDER BY id
+FOR UPDATE
+"""
+
+# INSERT multi-lignes via unnest ; RETURNING suit l'ordre du SELECT (ORDER BY ord)
+INSERT_PAYMENTS_SQL = """
+INSERT INTO payments (invoice_id, amount_cents, method, paid_at, note)
+SELECT t.invoice_id, t.amount_cents, t.method, t.paid_at, t.note
+FROM unnest(CAST(:invoice_ids AS integer[]), CAST(:amounts AS bigint[]), CAST(:methods AS varchar[]),
+            CAST(:paid_ats AS date[]), CAST(:notes AS varchar[]))
+     WITH ORDINALITY AS t(invoice_id, amount_cents, method, paid_at, note, ord)
+ORDER BY t.ord
+RETURNING id
+"""
+
+# une seule instruction pour toutes les factures touchées par le lot
+APPLY_PAYMENTS_SQL = """
+UPDATE invoices i
+   SET paid_cents = i.paid_cents + d.amount,
+       status = CASE WHEN i.total_cents > 0 AND i.paid_cents + d.amount >= i.total_cents
+                     THEN 'paid' ELSE i.status END,
+       updated_at = now()
+  FROM unnest(CAST(:ids AS integer[]), CAST(:amounts AS bigint[])) AS d(id, amount)
+ WHERE i.id = d.id
+"""
+
+def _error_text(exc: ValueError) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            (".".join(str(p) for p in e["loc"]) + ": " if e["loc"] else "") + e["msg"]
+            for e in exc.errors()
+        )
+    return str(exc)
+
+async def _import_batch(batch, company_id: int) -> list:
+    """batch : [(n° de ligne, PaymentImportRow)] -> résultats ; une transaction par lot."""
+    results = []
+    accepted = []
+    async with database.transaction():
+        owned = await database.fetch_all(text(OWNED_INVOICES_SQL).bindparams(
+            company_id=company_id,
+            ids=sorted({p.invoice_id for _, p in batch if p.invoice_id is not None}),
+            numbers=sorted({p.invoice_number for _, p in batch if p.invoice_number}),
+        ))
+        ids = {r["id"] for r in owned}
+        by_number = {r["number"]: r["id"] for r in owned}
+        for n, p in batch:
+            iid = p.invoice_id if p.invoice_id is not None else by_number.get(p.invoice_number)
+            if iid not in ids:
+                results.append(schemas.PaymentImportResult(row=n, ok=False, error="Invoice not found"))
+            elif p.invoice_number and by_number.get(p.invoice_number) != iid:
+                results.append(schemas.PaymentImportResult(
+                    row=n, ok=False, invoice_id=iid, error="invoice_number does not match invoice_id"))
+            else:
+                accepted.append((n, iid, p))
+        if not accepted:
+            return results
+        pids = await database.fetch_all(text(INSERT_PAYMENTS_SQL).bindparams(
+            invoice_ids=[iid for _, iid, _ in accepted],
+            amounts=[int(p.amount_cents) for _, _, p in accepted],
+            methods=[p.method for _, _, p in accepted],
+            paid_ats=[p.paid_at for _, _, p in accepted],
+            notes=[p.note for _, _, p in accepted],
+        ))
+        totals = defaultdict(int)
+        for _, iid, p in accepted:
+            totals[iid] += int(p.amount_cents)
+        await database.execute(text(APPLY_PAYMENTS_SQL).bindparams(
+            ids=list(totals), amounts=list(totals.values()),
+        ))
+    for invoice_id in totals:
+        await pdf_cache.invalidate_async(invoice_id)
+    results.extend(
+        schemas.PaymentImportResult(row=n, ok=True, payment_id=r["id"], invoice_id=iid)
+        for (n, iid, _), r in zip(accepted, pids)
+    )
+    return results
+
+@router.post("/bulk", response_model=schemas.PaymentImportReport)
+async def import_payments(request: Request, user=Depends(get_current_user)):
+    """
+    Import de relevé : corps CSV (en-tête invoice_id/invoice_number, amount_cents, method,
+    paid_at, note) ou tableau JSON, lu en flux et traité par lots de IMPORT_BATCH_SIZE.
+    Les lignes invalides n'empêchent pas les autres : le rapport donne le sort de chaque ligne.
+    """
+    company_id = user["company_id"]
+    results = []
+    batch = []
+    row = 0
+    async for raw in request_rows(request):
+        row += 1
+        try:
+            if not isinstance(raw, dict):
+                raise ValueError("row must be an object")
+            batch.append((row, schemas.PaymentImportRow.model_validate(raw)))
+        except ValueError as e:
+            results.append(schemas.PaymentImportResult(row=row, ok=False, error=_error_text(e)))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            results.extend(await _import_batch(batch, company_id))
+            batch = []
+    if batch:
+        results.extend(await _import_batch(batch, company_id))
+    results.sort(key=lambda r: r.row)
+    await mark_write(user)
+    created = sum(1 for r in results if r.ok)
+    return schemas.PaymentImportReport(created=created, failed=len(results) - created, results=results)
+
 @router.post("/{invoice_id}", response_model=schemas.PaymentOut)
 async def add_payment(invoice_id: int, payload: schemas.PaymentCreate, user=Depends(get_current_user)):
-    inv = await _invoice_owned(invoice_id, user["company_id"])
-    ptbl = models.Payment.__table__
-    itbl = models.Invoice.__table__
-    pid = await database.execute(ptbl.insert().values(
-        invoice_id=invoice_id,
-        amount_cents=int(payload.amount_cents),
+    row = await database.fetch_one(text(ADD_PAYMENT_SQL).bindparams(
+        amount=int(payload.amount_cents),
         method=payload.method,
         paid_at=payload.paid_at,
-        note=payload.note
+        note=payload.note,
+        invoice_id=invoice_id,
+        company_id=user["company_id"],
     ))
-    # recalcul statut payÃ© si somme >= total
-    paid_sum = await database.fetch_val(select(func.coalesce(func.sum(ptbl.c.amount_cents),0)).where(ptbl.c.invoice_id==invoice_id))
-    new_status = "paid" if int(paid_sum or 0) >= int(inv["total_cents"] or 0) and int(inv["total_cents"] or 0) > 0 else None
-    if new_status:
-        await database.execute(itbl.update().where(itbl.c.id==invoice_id).values(status=new_status))
-    row = await database.fetch_one(select(ptbl).where(ptbl.c.id==pid))
+    if not row:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    await pdf_cache.invalidate_async(invoice_id)
     return dict(row)
 
 @router.get("/{invoice_id}", response_model=list[schemas.PaymentOut])
-async def list_payments(invoice_id: int, user=Depends(get_current_user)):
+async def list_payments(invoice_id: int, user=Depends(get_current_user), db=Depends(read_db)):
     await _invoice_owned(invoice_id, user["company_id"])
     ptbl = models.Payment.__table__
-    rows = await database.fetch_all(select(ptbl).where(ptbl.c.invoice_id==invoice_id).order_by(ptbl.c.id.asc()))
+    rows = await db.fetch_all(select(ptbl).where(ptbl.c.invoice_id==invoice_id).order_by(ptbl.c.id.asc()))
     return [dict(r) for r in rows]
\ No newline at end of file
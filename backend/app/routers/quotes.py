@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, and_, func
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select, and_, exists
 from app.db import database
 from app import models, schemas
-from app.deps import get_current_user
+from app.deps import get_current_user, mark_write, read_db
+from app.numbering import next_number
+from app.bulk_import import import_quotes
+from app.stream_parse import request_csv
+from app.http_cache import conditional_json
+from app.report_cache import report_cache
+from app.crud import insert_returning, update_returning, delete_owned
+from app.pagination import decode_cursor, keyset_page
 
 router = APIRouter(prefix="/quotes", tags=["quotes"])
 
@@ -19,44 +25,64 @@ async def _ensure_client_in_company(client_id: int, company_id: int):
         raise HTTPException(status_code=400, detail="Client not in your company")
 
 
-def _make_number(seq: int) -> str:
-    y = datetime.utcnow().year
-    return f"Q-{y}-{seq:04d}"
-
-
 @router.post("/", response_model=schemas.QuoteOut)
 async def create_quote(payload: schemas.QuoteCreate, user=Depends(get_current_user)):
     await _ensure_client_in_company(payload.client_id, user["company_id"])
     qtbl = models.Quote.__table__
-    # why: numéro lisible et incrémental par company
-    count = await database.fetch_val(
-        select(func.count())
-        .select_from(qtbl)
-        .where(qtbl.c.company_id == user["company_id"])
-    )
-    number = _make_number(int(count) + 1)
-    qid = await database.execute(
-        qtbl.insert().values(
+    # why: numéro lisible et incrémental par company, réservé dans la transaction de l'INSERT
+    async with database.transaction():
+        number = await next_number("quote", user["company_id"])
+        row = await insert_returning(qtbl, dict(
             number=number,
             title=payload.title,
             amount_cents=payload.amount_cents,
             status=payload.status or "draft",
             client_id=payload.client_id,
             company_id=user["company_id"],
-        )
-    )
-    row = await database.fetch_one(select(qtbl).where(qtbl.c.id == qid))
+        ))
+    # why: les agrégats sont à jour dès le COMMIT (trigger) -> le cache des rapports doit suivre
+    await report_cache.quotes_written(user["company_id"])
     return dict(row)
 
 
-@router.get("/", response_model=list[schemas.QuoteOut])
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_quotes_csv(
+    request: Request,
+    create_clients: bool = Query(default=True, description="Create clients referenced by an unknown client_name"),
+    user=Depends(get_current_user),
+):
+    """CSV (client_id ou client_name, title, amount_cents, status, created_at) chargé par COPY."""
+    try:
+        report = await import_quotes(user["company_id"], request_csv(request), create_clients)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await report_cache.quotes_written(user["company_id"])
+    await mark_write(user)
+    return report
+
+
+@router.get("/", response_model=list[schemas.QuoteOut] | schemas.QuotePage)
 async def list_quotes(
     status: str | None = None,
     limit: int = 50,
     offset: int = 0,
+    cursor: bool = Query(default=False, description="Keyset mode: returns {items, next_cursor}"),
+    after: str | None = Query(default=None, description="next_cursor of the previous page"),
     user=Depends(get_current_user),
+    db=Depends(read_db),
 ):
     qtbl = models.Quote.__table__
+    if cursor or after is not None:
+        # why: keyset (company_id, id) -> la page 5000 coûte autant que la page 1
+        conds = [qtbl.c.company_id == user["company_id"]]
+        if status:
+            conds.append(qtbl.c.status == status)
+        if after:
+            (last_id,) = decode_cursor(after, (int,))
+            conds.append(qtbl.c.id < last_id)
+        stmt = select(qtbl).where(and_(*conds)).order_by(qtbl.c.id.desc()).limit(limit + 1)
+        rows = await db.fetch_all(stmt)
+        return keyset_page([dict(r) for r in rows], limit, ("id",))
     stmt = (
         select(qtbl)
         .where(qtbl.c.company_id == user["company_id"])
@@ -74,12 +100,12 @@ async def list_quotes(
             .limit(limit)
             .offset(offset)
         )
-    rows = await database.fetch_all(stmt)
+    rows = await db.fetch_all(stmt)
     return [dict(r) for r in rows]
 
 
 @router.get("/{quote_id}", response_model=schemas.QuoteOut)
-async def get_quote(quote_id: int, user=Depends(get_current_user)):
+async def get_quote(quote_id: int, request: Request, user=Depends(get_current_user)):
     qtbl = models.Quote.__table__
     row = await database.fetch_one(
         select(qtbl).where(
@@ -88,7 +114,8 @@ async def get_quote(quote_id: int, user=Depends(get_current_user)):
     )
     if not row:
         raise HTTPException(status_code=404, detail="Quote not found")
-    return dict(row)
+    # why: le front interroge en boucle -> 304 sans corps tant que le devis n'a pas changé
+    return conditional_json(request, schemas.QuoteOut(**dict(row)), row["updated_at"] or row["created_at"])
 
 
 @router.patch("/{quote_id}", response_model=schemas.QuoteOut)
@@ -96,41 +123,27 @@ async def update_quote(
     quote_id: int, payload: schemas.QuoteUpdate, user=Depends(get_current_user)
 ):
     qtbl = models.Quote.__table__
-    existing = await database.fetch_one(
-        select(qtbl).where(
-            and_(qtbl.c.id == quote_id, qtbl.c.company_id == user["company_id"])
-        )
-    )
-    if not existing:
-        raise HTTPException(status_code=404, detail="Quote not found")
-    data = existing._mapping.copy()
+    ctbl = models.Client.__table__
     update = payload.model_dump(exclude_unset=True)
-    if "client_id" in update and update["client_id"] is not None:
-        await _ensure_client_in_company(int(update["client_id"]), user["company_id"])
-    data.update(update)
-    await database.execute(
-        qtbl.update()
-        .where(qtbl.c.id == quote_id)
-        .values(
-            title=data["title"],
-            amount_cents=data["amount_cents"],
-            status=data["status"],
-            client_id=data["client_id"],
-        )
-    )
-    row = await database.fetch_one(select(qtbl).where(qtbl.c.id == quote_id))
+    conditions = []
+    new_client = update.get("client_id")
+    if new_client is not None:
+        # why: client contrôlé dans le WHERE de l'UPDATE -> un seul aller-retour si tout va bien
+        conditions.append(exists().where(and_(ctbl.c.id == int(new_client), ctbl.c.company_id == user["company_id"])))
+    # why: seuls les champs fournis sont écrits ; contrôle de company dans le WHERE
+    row = await update_returning(qtbl, quote_id, user["company_id"], update, *conditions)
+    if not row:
+        if new_client is not None:
+            await _ensure_client_in_company(int(new_client), user["company_id"])  # 400 si c'est le client
+        raise HTTPException(status_code=404, detail="Quote not found")
+    await report_cache.quotes_written(user["company_id"])
     return dict(row)
 
 
 @router.delete("/{quote_id}", status_code=204)
 async def delete_quote(quote_id: int, user=Depends(get_current_user)):
     qtbl = models.Quote.__table__
-    owned = await database.fetch_one(
-        select(qtbl.c.id).where(
-            and_(qtbl.c.id == quote_id, qtbl.c.company_id == user["company_id"])
-        )
-    )
-    if not owned:
+    if not await delete_owned(qtbl, quote_id, user["company_id"]):
         raise HTTPException(status_code=404, detail="Quote not found")
-    await database.execute(qtbl.delete().where(qtbl.c.id == quote_id))
+    await report_cache.quotes_written(user["company_id"])
     return None
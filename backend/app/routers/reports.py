@@ -1,39 +1,58 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy import text
-from app.db import database
-from app.deps import get_current_user
-from app.reporting import refresh_matviews
+from app.deps import get_current_user, read_db
+from app.reporting import REPORTING_SOURCE, report_refresher
+from app.report_cache import report_cache
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
+_AGG = REPORTING_SOURCE == "aggregates"
+STATUS_TABLE = "report_quotes_by_status" if _AGG else "mv_quotes_by_status"
+MONTHLY_TABLE = "report_monthly_revenue" if _AGG else "mv_monthly_revenue"
+
+def _queue_refresh(company_id: int) -> dict:
+    # why: jamais de refresh inline ; agrégats -> réconciliation de la company, matviews -> refresh global fusionné
+    return report_refresher.request(company_id if _AGG else None)
+
 @router.post("/refresh", status_code=202)
 async def reports_refresh(user=Depends(get_current_user)):
-    await refresh_matviews()
-    return {"refreshed": True}
+    return {"source": REPORTING_SOURCE, **_queue_refresh(user["company_id"])}
+
+@router.get("/freshness")
+async def reports_freshness(user=Depends(get_current_user)):
+    return {"source": REPORTING_SOURCE, **report_refresher.status(user["company_id"])}
 
 @router.get("/status")
-async def reports_status(refresh: bool = False, user=Depends(get_current_user)):
+async def reports_status(refresh: bool = False, user=Depends(get_current_user), db=Depends(read_db)):
     if refresh:
-        await refresh_matviews()
-    sql = text("""
+        _queue_refresh(user["company_id"])
+    sql = text(f"""
         SELECT status, count, amount_cents
-        FROM mv_quotes_by_status
+        FROM {STATUS_TABLE}
         WHERE company_id = :cid
         ORDER BY status
     """).bindparams(cid=user["company_id"])
-    rows = await database.fetch_all(sql)
-    return [dict(r) for r in rows]
+
+    async def compute():
+        return [dict(r) for r in await db.fetch_all(sql)]
+
+    return await report_cache.get_or_compute(user["company_id"], "status", {}, compute)
 
 @router.get("/monthly")
-async def reports_monthly(months: int = Query(12, ge=1, le=36), refresh: bool = False, user=Depends(get_current_user)):
+async def reports_monthly(months: int = Query(12, ge=1, le=36), refresh: bool = False,
+                          user=Depends(get_current_user), db=Depends(read_db)):
     if refresh:
-        await refresh_matviews()
+        _queue_refresh(user["company_id"])
     sql = text(f"""
         SELECT month, amount_cents
-        FROM mv_monthly_revenue
+        FROM {MONTHLY_TABLE}
         WHERE company_id = :cid
           AND month >= date_trunc('month', now()) - INTERVAL '{months-1} months'
         ORDER BY month ASC
     """).bindparams(cid=user["company_id"])
-    rows = await database.fetch_all(sql)
-    return [{"month": r["month"].strftime("%Y-%m"), "amount_cents": int(r["amount_cents"])} for r in rows]
\ No newline at end of file
+
+    async def compute():
+        rows = await db.fetch_all(sql)
+        return [{"month": r["month"].strftime("%Y-%m"), "amount_cents": int(r["amount_cents"])} for r in rows]
+
+    return await report_cache.get_or_compute(user["company_id"], "monthly", {"months": months}, compute)
\ No newline at end of file
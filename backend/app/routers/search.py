@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app import schemas
+from app.deps import get_current_user
+from app.search import SEARCH_DOCUMENTS, search
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("/", response_model=list[schemas.SearchHit])
+async def search_all(
+    q: str = Query(..., min_length=2, max_length=100),
+    types: str | None = Query(None, description="Comma-separated subset of clients,quotes,invoices"),
+    limit: int = Query(20, ge=1, le=100),
+    user=Depends(get_current_user),
+):
+    """Recherche classée, préfixée (autocomplétion) dans les clients, devis et factures de la company."""
+    tables = list(SEARCH_DOCUMENTS)
+    if types:
+        wanted = {t.strip() for t in types.split(",") if t.strip()}
+        unknown = wanted - set(SEARCH_DOCUMENTS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(sorted(unknown))}")
+        tables = [t for t in SEARCH_DOCUMENTS if t in wanted]
+    return await search(user["company_id"], q, tables, limit)
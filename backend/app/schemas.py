@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator
 from typing import Optional, List
 from datetime import date
 
@@ -39,6 +39,10 @@ class ClientOut(ClientBase):
     model_config = ConfigDict()
     # TODO(pydantic v2): vérifier -> from_attributes = True
 
+class ClientPage(BaseModel):
+    items: List[ClientOut]
+    next_cursor: Optional[str] = None
+
 # ---- Quotes ----
 class QuoteBase(BaseModel):
     title: str = Field(min_length=1, max_length=200)
@@ -61,6 +65,10 @@ class QuoteOut(QuoteBase):
     model_config = ConfigDict()
     # TODO(pydantic v2): vérifier -> from_attributes = True
 
+class QuotePage(BaseModel):
+    items: List[QuoteOut]
+    next_cursor: Optional[str] = None
+
 # ---- Invoices ----
 class InvoiceLineCreate(BaseModel):
     description: str = Field(min_length=1, max_length=300)
@@ -91,6 +99,14 @@ class InvoiceUpdate(BaseModel):
     due_date: Optional[date] = None
     currency: Optional[str] = None
 
+class InvoiceExportRequest(BaseModel):
+    """Sélection pour l'export ZIP : liste d'ids et/ou filtre (date d'émission, statut, client)."""
+    ids: Optional[List[int]] = Field(default=None, max_length=10000)
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    status: Optional[str] = None
+    client_id: Optional[int] = None
+
 class InvoiceOut(BaseModel):
     id: int
     number: str
@@ -98,6 +114,8 @@ class InvoiceOut(BaseModel):
     status: str
     currency: str
     total_cents: int
+    paid_cents: int = 0
+    balance_cents: Optional[int] = None
     client_id: int
     issued_date: Optional[date] = None
     due_date: Optional[date] = None
@@ -115,4 +133,49 @@ class PaymentOut(PaymentCreate):
     id: int
     invoice_id: int
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PaymentImportRow(PaymentCreate):
+    """Ligne d'import (relevé bancaire) : facture désignée par id ou par numéro."""
+    invoice_id: Optional[int] = None
+    invoice_number: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _needs_invoice(self):
+        if self.invoice_id is None and not self.invoice_number:
+            raise ValueError("invoice_id or invoice_number is required")
+        return self
+
+class PaymentImportResult(BaseModel):
+    row: int                                   # 1 = première ligne de données
+    ok: bool
+    payment_id: Optional[int] = None
+    invoice_id: Optional[int] = None
+    error: Optional[str] = None
+
+class PaymentImportReport(BaseModel):
+    created: int
+    failed: int
+    results: List[PaymentImportResult]
+
+# ---- Imports (COPY) ----
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    staged: int                                # lignes lues dans le CSV
+    inserted: int
+    updated: int = 0
+    skipped: int = 0                           # doublons (fichier ou déjà en base)
+    rejected: int = 0
+    clients_created: int = 0
+    errors: List[ImportRowError] = []
+
+# ---- Recherche ----
+class SearchHit(BaseModel):
+    type: str                                  # client / quote / invoice
+    id: int
+    label: str
+    detail: Optional[str] = None
+    rank: float
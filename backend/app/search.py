@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+
+from app.db import database
+
+# Recherche unifiée clients / devis / factures.
+# - toujours : colonne générée search_tsv (tsvector 'simple' : pas de racinisation, numéros
+#   et noms propres restent intacts) indexée en GIN + requêtes préfixées (tok:*) pour
+#   l'autocomplétion ; stockée plutôt que recalculée -> ts_rank ne reparse pas chaque ligne ;
+# - si pg_trgm est disponible : index trigram sur le libellé -> sous-chaînes (ILIKE) et
+#   similarité dans le classement. Sans l'extension, on reste sur le seul tsvector.
+# search_tsv est volontairement absente de app/models.py : select(table) ne la renvoie jamais.
+
+SEARCH_DOCUMENTS = {
+    # e-mail découpé (@ et . -> espaces) : "dupontel" retrouve contact@dupontel.fr
+    "clients": "to_tsvector('simple', coalesce(name, '') || ' ' || translate(coalesce(email, ''), '@.', '  '))",
+    "quotes": "to_tsvector('simple', coalesce(number, '') || ' ' || coalesce(title, ''))",
+    "invoices": "to_tsvector('simple', coalesce(number, '') || ' ' || coalesce(title, ''))",
+}
+# (type renvoyé, libellé, détail) ; le libellé porte l'index trigram
+SEARCH_FIELDS = {
+    "clients": ("client", "name", "email"),
+    "quotes": ("quote", "title", "number"),
+    "invoices": ("invoice", "title", "number"),
+}
+
+SEARCH_INDEX_SQL = [
+    stmt
+    for table, doc in SEARCH_DOCUMENTS.items()
+    for stmt in (
+        f"ALTER TABLE public.{table} ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS ({doc}) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON public.{table} USING gin (search_tsv)",
+    )
+] + [
+    # pg_trgm absent ou droits insuffisants : on continue sans (recherche tsvector seule)
+    """
+    DO $$
+    BEGIN
+      IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS ix_clients_name_trgm ON public.clients USING gin (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ix_quotes_title_trgm ON public.quotes USING gin (title gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ix_invoices_title_trgm ON public.invoices USING gin (title gin_trgm_ops);
+      END IF;
+    EXCEPTION WHEN insufficient_privilege THEN
+      RAISE NOTICE 'pg_trgm unavailable: %', SQLERRM;
+    END $$;
+    """,
+]
+
+MAX_TOKENS = 8
+# why: le parseur texte de Postgres ne découpe pas comme \w+ ("F-2024-0001" -> f, -2024, -0001 ;
+# "5e82304a" -> flottant 5e82304 + a). On accepte donc aussi les préfixes des lexèmes que le
+# parseur produit pour la saisie elle-même : un numéro tapé tel qu'affiché retrouve toujours sa ligne.
+# Le cast ::tsquery prend les lexèmes tels quels (to_tsquery les redécouperait).
+TSQUERY_SQL = (
+    "(to_tsquery('simple', :tsq) || coalesce((SELECT string_agg("
+    "'''' || replace(lexeme, '''', '''''') || ''':*', ' & ')::tsquery"
+    " FROM unnest(to_tsvector('simple', :q))), to_tsquery('simple', :tsq)))"
+)
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_trgm: Optional[bool] = None
+
+
+def prefix_tsquery(q: str) -> str:
+    """'Dupont SA' -> 'dupont:* & sa:*' (jetons alphanumériques uniquement : pas d'injection tsquery)."""
+    tokens = _TOKEN.findall(q.lower())[:MAX_TOKENS]
+    return " & ".join(f"{t}:*" for t in tokens)
+
+
+async def trgm_available() -> bool:
+    global _trgm
+    if _trgm is None:
+        _trgm = bool(await database.fetch_val("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"))
+    return _trgm
+
+
+def _branch(table: str, trgm: bool, company_id: int) -> str:
+    kind, label, detail = SEARCH_FIELDS[table]
+    match = f"search_tsv @@ {TSQUERY_SQL}"
+    rank = f"ts_rank(search_tsv, {TSQUERY_SQL})"
+    if trgm:
+        match = f"({match} OR {label} ILIKE :like)"
+        rank = f"{rank} + similarity({label}, :q)"
+    return (
+        f"(SELECT '{kind}' AS type, id, {label} AS label, {detail} AS detail, ({rank})::real AS rank "
+        f"FROM {table} WHERE company_id = {int(company_id)} AND {match} ORDER BY rank DESC, id DESC LIMIT :limit)"
+    )
+
+
+def search_sql(tables: Sequence[str], trgm: bool, company_id: int) -> str:
+    # why: company_id en littéral (entier, pas d'injection possible). En paramètre, le plan générique
+    # que Postgres adopte après 5 exécutions d'une requête préparée estime la part du tenant en
+    # moyenne ; pour un gros tenant il combine alors l'index company_id au GIN et relit tout le
+    # tenant (~90 ms sur 1M de lignes au lieu de 2 ms). En littéral, chaque tenant a son plan.
+    union = "\nUNION ALL\n".join(_branch(t, trgm, company_id) for t in tables)
+    return f"SELECT * FROM (\n{union}\n) hits ORDER BY rank DESC, type, id DESC LIMIT :limit"
+
+
+async def search(company_id: int, q: str, tables: Sequence[str], limit: int = 20) -> List[Dict]:
+    tsq = prefix_tsquery(q)
+    if not tsq or not tables:
+        return []
+    trgm = await trgm_available()
+    params = {"tsq": tsq, "q": q, "limit": int(limit)}
+    if trgm:
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.update(like=f"%{escaped}%")
+    rows = await database.fetch_all(text(search_sql(tables, trgm, company_id)).bindparams(**params))
+    return [dict(r._mapping) for r in rows]
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+
+# Lecture incrémentale des corps d'import (CSV ou tableau JSON) : on ne garde en mémoire
+# que l'enregistrement en cours, jamais le fichier entier.
+
+_JSON = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+async def _text_chunks(chunks: AsyncIterator[bytes], encoding: str = "utf-8") -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)(errors="strict")
+    try:
+        async for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail=f"Body is not valid {encoding}")
+    if tail:
+        yield tail
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Optional[str]]]:
+    """
+    Une ligne CSV (avec en-tête) -> dict ; cellules vides -> None.
+    Un enregistrement est complet quand son nombre de guillemets est pair (RFC 4180 :
+    les guillemets échappés sont doublés), ce qui gère les retours à la ligne entre guillemets.
+    """
+    header: Optional[List[str]] = None
+    pending = ""
+    buf = ""
+    first = True
+    async for text in _text_chunks(chunks):
+        if first:
+            text = text.lstrip("\ufeff")  # BOM Excel
+            first = False
+        buf += text
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            pending += line + "\n"
+            if pending.count('"') % 2:
+                continue
+            record, pending = pending, ""
+            fields = next(csv.reader([record]), None)
+            if not fields or not any(f.strip() for f in fields):
+                continue
+            if header is None:
+                header = [f.strip().lower() for f in fields]
+                continue
+            yield {k: (v.strip() or None) for k, v in zip(header, fields)}
+    pending += buf
+    if pending.strip():
+        fields = next(csv.reader([pending]), None)
+        if fields and header is not None:
+            yield {k: (v.strip() or None) for k, v in zip(header, fields)}
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Éléments d'un tableau JSON de premier niveau, décodés au fil de l'eau (raw_decode)."""
+    buf = ""
+    pos = 0
+    started = False
+    source = _text_chunks(chunks)
+    eof = False
+    while True:
+        # compacte le tampon pour ne pas garder les éléments déjà décodés
+        if pos:
+            buf, pos = buf[pos:], 0
+        while pos < len(buf) and buf[pos] in _WS:
+            pos += 1
+        if not started:
+            if pos < len(buf):
+                if buf[pos] != "[":
+                    raise HTTPException(status_code=400, detail="Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+        elif pos < len(buf) and buf[pos] == "]":
+            break
+        elif pos < len(buf) and buf[pos] == ",":
+            pos += 1
+            continue
+        elif pos < len(buf):
+            try:
+                item, end = _JSON.raw_decode(buf, pos)
+            except ValueError:
+                item, end = None, -1
+            if end != -1:
+                pos = end
+                yield item
+                continue
+            if eof:
+                raise HTTPException(status_code=400, detail="Malformed JSON array")
+        if eof:
+            raise HTTPException(status_code=400, detail="Unterminated JSON array")
+        try:
+            buf += await source.__anext__()
+        except StopAsyncIteration:
+            eof = True
+    if buf[pos + 1:].strip():
+        raise HTTPException(status_code=400, detail="Unexpected data after JSON array")
+
+
+def request_rows(request: Request) -> AsyncIterator[Any]:
+    """Choisit le lecteur selon le Content-Type (text/csv ou application/json)."""
+    ctype = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if ctype in ("text/csv", "application/csv", "text/plain"):
+        return iter_csv_rows(request.stream())
+    if ctype in ("application/json", ""):
+        return iter_json_array(request.stream())
+    raise HTTPException(status_code=415, detail="Use text/csv or application/json")
+
+
+def request_csv(request: Request) -> AsyncIterator[bytes]:
+    """Corps CSV brut (octets), pour les imports qui le transmettent tel quel à COPY."""
+    ctype = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    if ctype not in ("text/csv", "application/csv", "text/plain"):
+        raise HTTPException(status_code=415, detail="Use text/csv")
+    return request.stream()
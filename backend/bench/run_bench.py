@@ -0,0 +1,310 @@
+"""
+Benchmark des chemins chauds de l'API sur un jeu semé par bench/seed_synthetic.py.
+
+    python -m bench.run_bench --tag default                          # app ASGI dans le process
+    python -m bench.run_bench --tag default --uvicorn --workers 2    # uvicorn lancé pour l'occasion
+    python -m bench.run_bench --tag default --url http://127.0.0.1:8000
+    python -m bench.run_bench ... --out after.json --baseline before.json
+
+Pour chaque endpoint : échauffement, puis `--requests` requêtes avec `--concurrency` clients
+simultanés ; p50/p95/p99, débit et erreurs en JSON (stable, trié -> diffable entre commits).
+Les cibles (factures, devis, clients) sont tirées avec une graine fixe.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence
+
+import httpx
+from sqlalchemy import text
+
+from app.db import database
+from app.auth_utils import create_access_token
+from bench.seed_synthetic import bench_companies, dataset_counts
+
+SAMPLE_SIZE = 200
+
+
+class Targets:
+    """Companies du jeu de bench (token + ids échantillonnés), tirées au sort par requête."""
+
+    def __init__(self, companies: List[Dict], seed: int = 42):
+        self.companies = companies
+        self.rng = random.Random(seed)
+
+    def pick(self) -> Dict:
+        return self.rng.choice(self.companies)
+
+    def pick_id(self, company: Dict, kind: str) -> int:
+        return self.rng.choice(company[kind])
+
+
+async def load_targets(tag: str, seed: int = 42) -> Targets:
+    companies = await bench_companies(tag)
+    if not companies:
+        raise SystemExit(f"no bench dataset for tag {tag!r}: run python -m bench.seed_synthetic --tag {tag}")
+    for c in companies:
+        c["token"] = create_access_token(c["email"], c["id"])
+        for kind, sql in (
+            ("invoices", "SELECT id FROM invoices WHERE company_id = :cid AND status <> 'draft'"),
+            ("quotes", "SELECT id FROM quotes WHERE company_id = :cid"),
+            ("clients", "SELECT id FROM clients WHERE company_id = :cid"),
+        ):
+            # why: échantillon déterministe (ORDER BY id + pas fixe), pas de random() côté SQL
+            rows = await database.fetch_all(text(f"{sql} ORDER BY id").bindparams(cid=c["id"]))
+            ids = [int(r._mapping["id"]) for r in rows]
+            step = max(1, len(ids) // SAMPLE_SIZE)
+            c[kind] = ids[::step][:SAMPLE_SIZE] or [0]
+    return Targets(companies, seed=seed)
+
+
+# Endpoint : (scénario, nom, méthode, construction de (chemin, corps JSON) à partir d'une company)
+Endpoint = tuple
+ENDPOINTS: List[Endpoint] = [
+    ("list", "invoices_list", "GET", lambda t, c: ("/invoices/_list?limit=50", None)),
+    ("list", "clients_list", "GET", lambda t, c: ("/clients/?limit=50", None)),
+    ("list", "quotes_list", "GET", lambda t, c: ("/quotes/?limit=50", None)),
+    ("detail", "invoice_detail", "GET", lambda t, c: (f"/invoices/by-id/{t.pick_id(c, 'invoices')}/detail", None)),
+    ("detail", "quote_get", "GET", lambda t, c: (f"/quotes/{t.pick_id(c, 'quotes')}", None)),
+    ("detail", "client_get", "GET", lambda t, c: (f"/clients/{t.pick_id(c, 'clients')}", None)),
+    ("pdf", "invoice_pdf", "GET", lambda t, c: (f"/invoices/by-id/{t.pick_id(c, 'invoices')}/download.pdf", None)),
+    ("report", "reports_status", "GET", lambda t, c: ("/reports/status", None)),
+    ("report", "reports_monthly", "GET", lambda t, c: ("/reports/monthly?months=12", None)),
+    ("search", "search", "GET", lambda t, c: (f"/search/?q=client+{t.rng.randint(1, 999)}", None)),
+    ("payment", "payment_add", "POST", lambda t, c: (
+        f"/payments/{t.pick_id(c, 'invoices')}", {"amount_cents": 1, "method": "card", "note": "bench"},
+    )),
+]
+SCENARIOS = sorted({e[0] for e in ENDPOINTS})
+
+
+def percentile(ordered: Sequence[float], p: float) -> float:
+    """Rang le plus proche sur une liste triée (pas d'interpolation : valeur réellement observée)."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], errors: int, elapsed: float) -> Dict:
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status": dict(sorted(statuses.items())),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+            "max": ms(ordered[-1]) if ordered else 0.0,
+        },
+    }
+
+
+async def run_endpoint(client: httpx.AsyncClient, targets: Targets, endpoint: Endpoint,
+                       requests: int, concurrency: int, warmup: int = 0) -> Dict:
+    _, _, method, build = endpoint
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+
+    async def one(record: bool) -> None:
+        nonlocal errors
+        company = targets.pick()
+        path, body = build(targets, company)
+        headers = {"Authorization": f"Bearer {company['token']}"}
+        started = time.perf_counter()
+        try:
+            r = await client.request(method, path, json=body, headers=headers)
+            status = str(r.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        took = time.perf_counter() - started
+        if record:
+            latencies.append(took)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not status.isdigit() or int(status) >= 400:
+                errors += 1
+
+    async def worker(n: int, record: bool) -> None:
+        for _ in range(n):
+            await one(record)
+
+    def split(total: int) -> List[int]:
+        return [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+
+    await asyncio.gather(*(worker(n, False) for n in split(warmup)))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n, True) for n in split(requests)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - started)
+
+
+async def run_all(client: httpx.AsyncClient, targets: Targets, scenarios: Sequence[str],
+                  requests: int, concurrency: int, warmup: int,
+                  progress: Optional[Callable[[str, Dict], None]] = None) -> Dict[str, Dict]:
+    results = {}
+    for endpoint in ENDPOINTS:
+        if endpoint[0] not in scenarios:
+            continue
+        res = await run_endpoint(client, targets, endpoint, requests, concurrency, warmup)
+        results[endpoint[1]] = {"scenario": endpoint[0], **res}
+        if progress:
+            progress(endpoint[1], results[endpoint[1]])
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> str:
+    """Tableau p50 / p95 / rps avant -> après (variation en %)."""
+    def delta(old, new):
+        return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+
+    lines = [f"{'endpoint':<18} {'p50 ms':>22} {'p95 ms':>22} {'rps':>22}"]
+    for name, new in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        cols = []
+        for get in (lambda r: r["latency_ms"]["p50"], lambda r: r["latency_ms"]["p95"], lambda r: r["rps"]):
+            cols.append(f"{get(old):>7} -> {get(new):<7} {delta(get(old), get(new)):>5}")
+        lines.append(f"{name:<18} " + " ".join(f"{c:>22}" for c in cols))
+    return "\n".join(lines)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while True:
+            try:
+                if (await client.get("/healthz")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit(f"server at {url} not ready after {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+
+async def main(args) -> int:
+    scenarios = args.scenarios.split(",") if args.scenarios else SCENARIOS
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"unknown scenarios: {', '.join(sorted(unknown))} (known: {', '.join(SCENARIOS)})", file=sys.stderr)
+        return 2
+
+    await database.connect()
+    server = None
+    try:
+        targets = await load_targets(args.tag, seed=args.seed)
+        rows = await dataset_counts([c["id"] for c in targets.companies])
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        timeout = httpx.Timeout(args.timeout)
+
+        def progress(name, res):
+            lat = res["latency_ms"]
+            print(f"{name:<18} p50 {lat['p50']:>8} ms  p95 {lat['p95']:>8} ms  p99 {lat['p99']:>8} ms  "
+                  f"{res['rps']:>8} req/s  errors {res['errors']}", file=sys.stderr)
+
+        if args.url or args.uvicorn:
+            url = args.url
+            if args.uvicorn:
+                port = _free_port()
+                url = f"http://127.0.0.1:{port}"
+                server = subprocess.Popen(
+                    [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                     "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+                    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                )
+            await _wait_ready(url)
+            target = {"mode": "uvicorn" if args.uvicorn else "http", "url": url, "workers": args.workers if args.uvicorn else None}
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+                results = await run_all(client, targets, scenarios, args.requests, args.concurrency, args.warmup, progress)
+        else:
+            from app.main import app  # import tardif : inutile (et coûteux) en mode HTTP
+
+            target = {"mode": "asgi"}
+            async with app.router.lifespan_context(app):
+                # exceptions de l'app -> réponse 500 comptée en erreur, pas d'arrêt du bench
+                transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                    results = await run_all(client, targets, scenarios, args.requests, args.concurrency, args.warmup, progress)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if database.is_connected:
+            await database.disconnect()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "target": target,
+            "tag": args.tag,
+            "dataset": {"companies": len(targets.companies), **rows},
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(compare(results, json.load(f)["results"]), file=sys.stderr)
+    return 1 if any(r["errors"] for r in results.values()) and args.fail_on_error else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark API hot paths (latency percentiles, throughput)")
+    parser.add_argument("--tag", default="default", help="dataset seeded by bench.seed_synthetic")
+    parser.add_argument("--scenarios", default="", help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=60.0, help="per request, seconds")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    target.add_argument("--uvicorn", action="store_true", help="start uvicorn on a free port for the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (with --uvicorn)")
+    parser.add_argument("--out", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", help="previous JSON results to compare against")
+    parser.add_argument("--fail-on-error", action="store_true", help="exit 1 if any request failed")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
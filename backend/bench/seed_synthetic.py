@@ -0,0 +1,222 @@
+"""
+Jeu de données synthétique multi-tenant pour les benchmarks (cf. bench/run_bench.py).
+
+    python -m bench.seed_synthetic --companies 5 --clients 2000 --quotes 3 --invoices 2 --lines 4 --payments 1
+    python -m bench.seed_synthetic --tag ci --reset ...
+
+Volumes par parent : clients par company, devis / factures par client, lignes / paiements par facture.
+Entièrement généré côté serveur (generate_series) et déterministe : mêmes paramètres -> mêmes
+montants, statuts et dates relatives, donc des résultats comparables d'un commit à l'autre.
+Les companies sont nommées bench-<tag>-<n> ; un utilisateur bench<n>.<tag>@bench.example.com par company.
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from app.db import database
+from app.auth_utils import get_password_hash
+
+BENCH_PASSWORD = "bench-password"
+
+# Chaque instruction ne concerne qu'une company (:cid). Valeurs dérivées du rang n de la ligne
+# dans la company (row_number), jamais des ids ni de random() : même jeu quel que soit l'état
+# des séquences. CAST : asyncpg doit connaître le type des paramètres de format() / generate_series().
+SEED_COMPANY_SQL = [
+    """
+    INSERT INTO users (email, hashed_password, company_id)
+    VALUES (:email, :password, :cid)
+    """,
+    """
+    INSERT INTO clients (name, email, phone, company_id)
+    SELECT format('Client %s-%s', CAST(:idx AS int), g), format('client%s@c%s.bench.example.com', g, CAST(:idx AS int)),
+           '06' || lpad(g::text, 8, '0'), :cid
+    FROM generate_series(1, CAST(:clients AS int)) g
+    """,
+    """
+    INSERT INTO quotes (number, title, amount_cents, status, client_id, company_id, created_at)
+    SELECT 'BQ-' || lpad(n::text, 7, '0'),
+           format('Devis %s pour %s', g, name),
+           1000 + (n * 7919) % 500000,
+           (ARRAY['draft', 'sent', 'accepted', 'rejected'])[1 + n % 4],
+           client_id, :cid,
+           now() - ((n * 37) % 365) * interval '1 day'
+    FROM (
+        SELECT c.id AS client_id, c.name, g, row_number() OVER (ORDER BY c.id, g) AS n
+        FROM clients c CROSS JOIN generate_series(1, CAST(:quotes AS int)) g
+        WHERE c.company_id = :cid
+    ) s
+    """,
+    """
+    INSERT INTO invoices (number, title, status, currency, total_cents, issued_date, due_date, client_id, company_id)
+    SELECT 'BF-' || lpad(n::text, 7, '0'),
+           format('Facture %s pour %s', g, name),
+           (ARRAY['draft', 'sent', 'sent', 'paid'])[1 + n % 4],
+           'EUR', 0,
+           current_date - CAST((n * 29) % 365 AS int),
+           current_date - CAST((n * 29) % 365 AS int) + 30,
+           client_id, :cid
+    FROM (
+        SELECT c.id AS client_id, c.name, g, row_number() OVER (ORDER BY c.id, g) AS n
+        FROM clients c CROSS JOIN generate_series(1, CAST(:invoices AS int)) g
+        WHERE c.company_id = :cid
+    ) s
+    """,
+    """
+    INSERT INTO invoice_lines (invoice_id, description, qty, unit_price_cents, total_cents)
+    SELECT i.id, format('Prestation %s', g), 1 + (i.n + g) % 5, 500 + (i.n * 31 + g * 17) % 20000,
+           (1 + (i.n + g) % 5) * (500 + (i.n * 31 + g * 17) % 20000)
+    FROM (SELECT id, row_number() OVER (ORDER BY id) AS n FROM invoices WHERE company_id = :cid) i
+    CROSS JOIN generate_series(1, CAST(:lines AS int)) g
+    """,
+    """
+    UPDATE invoices i SET total_cents = l.total
+    FROM (
+        SELECT l.invoice_id, SUM(l.total_cents) AS total
+        FROM invoice_lines l JOIN invoices x ON x.id = l.invoice_id
+        WHERE x.company_id = :cid
+        GROUP BY l.invoice_id
+    ) l
+    WHERE i.id = l.invoice_id
+    """,
+    # paiements partiels sur les factures émises, soldées pour celles au statut paid
+    """
+    INSERT INTO payments (invoice_id, amount_cents, method, paid_at)
+    SELECT i.id,
+           CASE WHEN i.status = 'paid' AND g = CAST(:payments AS int)
+                THEN i.total_cents - (i.total_cents / (CAST(:payments AS int) + 1)) * (CAST(:payments AS int) - 1)
+                ELSE i.total_cents / (CAST(:payments AS int) + 1) END,
+           (ARRAY['transfer', 'card', 'cash'])[1 + (i.n + g) % 3],
+           i.issued_date + g * 7
+    FROM (
+        SELECT id, status, total_cents, issued_date, row_number() OVER (ORDER BY id) AS n
+        FROM invoices WHERE company_id = :cid
+    ) i
+    CROSS JOIN generate_series(1, CAST(:payments AS int)) g
+    WHERE i.status <> 'draft'
+    """,
+    """
+    UPDATE invoices i SET paid_cents = p.paid
+    FROM (
+        SELECT p.invoice_id, SUM(p.amount_cents) AS paid
+        FROM payments p JOIN invoices x ON x.id = p.invoice_id
+        WHERE x.company_id = :cid
+        GROUP BY p.invoice_id
+    ) p
+    WHERE i.id = p.invoice_id
+    """,
+]
+
+# ordre imposé par les clés étrangères (payments / lignes partent en cascade avec les factures)
+RESET_SQL = [
+    "DELETE FROM invoices WHERE company_id = ANY(CAST(:ids AS int[]))",
+    "DELETE FROM quotes WHERE company_id = ANY(CAST(:ids AS int[]))",
+    "DELETE FROM clients WHERE company_id = ANY(CAST(:ids AS int[]))",
+    "DELETE FROM users WHERE company_id = ANY(CAST(:ids AS int[]))",
+    "DELETE FROM document_counters WHERE company_id = ANY(CAST(:ids AS int[]))",
+    "DELETE FROM companies WHERE id = ANY(CAST(:ids AS int[]))",
+]
+
+
+_BIND = re.compile(r"(?<![:\w]):(\w+)")
+
+
+def _bound(stmt: str, params: Dict):
+    """text() n'accepte que les paramètres qu'il déclare : on ne passe que ceux de l'instruction."""
+    return text(stmt).bindparams(**{k: params[k] for k in set(_BIND.findall(stmt))})
+
+
+def bench_email(tag: str, idx: int) -> str:
+    return f"bench{idx}.{tag}@bench.example.com"
+
+
+async def bench_companies(tag: str) -> List[Dict]:
+    """Companies déjà semées pour `tag` : [{"id", "email"}] dans l'ordre de création."""
+    rows = await database.fetch_all(text(
+        "SELECT c.id, u.email FROM companies c JOIN users u ON u.company_id = c.id "
+        "WHERE c.name LIKE :pattern ORDER BY c.id"
+    ).bindparams(pattern=f"bench-{tag}-%"))
+    return [{"id": int(r._mapping["id"]), "email": r._mapping["email"]} for r in rows]
+
+
+async def dataset_counts(company_ids: List[int]) -> Dict[str, int]:
+    row = await database.fetch_one(text("""
+        SELECT (SELECT count(*) FROM clients WHERE company_id = ANY(CAST(:ids AS int[]))) AS clients,
+               (SELECT count(*) FROM quotes WHERE company_id = ANY(CAST(:ids AS int[]))) AS quotes,
+               (SELECT count(*) FROM invoices WHERE company_id = ANY(CAST(:ids AS int[]))) AS invoices,
+               (SELECT count(*) FROM invoice_lines l JOIN invoices i ON i.id = l.invoice_id
+                 WHERE i.company_id = ANY(CAST(:ids AS int[]))) AS lines,
+               (SELECT count(*) FROM payments p JOIN invoices i ON i.id = p.invoice_id
+                 WHERE i.company_id = ANY(CAST(:ids AS int[]))) AS payments
+    """).bindparams(ids=list(company_ids)))
+    return {k: int(v) for k, v in dict(row._mapping).items()}
+
+
+async def reset(tag: str) -> int:
+    ids = [c["id"] for c in await bench_companies(tag)]
+    if ids:
+        async with database.transaction():
+            for stmt in RESET_SQL:
+                await database.execute(text(stmt).bindparams(ids=ids))
+    return len(ids)
+
+
+async def seed(tag: str, companies: int, clients: int, quotes: int, invoices: int,
+               lines: int, payments: int) -> Dict:
+    """Crée les companies manquantes pour `tag` (idempotent : celles existantes sont conservées)."""
+    existing = await bench_companies(tag)
+    password = get_password_hash(BENCH_PASSWORD)  # why: un seul bcrypt pour tous les utilisateurs
+    started = time.perf_counter()
+    for idx in range(len(existing) + 1, companies + 1):
+        async with database.transaction():
+            cid = await database.fetch_val(text(
+                "INSERT INTO companies (name) VALUES (:name) RETURNING id"
+            ).bindparams(name=f"bench-{tag}-{idx}"))
+            params = dict(cid=cid, idx=idx, email=bench_email(tag, idx), password=password,
+                          clients=clients, quotes=quotes, invoices=invoices, lines=lines, payments=payments)
+            for stmt in SEED_COMPANY_SQL:
+                await database.execute(_bound(stmt, params))
+    seeded = await bench_companies(tag)
+    return {
+        "tag": tag,
+        "companies": len(seeded),
+        "created": max(0, companies - len(existing)),
+        "rows": await dataset_counts([c["id"] for c in seeded]),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+async def main(args) -> int:
+    await database.connect()
+    try:
+        if args.reset:
+            removed = await reset(args.tag)
+            print(f"reset: {removed} companies removed", file=sys.stderr)
+        report = await seed(args.tag, args.companies, args.clients, args.quotes,
+                            args.invoices, args.lines, args.payments)
+        print(json.dumps(report, indent=2))
+        return 0
+    finally:
+        await database.disconnect()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a synthetic multi-tenant dataset for benchmarks")
+    parser.add_argument("--tag", default="default", help="dataset name (companies bench-<tag>-<n>)")
+    parser.add_argument("--companies", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=2000, help="per company")
+    parser.add_argument("--quotes", type=int, default=3, help="per client")
+    parser.add_argument("--invoices", type=int, default=2, help="per client")
+    parser.add_argument("--lines", type=int, default=4, help="per invoice")
+    parser.add_argument("--payments", type=int, default=1, help="per non-draft invoice")
+    parser.add_argument("--reset", action="store_true", help="delete the tag's companies first")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,126 @@
+"""
+Temps de démarrage à froid de l'API : import de app.main puis lifespan, dans des process neufs.
+
+    python -m bench.startup                          # médiane sur 5 imports
+    python -m bench.startup --runs 10 --importtime   # + modules les plus lents (python -X importtime)
+    python -m bench.startup --lifespan               # + phases du lifespan (DB requise)
+    python -m bench.startup --budget 1.5 --out startup.json
+
+Chaque mesure tourne dans un interpréteur séparé (caches d'import froids côté Python).
+Signale aussi les dépendances lourdes chargées à l'import alors qu'elles devraient rester
+paresseuses (WeasyPrint, passlib, jose/cryptography). JSON trié -> diffable entre commits.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("weasyprint", "passlib", "jose", "cryptography")
+MARKER = "startup-probe: "  # why: les workers PDF (spawn) écrivent aussi sur stdout
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter() - started
+out = {{"import_seconds": imported, "heavy": sorted(m for m in {heavy!r} if m in sys.modules), "modules": len(sys.modules)}}
+if {lifespan!r}:
+    import asyncio
+
+    async def run():
+        async with app.main.app.router.lifespan_context(app.main.app):
+            pass
+
+    asyncio.run(run())
+    out["phases"] = app.main.startup["seconds"]
+    out["bootstrap"] = app.main.startup["bootstrap"]
+print("{marker}" + json.dumps(out), flush=True)
+"""
+
+
+def _run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=BACKEND_DIR,
+                          capture_output=True, text=True, check=True)
+
+
+def probe(lifespan: bool = False) -> Dict:
+    """Un import de app.main (et le lifespan si demandé) dans un interpréteur neuf."""
+    proc = _run(_PROBE.format(heavy=HEAVY_MODULES, lifespan=lifespan, marker=MARKER))
+    line = next(line for line in proc.stdout.splitlines() if line.startswith(MARKER))
+    return json.loads(line[len(MARKER):])
+
+
+def importtime(top: int) -> List[Dict]:
+    """Modules les plus coûteux (temps cumulé, imports imbriqués compris) selon `python -X importtime`."""
+    proc = _run("import app.main", "-X", "importtime")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        # "import time:   self [us] | cumulative | imported package"
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append({"module": name.strip(), "cumulative_ms": round(int(cumulative_us) / 1000, 1), "self_ms": round(int(self_us) / 1000, 1)})
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def main(args) -> int:
+    runs = [probe(lifespan=args.lifespan) for _ in range(args.runs)]
+    seconds = sorted(r["import_seconds"] for r in runs)
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "runs": args.runs,
+        },
+        "import": {
+            "median_s": round(statistics.median(seconds), 3),
+            "min_s": round(seconds[0], 3),
+            "max_s": round(seconds[-1], 3),
+            "modules": runs[-1]["modules"],
+            "heavy_loaded": runs[-1]["heavy"],
+        },
+    }
+    if args.lifespan:
+        phases = [r["phases"] for r in runs]
+        report["lifespan"] = {
+            "median_s": {k: round(statistics.median(p[k] for p in phases), 3) for k in phases[-1] if k != "import"},
+            "bootstrap": runs[-1]["bootstrap"],
+        }
+    if args.importtime:
+        report["slowest_imports"] = importtime(args.importtime)
+
+    print(f"import app.main: median {report['import']['median_s']}s over {args.runs} runs, "
+          f"heavy modules loaded: {', '.join(report['import']['heavy_loaded']) or 'none'}", file=sys.stderr)
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+    if args.budget is not None and report["import"]["median_s"] > args.budget:
+        print(f"over budget: {report['import']['median_s']}s > {args.budget}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API cold start (import of app.main, lifespan phases)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measure")
+    parser.add_argument("--lifespan", action="store_true", help="also run the lifespan (needs DATABASE_URL)")
+    parser.add_argument("--importtime", type=int, nargs="?", const=15, default=0, metavar="N",
+                        help="list the N slowest imports (python -X importtime)")
+    parser.add_argument("--budget", type=float, help="exit 1 if the median import time exceeds this, seconds")
+    parser.add_argument("--out", help="write JSON results to this file (default: stdout)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
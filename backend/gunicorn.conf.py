@@ -0,0 +1,81 @@
+"""
+Serveur de production : gunicorn + workers uvicorn, application préchargée dans le master.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+- WEB_CONCURRENCY workers (défaut : un par CPU disponible). Chacun a son pool DB
+  (WEB_CONCURRENCY x DB_POOL_MAX_SIZE connexions au total) et ses PDF_RENDER_WORKERS process.
+- Le master exécute le bootstrap du schéma (app.bootstrap) une seule fois avant le fork.
+- Mémoire : worker recyclé après GUNICORN_MAX_REQUESTS requêtes, ou dès que son RSS dépasse
+  WORKER_MAX_MEMORY_MB (arrêt propre, le master en relance un).
+- Partagé entre workers (Postgres) : marqueurs read-your-writes (company_writes), compteurs
+  d'invalidation du cache des rapports (report_cache_generations).
+- Propre à chaque worker : coalescence du RefreshScheduler (deux workers peuvent rafraîchir
+  chacun de leur côté), caches de tokens / utilisateurs de app.deps (invalidate_user n'atteint
+  que le worker courant : un compte supprimé reste accepté jusqu'à USER_CACHE_TTL ailleurs),
+  compteurs de /metrics (chaque scrape voit un seul worker).
+"""
+import logging
+import os
+import signal
+import threading
+import time
+
+
+def _cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # why: respecte les limites CPU du conteneur (cpuset)
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or _cpus())
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+# battements de cœur des workers en mémoire plutôt que sur le disque (overlay Docker lent)
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+WORKER_MAX_MEMORY_MB = int(os.getenv("WORKER_MAX_MEMORY_MB", "0"))  # 0 = pas de limite
+MEMORY_CHECK_SECONDS = float(os.getenv("WORKER_MEMORY_CHECK_SECONDS", "10"))
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def on_starting(server):
+    # why: les workers démarrent ensemble ; sans ça chacun relançait create_all / matviews au même moment
+    from app.bootstrap import run_bootstrap
+
+    started = time.monotonic()
+    run_bootstrap()
+    server.log.info("schema bootstrap done in %.1fs", time.monotonic() - started)
+
+
+def post_worker_init(worker):
+    if WORKER_MAX_MEMORY_MB <= 0 or not os.path.exists("/proc/self/statm"):
+        return
+    log = logging.getLogger("gunicorn.error")
+
+    def watch():
+        while True:
+            time.sleep(MEMORY_CHECK_SECONDS)
+            rss = _rss_mb()
+            if rss > WORKER_MAX_MEMORY_MB:
+                log.warning("worker %s uses %.0f MB > WORKER_MAX_MEMORY_MB=%s, recycling",
+                            worker.pid, rss, WORKER_MAX_MEMORY_MB)
+                os.kill(worker.pid, signal.SIGTERM)  # arrêt propre : requêtes en cours terminées
+                return
+
+    threading.Thread(target=watch, name="memory-watchdog", daemon=True).start()
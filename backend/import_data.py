@@ -0,0 +1,64 @@
+"""
+Import en masse pour l'onboarding d'une company (COPY, cf. app/bulk_import.py).
+
+    python import_data.py clients clients.csv --company-id 3 [--on-conflict update]
+    python import_data.py quotes devis.csv --email admin@acme.fr [--no-create-clients]
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from sqlalchemy import select
+
+from app.db import database
+from app import models
+from app.bulk_import import import_clients, import_quotes
+
+CHUNK_SIZE = 1 << 20
+
+
+async def _file_chunks(path: str):
+    with (sys.stdin.buffer if path == "-" else open(path, "rb")) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def main(args) -> int:
+    await database.connect()
+    try:
+        company_id = args.company_id
+        if company_id is None:
+            utbl = models.User.__table__
+            company_id = await database.fetch_val(select(utbl.c.company_id).where(utbl.c.email == args.email))
+            if company_id is None:
+                print(f"NO_USER {args.email}", file=sys.stderr)
+                return 1
+        chunks = _file_chunks(args.file)
+        try:
+            if args.kind == "clients":
+                report = await import_clients(company_id, chunks, args.on_conflict)
+            else:
+                report = await import_quotes(company_id, chunks, create_clients=args.create_clients)
+        except ValueError as e:
+            print(f"ERROR {e}", file=sys.stderr)
+            return 1
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk CSV import (clients, quotes)")
+    parser.add_argument("kind", choices=("clients", "quotes"))
+    parser.add_argument("file", help="CSV file with header, or - for stdin")
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument("--company-id", type=int)
+    who.add_argument("--email", help="company of this user")
+    parser.add_argument("--on-conflict", choices=("skip", "update"), default="skip")
+    parser.add_argument("--no-create-clients", dest="create_clients", action="store_false")
+    sys.exit(asyncio.run(main(parser.parse_args())))
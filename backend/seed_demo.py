@@ -1,9 +1,9 @@
 import asyncio
-from datetime import datetime
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, and_
 from app.db import database
 from app import models
 from app.link_utils import create_signed_token
+from app.numbering import next_number
 
 async def main():
     await database.connect()
@@ -35,21 +35,19 @@ async def main():
         ))
 
     # create invoice
-    count = await database.fetch_val(
-        select(func.count()).select_from(itbl).where(itbl.c.company_id==company_id)
-    ) or 0
-    number = f"F-{datetime.utcnow().year}-{(int(count)+1):04d}"
-    iid = await database.execute(itbl.insert().values(
-        number=number,
-        title="Facture Demo",
-        status="draft",
-        currency="EUR",
-        total_cents=0,
-        issued_date=None,
-        due_date=None,
-        client_id=cid,
-        company_id=company_id
-    ))
+    async with database.transaction():
+        number = await next_number("invoice", company_id)
+        iid = await database.execute(itbl.insert().values(
+            number=number,
+            title="Facture Demo",
+            status="draft",
+            currency="EUR",
+            total_cents=0,
+            issued_date=None,
+            due_date=None,
+            client_id=cid,
+            company_id=company_id
+        ))
 
     # add lines
     lines = [("Prestation A", 2, 15000), ("Prestation B", 1, 9900)]
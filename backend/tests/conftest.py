@@ -0,0 +1,15 @@
+import pytest
+
+from app.metrics import record_queries
+
+
+@pytest.fixture
+def query_recorder():
+    """
+    Compte / chronomètre les requêtes SQL d'un bloc (requêtes HTTP via ASGITransport comprises) :
+
+        with query_recorder(max_queries=2) as q:
+            await ac.get(...)
+        assert not q.repeated()
+    """
+    return record_queries
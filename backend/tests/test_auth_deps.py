@@ -0,0 +1,34 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app import deps
+from app.auth_utils import create_access_token
+
+
+def test_decode_access_token_is_cached_by_token_hash(monkeypatch):
+    token = create_access_token(sub="cache@example.com", company_id=7)
+    deps._token_cache.clear()
+    assert deps.decode_access_token(token) == {"email": "cache@example.com", "company_id": 7}
+
+    def _boom(*a, **kw):
+        raise AssertionError("jwt.decode should not be called on a cache hit")
+    monkeypatch.setattr(deps.jwt, "decode", _boom)
+    assert deps.decode_access_token(token)["company_id"] == 7
+
+def test_expired_or_forged_tokens_are_rejected():
+    deps._token_cache.clear()
+    with pytest.raises(HTTPException) as exc:
+        deps.decode_access_token(create_access_token(sub="old@example.com", company_id=1, ttl_seconds=-10))
+    assert exc.value.status_code == 401
+    with pytest.raises(HTTPException):
+        deps.decode_access_token("not-a-jwt")
+
+def test_invoice_routes_use_jwt_dependency():
+    # le routeur factures ne doit plus dépendre d'un utilisateur "pris en base"
+    client = TestClient(app)
+    assert client.get("/invoices/_list").status_code in (401, 403)
+    token = create_access_token(sub="x@example.com", company_id=123456)
+    r = client.get("/invoices/_list", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
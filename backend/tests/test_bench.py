@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from bench.run_bench import compare, load_targets, percentile, run_all
+from bench.seed_synthetic import reset, seed
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) == 0.0
+
+@pytest.mark.anyio
+async def test_seed_and_run_in_process():
+    tag = f"pytest{uuid.uuid4().hex[:8]}"
+    await database.connect()
+    try:
+        report = await seed(tag, companies=2, clients=3, quotes=2, invoices=2, lines=2, payments=1)
+        assert report["companies"] == 2
+        assert report["rows"] == {"clients": 6, "quotes": 12, "invoices": 12, "lines": 24, "payments": 10}
+        # idempotent : les companies existantes sont conservées
+        assert (await seed(tag, companies=2, clients=3, quotes=2, invoices=2, lines=2, payments=1))["created"] == 0
+        balances = await database.fetch_all(
+            "SELECT status, balance_cents FROM invoices i JOIN companies c ON c.id = i.company_id "
+            f"WHERE c.name LIKE 'bench-{tag}-%'"
+        )
+        assert all(r._mapping["balance_cents"] == 0 for r in balances if r._mapping["status"] == "paid")
+
+        targets = await load_targets(tag)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            results = await run_all(ac, targets, ["list", "detail", "payment"], requests=6, concurrency=2, warmup=1)
+        assert set(results) == {"invoices_list", "clients_list", "quotes_list",
+                                "invoice_detail", "quote_get", "client_get", "payment_add"}
+        for name, res in results.items():
+            assert res["requests"] == 6 and res["errors"] == 0, (name, res["status"])
+            assert 0 < res["latency_ms"]["p50"] <= res["latency_ms"]["p99"] <= res["latency_ms"]["max"]
+        table = compare(results, results)
+        assert "invoice_detail" in table and "+0%" in table
+    finally:
+        assert await reset(tag) == 2
+        await database.disconnect()
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from app import bootstrap as bootstrap_module
+from app.bootstrap import bootstrap, bootstrap_lock
+from app.db import database, engine
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def test_bootstrap_lock_serializes_processes():
+    order = []
+
+    def second():
+        with bootstrap_lock(engine):
+            order.append("second")
+
+    with bootstrap_lock(engine):
+        t = threading.Thread(target=second)
+        t.start()
+        time.sleep(0.3)
+        order.append("first done")
+    t.join(5)
+    assert order == ["first done", "second"]
+
+@pytest.mark.anyio
+async def test_bootstrap_runs_once_per_process(monkeypatch):
+    monkeypatch.setattr(bootstrap_module, "_done", False)
+    await database.connect()
+    try:
+        await bootstrap()
+        assert bootstrap_module._done
+        assert await database.fetch_val("SELECT to_regclass('public.report_quotes_by_status') IS NOT NULL")
+
+        def fail(*args, **kwargs):
+            raise AssertionError("bootstrap ran twice")
+
+        monkeypatch.setattr(bootstrap_module, "run_migrations", fail)
+        await bootstrap()  # hérité du master après fork : rien à refaire
+    finally:
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_bootstrap_skips_when_schema_fingerprint_matches(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bootstrap_module, "_done", False)
+    await database.connect()
+    try:
+        await bootstrap()  # marqueur à jour (ou posé ici)
+        assert await bootstrap_module.applied_fingerprint() == bootstrap_module.schema_fingerprint()
+
+        monkeypatch.setattr(bootstrap_module, "run_migrations", lambda bind: calls.append(bind))
+        monkeypatch.setattr(bootstrap_module, "_done", False)
+        assert await bootstrap() == "current"
+        assert calls == []
+
+        monkeypatch.setattr(bootstrap_module, "SCHEMA_BOOTSTRAP", "always")
+        monkeypatch.setattr(bootstrap_module, "_done", False)
+        assert await bootstrap() == "applied"
+        assert calls == [engine]
+
+        monkeypatch.setattr(bootstrap_module, "SCHEMA_BOOTSTRAP", "off")
+        monkeypatch.setattr(bootstrap_module, "_done", False)
+        assert await bootstrap() == "off"
+        assert calls == [engine]
+    finally:
+        await database.disconnect()
@@ -0,0 +1,78 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+async def _chunks(data: bytes, size: int = 64):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+@pytest.mark.anyio
+async def test_import_clients_then_quotes():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Imp {suf}"))
+        ctbl = models.Client.__table__
+        await database.execute(ctbl.insert().values(name="Existing", company_id=company_id))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        csv_headers = {"content-type": "text/csv"}
+        clients_csv = "".join(
+            ["email,name\n", "x@example.com,Existing\n", ",\n", '"a@example.com","Alpha, SA"\n', 'dup@x,"Alpha, SA"\n']
+            + [f"c{n}@example.com,Client {n}\n" for n in range(500)]
+        )
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            r = await ac.post("/clients/import?on_conflict=update", content=_chunks(clients_csv.encode()), headers=csv_headers)
+            assert r.status_code == 200, r.text
+            rep = r.json()
+            assert (rep["staged"], rep["inserted"], rep["updated"], rep["rejected"]) == (504, 501, 1, 1)
+            assert rep["errors"] == [{"row": 2, "error": "name is required"}]
+            existing = await database.fetch_one(select(ctbl).where((ctbl.c.company_id == company_id) & (ctbl.c.name == "Existing")))
+            assert existing["email"] == "x@example.com"
+
+            alpha_id = await database.fetch_val(select(ctbl.c.id).where((ctbl.c.company_id == company_id) & (ctbl.c.name == "Alpha, SA")))
+            quotes_csv = (
+                "client_id,client_name,title,amount_cents,status,created_at\n"
+                f"{alpha_id},,Q1,1000,sent,2024-03-15\n"
+                ",Brand New,Q2,,,\n"
+                ",Client 7,,5,,\n"
+                ",Client 8,Q4,abc,,\n"
+                "999999999,,Q5,1,,\n"
+                ",Client 9,Q6,42,,\n"
+                f"{alpha_id},,Q7,7,,2024-02-30\n"
+                ",Brand New,Q8,8,,2024-11-02T10:00:00Z\n"
+            )
+            r = await ac.post("/quotes/import", content=quotes_csv.encode(), headers=csv_headers)
+            assert r.status_code == 200, r.text
+            rep = r.json()
+            assert (rep["staged"], rep["inserted"], rep["clients_created"], rep["rejected"]) == (8, 4, 1, 4)
+            assert [e["row"] for e in rep["errors"]] == [3, 4, 5, 7]
+            assert rep["errors"][-1]["error"] == "created_at is not a valid date"
+
+            r = await ac.post("/quotes/import", content=b"client,title\nx,y\n", headers=csv_headers)
+            assert r.status_code == 400
+            r = await ac.post("/quotes/import", content=b"{}", headers={"content-type": "application/json"})
+            assert r.status_code == 415
+
+        qtbl = models.Quote.__table__
+        rows = await database.fetch_all(select(qtbl).where(qtbl.c.company_id == company_id).order_by(qtbl.c.id))
+        year = datetime.utcnow().year
+        # numérotés dans l'année de leur created_at, l'ordre du fichier est conservé par année
+        assert [r["number"] for r in rows] == ["Q-2024-0001", f"Q-{year}-0001", f"Q-{year}-0002", "Q-2024-0002"]
+        assert (rows[0]["title"], rows[0]["status"], rows[0]["created_at"].year) == ("Q1", "sent", 2024)
+        assert (rows[1]["amount_cents"], rows[1]["status"]) == (0, "draft")
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
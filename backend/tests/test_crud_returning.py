@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_client_and_quote_writes_are_tenant_scoped():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        ctbl = models.Company.__table__
+        mine = await database.execute(ctbl.insert().values(name=f"Mine {suf}"))
+        other = await database.execute(ctbl.insert().values(name=f"Other {suf}"))
+        user = {"company_id": mine}
+        app.dependency_overrides[get_current_user] = lambda: user
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            r = await ac.post("/clients/", json={"name": "Dupont", "email": "d@example.com"})
+            assert r.status_code == 200, r.text
+            client = r.json()
+            r = await ac.post("/clients/", json={"name": "Dupont"})
+            assert r.status_code == 400
+
+            # PATCH partiel : seuls les champs envoyés changent
+            r = await ac.patch(f"/clients/{client['id']}", json={"phone": "0611"})
+            assert r.json() == {**client, "phone": "0611"}
+
+            r = await ac.post("/quotes/", json={"title": "Q", "amount_cents": 10, "client_id": client["id"]})
+            quote = r.json()
+            r = await ac.patch(f"/quotes/{quote['id']}", json={"status": "accepted"})
+            assert r.json()["status"] == "accepted" and r.json()["title"] == "Q"
+
+            user["company_id"] = other
+            assert (await ac.patch(f"/clients/{client['id']}", json={"phone": "x"})).status_code == 404
+            assert (await ac.patch(f"/quotes/{quote['id']}", json={"title": "x"})).status_code == 404
+            assert (await ac.delete(f"/quotes/{quote['id']}")).status_code == 404
+
+            user["company_id"] = mine
+            assert (await ac.delete(f"/quotes/{quote['id']}")).status_code == 204
+            assert (await ac.get(f"/quotes/{quote['id']}")).status_code == 404
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
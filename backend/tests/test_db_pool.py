@@ -0,0 +1,64 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+from app.db import DATABASE_URL, NO_STATEMENT_TIMEOUT, InstrumentedDatabase, PoolTimeoutError, pool_options
+from app.metrics import DB_POOL_ACQUIRE_TIMEOUTS, DB_POOL_SIZE, render_metrics
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def _database(**overrides) -> InstrumentedDatabase:
+    options = pool_options("test")
+    options.update(overrides)
+    return InstrumentedDatabase(DATABASE_URL, **options)
+
+@pytest.mark.anyio
+async def test_saturated_pool_times_out_and_reports_state():
+    db = _database(min_size=1, max_size=1, acquire_timeout=0.2)
+    await db.connect()
+    try:
+        held, release = asyncio.Event(), asyncio.Event()
+
+        async def hold():
+            async with db.transaction():
+                await db.fetch_val("SELECT 1")
+                held.set()
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await held.wait()
+        assert db.pool_stats() == {"size": 1, "idle": 0, "in_use": 1, "min": 1, "max": 1}
+
+        before = DB_POOL_ACQUIRE_TIMEOUTS.value("test")
+        with pytest.raises(PoolTimeoutError):
+            await db.fetch_val("SELECT 2")
+        assert DB_POOL_ACQUIRE_TIMEOUTS.value("test") == before + 1
+
+        db.collect_pool_metrics()
+        assert DB_POOL_SIZE.value("test", "in_use") == 1 and DB_POOL_SIZE.value("test", "max") == 1
+        release.set()
+        await holder
+        assert await db.fetch_val("SELECT 3") == 3
+    finally:
+        release.set()
+        await db.disconnect()
+    assert 'db_pool_connections{pool="primary",state="max"}' in render_metrics()
+
+@pytest.mark.anyio
+async def test_statement_timeout_applies_per_connection():
+    db = _database(min_size=1, max_size=1, server_settings={"statement_timeout": "100"})
+    await db.connect()
+    try:
+        with pytest.raises(asyncpg.QueryCanceledError):
+            await db.fetch_val("SELECT pg_sleep(0.5)")
+        # levée le temps d'une transaction (REFRESH, imports), puis rétablie
+        async with db.transaction():
+            await db.execute(NO_STATEMENT_TIMEOUT)
+            await db.fetch_val("SELECT pg_sleep(0.3)")
+        assert await db.fetch_val("SHOW statement_timeout") == "100ms"
+    finally:
+        await db.disconnect()
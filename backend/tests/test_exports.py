@@ -0,0 +1,58 @@
+import csv
+import gzip
+import io
+import json
+import uuid
+from datetime import date
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+from app.routers import exports
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_streamed_exports(monkeypatch):
+    monkeypatch.setattr(exports, "CHUNK_BYTES", 256)  # force plusieurs paquets
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Exp {suf}"))
+        other_id = await database.execute(models.Company.__table__.insert().values(name=f"ExpOther {suf}"))
+        ctbl, itbl = models.Client.__table__, models.Invoice.__table__
+        cid = await database.execute(ctbl.insert().values(name="Exp client", company_id=company_id))
+        await database.execute(ctbl.insert().values(name="Hidden", company_id=other_id))
+        for n in range(40):
+            await database.execute(itbl.insert().values(
+                number=f"EXP-{suf}-{n}", title=f"Facture, n°{n}", status="sent" if n % 2 else "draft",
+                currency="EUR", total_cents=100 * n, client_id=cid, company_id=company_id,
+                issued_date=date(2026, 1, 1 + n % 28),
+            ))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            r = await ac.get("/exports/invoices", params={"status": "sent", "date_to": "2026-01-10"})
+            assert r.status_code == 200
+            rows = list(csv.DictReader(io.StringIO(r.text)))
+            assert len(rows) == 10 and all(x["status"] == "sent" for x in rows)
+            assert rows[0]["title"] == "Facture, n°1" and rows[0]["issued_date"] == "2026-01-02"
+
+            r = await ac.get("/exports/invoices", params={"format": "ndjson", "gzip": "true"})
+            assert r.headers["content-type"] == "application/gzip"
+            lines = gzip.decompress(r.content).decode().splitlines()
+            assert len(lines) == 40 and json.loads(lines[-1])["balance_cents"] == 3900
+
+            r = await ac.get("/exports/clients")
+            assert [x["name"] for x in csv.DictReader(io.StringIO(r.text))] == ["Exp client"]
+            assert (await ac.get("/exports/clients", params={"status": "x"})).status_code == 400
+            assert (await ac.get("/exports/nope")).status_code == 422
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
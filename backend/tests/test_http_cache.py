@@ -0,0 +1,79 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+from app.http_cache import etag_matches
+from app.routers import invoices
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def test_etag_matches_weak_comparison():
+    assert etag_matches('W/"abc"', 'W/"abc"')
+    assert etag_matches('"x", "abc"', 'W/"abc"')
+    assert etag_matches("*", 'W/"abc"')
+    assert not etag_matches('W/"abd"', 'W/"abc"')
+    assert not etag_matches(None, 'W/"abc"')
+
+@pytest.mark.anyio
+async def test_conditional_get_quote_invoice_and_pdf(monkeypatch):
+    renders = []
+
+    async def fake_render(html, wait=False):
+        renders.append(html)
+        return b"%PDF-1.4 fake"
+
+    monkeypatch.setattr(invoices.pdf_renderer, "render", fake_render)
+    monkeypatch.setattr(invoices.pdf_cache, "get", lambda key: None)
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Etag {suf}"))
+        cid = await database.execute(models.Client.__table__.insert().values(name="E", company_id=company_id))
+        iid = await database.execute(models.Invoice.__table__.insert().values(
+            number=f"ET-{suf}", title="t", status="sent", currency="EUR", total_cents=500,
+            client_id=cid, company_id=company_id,
+        ))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            quote = (await ac.post("/quotes/", json={"title": "Q", "amount_cents": 1, "client_id": cid})).json()
+            r = await ac.get(f"/quotes/{quote['id']}")
+            etag = r.headers["etag"]
+            assert etag.startswith('W/"') and "last-modified" in r.headers and r.json() == quote
+            r = await ac.get(f"/quotes/{quote['id']}", headers={"If-None-Match": etag})
+            assert r.status_code == 304 and r.content == b""
+            r = await ac.get(f"/quotes/{quote['id']}", headers={"If-Modified-Since": r.headers["last-modified"]})
+            assert r.status_code == 304
+            await ac.patch(f"/quotes/{quote['id']}", json={"title": "Q2"})
+            r = await ac.get(f"/quotes/{quote['id']}", headers={"If-None-Match": etag})
+            assert r.status_code == 200 and r.headers["etag"] != etag
+
+            r = await ac.get(f"/clients/{cid}")
+            assert (await ac.get(f"/clients/{cid}", headers={"If-None-Match": r.headers["etag"]})).status_code == 304
+
+            inv_etag = (await ac.get(f"/invoices/by-id/{iid}")).headers["etag"]
+            detail_etag = (await ac.get(f"/invoices/by-id/{iid}/detail")).headers["etag"]
+            assert (await ac.get(f"/invoices/by-id/{iid}/detail", headers={"If-None-Match": detail_etag})).status_code == 304
+
+            r = await ac.get(f"/invoices/by-id/{iid}/download.pdf")
+            assert r.status_code == 200 and len(renders) == 1
+            pdf_etag = r.headers["etag"]
+            r = await ac.get(f"/invoices/by-id/{iid}/download.pdf", headers={"If-None-Match": pdf_etag})
+            assert r.status_code == 304 and len(renders) == 1
+
+            # un paiement change la facture (paid_cents) -> nouvelles versions partout
+            await ac.post(f"/payments/{iid}", json={"amount_cents": 100})
+            assert (await ac.get(f"/invoices/by-id/{iid}", headers={"If-None-Match": inv_etag})).status_code == 200
+            assert (await ac.get(f"/invoices/by-id/{iid}/detail", headers={"If-None-Match": detail_etag})).status_code == 200
+            r = await ac.get(f"/invoices/by-id/{iid}/download.pdf", headers={"If-None-Match": pdf_etag})
+            assert r.status_code == 200 and len(renders) == 2
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
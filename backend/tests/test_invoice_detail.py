@@ -0,0 +1,55 @@
+import uuid
+from datetime import date
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_invoice_detail_single_document():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Det {suf}"))
+        other_id = await database.execute(models.Company.__table__.insert().values(name=f"DetOther {suf}"))
+        cid = await database.execute(models.Client.__table__.insert().values(name="Det client", email="d@x.fr", company_id=company_id))
+        iid = await database.execute(models.Invoice.__table__.insert().values(
+            number=f"DET-{suf}", title="t", status="sent", currency="EUR", total_cents=1000,
+            client_id=cid, company_id=company_id, issued_date=date(2026, 3, 1),
+        ))
+        ltbl = models.InvoiceLine.__table__
+        await database.execute(ltbl.insert().values(invoice_id=iid, description="B", qty=1, unit_price_cents=400, total_cents=400))
+        await database.execute(ltbl.insert().values(invoice_id=iid, description="A", qty=2, unit_price_cents=300, total_cents=600))
+        user = {"company_id": company_id}
+        app.dependency_overrides[get_current_user] = lambda: user
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            for amount in (300, 200):
+                assert (await ac.post(f"/payments/{iid}", json={"amount_cents": amount})).status_code == 200
+
+            r = await ac.get(f"/invoices/by-id/{iid}/detail")
+            assert r.status_code == 200
+            doc = r.json()
+            assert set(doc) == {"invoice", "client", "lines", "payments"}
+            assert (doc["invoice"]["number"], doc["invoice"]["issued_date"]) == (f"DET-{suf}", "2026-03-01")
+            assert doc["invoice"]["paid_cents"] == 500 and doc["client"]["email"] == "d@x.fr"
+            assert [x["description"] for x in doc["lines"]] == ["B", "A"]
+            assert [x["balance_after_cents"] for x in doc["payments"]] == [700, 500]
+
+            r = await ac.get(f"/invoices/by-id/{iid}/detail", params={"fields": "invoice, client"})
+            assert set(r.json()) == {"invoice", "client"}
+            assert (await ac.get(f"/invoices/by-id/{iid}/detail", params={"fields": "secret"})).status_code == 400
+
+            user["company_id"] = other_id
+            assert (await ac.get(f"/invoices/by-id/{iid}/detail")).status_code == 404
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
@@ -0,0 +1,81 @@
+import io
+import uuid
+import zipfile
+from datetime import date
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+from app.pdf_cache import pdf_cache
+from app.pdf_render import pdf_renderer
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_export_zip_streams_one_pdf_per_invoice(monkeypatch):
+    # rendu factice : on teste le regroupement + le ZIP, pas WeasyPrint
+    monkeypatch.setattr(pdf_renderer, "backend", "inline")
+    monkeypatch.setattr(pdf_renderer, "render_fn", lambda html: b"%PDF-" + html.encode()[:20])
+    await database.connect()
+    try:
+        utbl = models.User.__table__
+        u = await database.fetch_one(select(utbl).limit(1))
+        if not u:
+            pytest.skip("No user in DB. Create admin via UI, then rerun tests.")
+        company_id = int(u["company_id"])
+
+        ctbl = models.Client.__table__
+        itbl = models.Invoice.__table__
+        ltbl = models.InvoiceLine.__table__
+        suf = uuid.uuid4().hex[:8]
+        cid = await database.execute(ctbl.insert().values(name=f"Export {suf}", company_id=company_id))
+        ids = []
+        for n in range(3):
+            iid = await database.execute(itbl.insert().values(
+                number=f"EXP-{suf}-{n}", title="Export", status="sent", currency="EUR",
+                total_cents=100, issued_date=date.today(), client_id=cid, company_id=company_id,
+            ))
+            ids.append(iid)
+            for _ in range(n):  # 0, 1 puis 2 lignes
+                await database.execute(ltbl.insert().values(
+                    invoice_id=iid, description="L", qty=1, unit_price_cents=50, total_cents=50
+                ))
+
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            r = await ac.post("/invoices/export.zip", json={"ids": ids})
+            assert r.status_code == 200, r.text
+            assert r.headers["content-type"].startswith("application/zip")
+            names = sorted(zipfile.ZipFile(io.BytesIO(r.content)).namelist())
+            assert names == sorted(f"invoice_EXP-{suf}-{n}.pdf" for n in range(3))
+
+            r = await ac.post("/invoices/export.zip", json={"ids": [ids[0]], "status": "paid"})
+            assert r.status_code == 404
+
+            # un rendu qui échoue (WeasyPrint, pool cassé...) -> ZIP complet + ERRORS.txt, pas d'archive tronquée
+            def flaky(html):
+                if f"EXP-{suf}-1" in html:
+                    raise RuntimeError("boom")
+                return b"%PDF-ok"
+
+            monkeypatch.setattr(pdf_renderer, "render_fn", flaky)
+            for iid in ids:
+                pdf_cache.invalidate(iid)
+            r = await ac.post("/invoices/export.zip", json={"ids": ids})
+            assert r.status_code == 200
+            zf = zipfile.ZipFile(io.BytesIO(r.content))
+            assert sorted(zf.namelist()) == sorted(
+                [f"invoice_EXP-{suf}-0.pdf", f"invoice_EXP-{suf}-2.pdf", "ERRORS.txt"]
+            )
+            assert zf.read("ERRORS.txt").decode() == f"EXP-{suf}-1: RuntimeError: boom"
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
@@ -0,0 +1,68 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app.metrics import Histogram, MetricsMiddleware, REGISTRY, REQUEST_DB_QUERIES
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("test_latency_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    REGISTRY.remove(h)
+    for v in (0.05, 0.5, 0.7, 3.0):
+        h.observe(v, '/a"b')
+    lines = h.render().splitlines()
+    assert lines[:2] == ["# HELP test_latency_seconds Test.", "# TYPE test_latency_seconds histogram"]
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{route="/a\\"b"} 4' in lines
+    with pytest.raises(ValueError):
+        h.observe(1.0)
+
+@pytest.mark.anyio
+async def test_metrics_endpoint_reports_route_latency_and_db_queries():
+    await database.connect()
+    try:
+        before = REQUEST_DB_QUERIES.count("GET", "/healthz")
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            assert (await ac.get("/healthz")).status_code == 200
+            await ac.get("/nope/123")
+            r = await ac.get("/metrics")
+        assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+        body = r.text
+        assert 'http_requests_total{method="GET",route="/healthz",status="200"}' in body
+        assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in body
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/healthz",le="+Inf"}' in body
+        assert "http_requests_in_flight 1" in body  # la requête /metrics elle-même
+        assert REQUEST_DB_QUERIES.count("GET", "/healthz") == before + 1
+        assert 'http_request_db_queries_bucket{method="GET",route="/healthz",le="0"}' in body
+    finally:
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_slow_request_log_includes_sql(caplog):
+    inner = FastAPI()
+
+    @inner.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"v": await database.fetch_val("SELECT 40 + :n", {"n": item_id})}
+
+    slow_app = MetricsMiddleware(inner, slow_ms=0)
+    await database.connect()
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.slow_requests"):
+            async with AsyncClient(transport=ASGITransport(app=slow_app), base_url="http://test") as ac:
+                assert (await ac.get("/items/2")).json() == {"v": 42}
+        record = caplog.records[-1].getMessage()
+        assert "GET /items/2 (route /items/{item_id}) -> 200" in record
+        assert "1 queries" in record and "SELECT 40 + :n" in record
+    finally:
+        await database.disconnect()
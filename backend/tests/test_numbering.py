@@ -0,0 +1,44 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+from app.numbering import format_number, reserve_numbers
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def test_format_number():
+    assert format_number("quote", 2026, 1) == "Q-2026-0001"
+    assert format_number("invoice", 2026, 12345) == "F-2026-12345"
+
+@pytest.mark.anyio
+async def test_concurrent_quotes_get_distinct_consecutive_numbers():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Num {suf}"))
+        cid = await database.execute(models.Client.__table__.insert().values(name="C", company_id=company_id))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            async def _create(n):
+                r = await ac.post("/quotes/", json={"title": f"q{n}", "amount_cents": 100, "client_id": cid})
+                assert r.status_code == 200, r.text
+                return r.json()["number"]
+            numbers = await asyncio.gather(*(_create(n) for n in range(10)))
+        year = datetime.utcnow().year
+        assert sorted(numbers) == [f"Q-{year}-{n:04d}" for n in range(1, 11)]
+
+        batch = await reserve_numbers("quote", company_id, 3)
+        assert batch == [f"Q-{year}-{n:04d}" for n in range(11, 14)]
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
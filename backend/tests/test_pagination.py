@@ -0,0 +1,74 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+from app.pagination import encode_cursor, decode_cursor
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def test_cursor_roundtrip_and_validation():
+    tok = encode_cursor(["Dupont & Fils", 42])
+    assert decode_cursor(tok, (str, int)) == ["Dupont & Fils", 42]
+    with pytest.raises(HTTPException):
+        decode_cursor(tok, (int,))
+    with pytest.raises(HTTPException):
+        decode_cursor("%%%not-base64", (int,))
+    # bien formés mais forgés : mauvais types, bool, hors plage Integer
+    for forged in (["x"], [None], [True], [1.5], [2**40]):
+        with pytest.raises(HTTPException):
+            decode_cursor(encode_cursor(forged), (int,))
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor([None, 1]), (str, int))
+
+@pytest.mark.anyio
+async def test_forged_cursor_is_rejected_with_400():
+    await database.connect()
+    app.dependency_overrides[get_current_user] = lambda: {"company_id": 0}
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            for path, forged in (("/invoices/_list", ["x"]), ("/quotes/", [None]), ("/clients/", ["a", "b"])):
+                r = await ac.get(path, params={"after": encode_cursor(forged)})
+                assert r.status_code == 400, (path, r.text)
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_clients_keyset_walks_all_pages_without_overlap():
+    await database.connect()
+    try:
+        u = await database.fetch_one(select(models.User.__table__).limit(1))
+        if not u:
+            pytest.skip("No user in DB. Create admin via UI, then rerun tests.")
+        company_id = int(u["company_id"])
+        ctbl = models.Client.__table__
+        suf = uuid.uuid4().hex[:8]
+        for n in range(5):
+            await database.execute(ctbl.insert().values(name=f"Page-{suf}-{n}", company_id=company_id))
+
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        seen = []
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            params = {"q": f"Page-{suf}", "limit": 2, "cursor": True}
+            while True:
+                r = await ac.get("/clients/", params=params)
+                assert r.status_code == 200, r.text
+                body = r.json()
+                seen += [c["name"] for c in body["items"]]
+                if not body["next_cursor"]:
+                    break
+                params["after"] = body["next_cursor"]
+        assert seen == [f"Page-{suf}-{n}" for n in range(5)]
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
@@ -0,0 +1,96 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from passlib.context import CryptContext
+from sqlalchemy import select
+
+from app.main import app
+from app.db import database
+from app import auth_utils, models
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def _ctx(rounds: int) -> CryptContext:
+    return CryptContext(
+        schemes=["bcrypt"], deprecated="auto",
+        bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds,
+    )
+
+@pytest.mark.anyio
+async def test_hashing_runs_in_executor_and_reports_stats(monkeypatch):
+    monkeypatch.setattr(auth_utils, "_pwd", _ctx(4))
+    before = auth_utils.password_hashing_stats()["calls"]
+    h = await auth_utils.hash_password_async("s3cret")
+    ok, new_hash = await auth_utils.verify_and_update_password_async("s3cret", h)
+    assert ok and new_hash is None
+    st = auth_utils.password_hashing_stats()
+    assert st["calls"] == before + 2
+    assert st["hash_seconds_max"] > 0
+
+@pytest.mark.anyio
+async def test_login_rehashes_when_cost_changes(monkeypatch):
+    monkeypatch.setattr(auth_utils, "_pwd", _ctx(4))
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        email = f"rehash.{suf}@example.com"
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            r = await ac.post("/auth/register", json={"email": email, "password": "pw", "company_name": f"Co {suf}"})
+            assert r.status_code == 200, r.text
+
+            monkeypatch.setattr(auth_utils, "_pwd", _ctx(5))
+            r = await ac.post("/auth/login", json={"email": email, "password": "pw"})
+            assert r.status_code == 200, r.text
+            r = await ac.post("/auth/login", json={"email": email, "password": "bad"})
+            assert r.status_code == 400
+
+        utbl = models.User.__table__
+        stored = await database.fetch_val(select(utbl.c.hashed_password).where(utbl.c.email == email))
+        assert stored.startswith("$2b$05$")
+    finally:
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_saturated_hashing_is_rejected_with_retry_after(monkeypatch):
+    import anyio
+    import threading
+    gate = threading.Event()
+    monkeypatch.setattr(auth_utils, "BCRYPT_MAX_PENDING", 1)
+    await database.connect()
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(auth_utils._run_hashing, gate.wait, 5)
+            await anyio.sleep(0.05)
+            with pytest.raises(auth_utils.HashingBusy):
+                await auth_utils.hash_password_async("pw")
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+                r = await ac.post("/auth/register", json={
+                    "email": f"busy.{uuid.uuid4().hex[:8]}@example.com", "password": "pw", "company_name": "Busy Co",
+                })
+            assert r.status_code == 503
+            assert r.headers["Retry-After"] == str(auth_utils.BCRYPT_RETRY_AFTER)
+            gate.set()
+        assert auth_utils.password_hashing_stats()["pending"] == 0
+    finally:
+        gate.set()
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_register_existing_email_skips_hashing(monkeypatch):
+    monkeypatch.setattr(auth_utils, "_pwd", _ctx(4))
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        body = {"email": f"dup.{suf}@example.com", "password": "pw", "company_name": f"Dup {suf}"}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            assert (await ac.post("/auth/register", json=body)).status_code == 200
+            calls = auth_utils.password_hashing_stats()["calls"]
+            r = await ac.post("/auth/register", json=body)
+            assert r.status_code == 400
+        assert auth_utils.password_hashing_stats()["calls"] == calls
+    finally:
+        await database.disconnect()
@@ -0,0 +1,112 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+async def _invoice(company_id: int, total: int) -> int:
+    suf = uuid.uuid4().hex[:8]
+    cid = await database.execute(models.Client.__table__.insert().values(name=f"Pay {suf}", company_id=company_id))
+    return await database.execute(models.Invoice.__table__.insert().values(
+        number=f"PAY-{suf}", title="t", status="sent", currency="EUR",
+        total_cents=total, client_id=cid, company_id=company_id,
+    ))
+
+@pytest.mark.anyio
+async def test_concurrent_payments_maintain_paid_cents_and_status():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Pay {suf}"))
+        other_id = await database.execute(models.Company.__table__.insert().values(name=f"PayOther {suf}"))
+        iid = await _invoice(company_id, 1000)
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            rs = await asyncio.gather(*(
+                ac.post(f"/payments/{iid}", json={"amount_cents": 250, "method": "transfer", "paid_at": "2026-01-31"})
+                for _ in range(4)
+            ))
+            assert all(r.status_code == 200 for r in rs), [r.text for r in rs]
+            assert rs[0].json()["paid_at"] == "2026-01-31"
+            assert len((await ac.get(f"/payments/{iid}")).json()) == 4
+
+            foreign = await _invoice(other_id, 500)
+            assert (await ac.post(f"/payments/{foreign}", json={"amount_cents": 1})).status_code == 404
+
+        itbl = models.Invoice.__table__
+        inv = await database.fetch_one(select(itbl).where(itbl.c.id == iid))
+        assert (inv["paid_cents"], inv["balance_cents"], inv["status"]) == (1000, 0, "paid")
+        other = await database.fetch_one(select(itbl).where(itbl.c.id == foreign))
+        assert other["paid_cents"] == 0
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
+
+async def _chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+@pytest.mark.anyio
+async def test_stream_parsers_handle_split_chunks():
+    from app.stream_parse import iter_csv_rows, iter_json_array
+    csv_body = 'invoice_id,amount_cents,note\n1,100,"a, ""b""\nc"\n\n2,5,\n'.encode()
+    rows = [r async for r in iter_csv_rows(_chunks(csv_body))]
+    assert rows == [
+        {"invoice_id": "1", "amount_cents": "100", "note": 'a, "b"\nc'},
+        {"invoice_id": "2", "amount_cents": "5", "note": None},
+    ]
+    json_body = b' [ {"a": "]"}, {"b": [1, 2]} , 3 ] '
+    assert [r async for r in iter_json_array(_chunks(json_body, 3))] == [{"a": "]"}, {"b": [1, 2]}, 3]
+
+@pytest.mark.anyio
+async def test_bulk_import_reports_per_row():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Bulk {suf}"))
+        other_id = await database.execute(models.Company.__table__.insert().values(name=f"BulkOther {suf}"))
+        a = await _invoice(company_id, 1000)
+        b = await _invoice(company_id, 1000)
+        foreign = await _invoice(other_id, 100)
+        itbl = models.Invoice.__table__
+        b_number = await database.fetch_val(select(itbl.c.number).where(itbl.c.id == b))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        csv_body = (
+            "invoice_id,invoice_number,amount_cents,method,paid_at,note\n"
+            f"{a},,600,transfer,2026-02-01,VIR 1\n"
+            f",{b_number},300,,,\n"
+            f"{foreign},,100,,,\n"
+            f"{a},,-5,,,\n"
+            f"{a},,400,transfer,2026-02-02,VIR 2\n"
+        ).encode()
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            r = await ac.post("/payments/bulk", content=_chunks(csv_body), headers={"content-type": "text/csv"})
+            assert r.status_code == 200, r.text
+            report = r.json()
+            assert (report["created"], report["failed"]) == (3, 2)
+            assert [x["ok"] for x in report["results"]] == [True, True, False, False, True]
+            assert report["results"][1]["invoice_id"] == b
+            assert report["results"][2]["error"] == "Invoice not found"
+
+            r = await ac.post("/payments/bulk", json=[{"invoice_id": b, "amount_cents": 700}, {"amount_cents": 1}, "x"])
+            assert [x["ok"] for x in r.json()["results"]] == [True, False, False]
+            assert (await ac.post("/payments/bulk", content=b"x", headers={"content-type": "application/xml"})).status_code == 415
+
+        rows = {r["id"]: r for r in await database.fetch_all(select(itbl).where(itbl.c.id.in_([a, b, foreign])))}
+        assert (rows[a]["paid_cents"], rows[a]["status"]) == (1000, "paid")
+        assert (rows[b]["paid_cents"], rows[b]["status"]) == (1000, "paid")
+        assert rows[foreign]["paid_cents"] == 0
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
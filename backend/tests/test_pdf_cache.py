@@ -0,0 +1,75 @@
+import pytest
+
+from app.pdf_cache import PdfCache, content_key
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def _inv(**kw):
+    inv = {"id": 1, "number": "F-2025-0001", "total_cents": 1000, "currency": "EUR"}
+    inv.update(kw)
+    return inv
+
+def test_content_key_changes_with_invoice_or_lines():
+    lines = [{"id": 1, "description": "A", "qty": 1, "unit_price_cents": 1000, "total_cents": 1000}]
+    k = content_key(_inv(), lines)
+    assert k == content_key(_inv(), list(reversed(lines)))
+    assert k != content_key(_inv(total_cents=2000), lines)
+    assert k != content_key(_inv(), [dict(lines[0], qty=2)])
+
+def test_memory_lru_eviction_and_counters():
+    c = PdfCache(memory_items=2, disk_dir="")
+    c.put("a", b"1")
+    c.put("b", b"2")
+    assert c.get("a") == b"1"       # 'a' devient le plus récent
+    c.put("c", b"3")                # évince 'b'
+    assert c.get("b") is None
+    st = c.stats()
+    assert st["hits_memory"] == 1
+    assert st["misses"] == 1
+    assert st["evictions_memory"] == 1
+    assert st["memory_entries"] == 2
+
+def test_disk_tier_survives_memory_and_evicts_by_size(tmp_path):
+    c = PdfCache(memory_items=1, disk_dir=str(tmp_path), disk_bytes=25)
+    c.put("k1", b"x" * 10)
+    c.put("k2", b"y" * 10)          # 'k1' quitte la mémoire mais reste sur disque
+    assert c.get("k1") == b"x" * 10
+    assert c.stats()["hits_disk"] == 1
+    c.put("k3", b"z" * 10)          # 30 octets > 25 -> éviction des plus anciens
+    assert c.stats()["evictions_disk"] >= 1
+    assert c.stats()["disk_bytes"] <= 25
+
+def test_invalidate_drops_known_renders(tmp_path):
+    c = PdfCache(disk_dir=str(tmp_path))
+    c.put("k1", b"pdf", invoice_id=42)
+    assert c.invalidate(42) == 1
+    assert c.get("k1") is None
+    assert c.stats()["disk_bytes"] == 0
+
+def test_invoice_index_pruned_on_eviction(tmp_path):
+    c = PdfCache(memory_items=2, disk_dir="")
+    for n in range(10):
+        c.put(f"k{n}", b"pdf", invoice_id=n)
+    assert c.stats()["indexed_invoices"] == 2   # seules les clés encore en mémoire restent indexées
+
+    c = PdfCache(memory_items=1, disk_dir=str(tmp_path), disk_bytes=25)
+    for n in range(5):
+        c.put(f"k{n}", b"x" * 10, invoice_id=n)
+    # tombées de la mémoire mais gardées sur disque tant que l'éviction disque ne les a pas prises
+    assert c.stats()["indexed_invoices"] == c.stats()["disk_bytes"] // 10
+
+@pytest.mark.anyio
+async def test_async_variants_keep_disk_io_off_the_loop(tmp_path):
+    c = PdfCache(memory_items=1, disk_dir=str(tmp_path), disk_bytes=25)
+    await c.put_async("k1", b"x" * 10, invoice_id=1)
+    await c.put_async("k2", b"y" * 10, invoice_id=2)
+    assert await c.get_async("k1") == b"x" * 10
+    assert c.stats()["hits_disk"] == 1
+    await c.put_async("k3", b"z" * 10, invoice_id=3)
+    await c._sweep_task   # balayage lancé en arrière-plan
+    assert c.stats()["disk_bytes"] <= 25
+    assert await c.invalidate_async(3) == 1
+    assert await c.get_async("k3") is None
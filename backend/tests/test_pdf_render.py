@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+from app.pdf_render import PdfRenderer, RenderQueueFull, RenderTimeout
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+_gate = threading.Event()
+
+def _blocking_render(html: str) -> bytes:
+    _gate.wait(5)
+    return html.encode()
+
+@pytest.mark.anyio
+async def test_process_backend_renders_off_loop():
+    r = PdfRenderer(backend="process", workers=1, render_fn=str.encode)
+    try:
+        await r.start()
+        assert await r.render("%PDF-fake") == b"%PDF-fake"
+        assert r.stats()["rendered"] == 1
+    finally:
+        await r.stop()
+
+@pytest.mark.anyio
+async def test_queue_full_is_rejected_with_retry_after():
+    import anyio
+    _gate.clear()
+    r = PdfRenderer(backend="thread", workers=1, max_queue=1, retry_after=7, render_fn=_blocking_render)
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(r.render, "a")
+            await anyio.sleep(0.05)
+            with pytest.raises(RenderQueueFull) as exc:
+                await r.render("b")
+            assert exc.value.retry_after == 7
+            _gate.set()
+        assert r.stats()["rejected"] == 1
+        assert r.stats()["in_flight"] == 0
+    finally:
+        _gate.set()
+        await r.stop()
+
+@pytest.mark.anyio
+async def test_render_timeout():
+    _gate.clear()
+    r = PdfRenderer(backend="thread", workers=1, timeout=0.05, render_fn=_blocking_render)
+    try:
+        with pytest.raises(RenderTimeout):
+            await r.render("slow")
+        assert r.stats()["timeouts"] == 1
+    finally:
+        _gate.set()
+        await r.stop()
+
+@pytest.mark.anyio
+async def test_background_warmup_does_not_block_start(monkeypatch):
+    import anyio
+    from app import pdf_render
+    _gate.clear()
+    monkeypatch.setattr(pdf_render, "_noop", lambda: _gate.wait(5))  # warmup bloqué jusqu'à _gate
+    r = PdfRenderer(backend="thread", workers=1, render_fn=str.encode)
+    try:
+        with anyio.fail_after(1):
+            await r.start()
+        assert not r.stats()["warm"]
+        _gate.set()
+        assert await r.render("ok") == b"ok"
+        assert r.stats()["warm"]
+    finally:
+        _gate.set()
+        await r.stop()
+
+@pytest.mark.anyio
+async def test_warmup_off_starts_no_pool():
+    r = PdfRenderer(backend="process", workers=1, warmup="off", render_fn=str.encode)
+    try:
+        await r.start()
+        assert r._executor is None
+        assert await r.render("lazy") == b"lazy"
+    finally:
+        await r.stop()
+
+@pytest.mark.anyio
+async def test_bulk_renders_leave_room_for_interactive():
+    import anyio
+    _gate.clear()
+    r = PdfRenderer(backend="thread", workers=1, max_queue=3, render_fn=_blocking_render)
+    try:
+        async with anyio.create_task_group() as tg:
+            for n in range(3):
+                tg.start_soon(lambda: r.render("bulk", wait=True))
+            await anyio.sleep(0.05)
+            assert r.stats()["in_flight"] == r.bulk_slots == 1
+            tg.start_soon(r.render, "interactive")  # place encore libre malgré l'export
+            await anyio.sleep(0.05)
+            assert r.stats()["rejected"] == 0
+            _gate.set()
+        assert r.stats()["rendered"] == 4
+    finally:
+        _gate.set()
+        await r.stop()
+
+def _failing_render(html: str) -> bytes:
+    raise ValueError("bad html")
+
+@pytest.mark.anyio
+async def test_inline_failure_counts_as_error():
+    r = PdfRenderer(backend="inline", render_fn=_failing_render)
+    with pytest.raises(ValueError):
+        await r.render("x")
+    assert r.stats()["rendered"] == 0
+    assert r.stats()["errors"] == 1
+
+def _crash(html: str) -> bytes:
+    import os
+    os._exit(1)  # worker tué (OOM killer...)
+
+@pytest.mark.anyio
+async def test_broken_pool_is_shut_down_and_replaced():
+    from concurrent.futures.process import BrokenProcessPool
+    r = PdfRenderer(backend="process", workers=1, warmup="off", render_fn=_crash)
+    try:
+        pool = r._ensure_executor()
+        shutdowns = []
+        original = pool.shutdown
+        pool.shutdown = lambda **kw: (shutdowns.append(kw), original(**kw))
+        with pytest.raises(BrokenProcessPool):
+            await r.render("x")
+        assert r._executor is None
+        assert shutdowns == [{"wait": False, "cancel_futures": True}]  # ancien pool arrêté, pas seulement oublié
+        r.render_fn = str.encode
+        assert await r.render("again") == b"again"   # pool neuf
+    finally:
+        await r.stop()
@@ -0,0 +1,103 @@
+import logging
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+from app.metrics import MetricsMiddleware
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_recorder_flags_repeats_and_budget(query_recorder):
+    await database.connect()
+    try:
+        with query_recorder() as q:
+            for i in range(3):
+                await database.fetch_val("SELECT CAST(:i AS int)", {"i": i})
+            await database.fetch_val("SELECT 1")
+        assert q.queries == 4 and q.db_seconds > 0
+        assert q.repeated() == {"SELECT CAST(:i AS int)": 3}
+
+        with pytest.raises(AssertionError, match="2 queries executed, expected at most 1"):
+            with query_recorder(max_queries=1):
+                await database.fetch_val("SELECT 1")
+                await database.fetch_val("SELECT 2")
+    finally:
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_write_endpoints_single_round_trip(query_recorder):
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"QB {suf}"))
+        other_id = await database.execute(models.Company.__table__.insert().values(name=f"QBO {suf}"))
+        cid = await database.execute(models.Client.__table__.insert().values(name="A", company_id=company_id))
+        cid2 = await database.execute(models.Client.__table__.insert().values(name="B", company_id=company_id))
+        foreign = await database.execute(models.Client.__table__.insert().values(name="X", company_id=other_id))
+        qid = await database.execute(models.Quote.__table__.insert().values(
+            number=f"QB-{suf}", title="t", amount_cents=1, status="draft", client_id=cid, company_id=company_id,
+        ))
+        inv_id = await database.execute(models.Invoice.__table__.insert().values(
+            number=f"FQB-{suf}", title="t", status="sent", currency="EUR", total_cents=100,
+            client_id=cid2, company_id=company_id,
+        ))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            with query_recorder(max_queries=1):
+                r = await ac.get(f"/invoices/by-id/{inv_id}/public_url")
+            assert r.status_code == 200 and f"/public/{inv_id}/download.pdf" in r.json()["url"]
+
+            with query_recorder(max_queries=1):
+                r = await ac.post(f"/payments/{inv_id}", json={"amount_cents": 40, "method": "card"})
+            assert r.status_code == 200
+
+            with query_recorder(max_queries=1):
+                r = await ac.patch(f"/quotes/{qid}", json={"client_id": cid2, "title": "t2"})
+            assert r.json()["client_id"] == cid2
+            # échec : contrôle complémentaire pour distinguer client étranger / devis absent
+            assert (await ac.patch(f"/quotes/{qid}", json={"client_id": foreign})).status_code == 400
+            assert (await ac.patch("/quotes/999999999", json={"client_id": cid2})).status_code == 404
+
+            qid2 = await database.execute(models.Quote.__table__.insert().values(
+                number=f"QB2-{suf}", title="t", amount_cents=1, status="draft", client_id=cid, company_id=company_id,
+            ))
+            with query_recorder(max_queries=1):
+                assert (await ac.delete(f"/clients/{cid}")).status_code == 204
+            with query_recorder(max_queries=1):
+                assert (await ac.delete(f"/clients/{foreign}")).status_code == 404
+        assert await database.fetch_val(f"SELECT count(*) FROM quotes WHERE id = {qid}") == 1  # déplacé vers cid2
+        assert await database.fetch_val(f"SELECT count(*) FROM quotes WHERE id = {qid2}") == 0
+        assert await database.fetch_val(f"SELECT count(*) FROM clients WHERE id = {foreign}") == 1
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_debug_middleware_headers_and_n_plus_one_warning(caplog):
+    inner = FastAPI()
+
+    @inner.get("/loop")
+    async def loop():
+        return [await database.fetch_val("SELECT CAST(:i AS int)", {"i": i}) for i in range(4)]
+
+    await database.connect()
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.queries"):
+            async with AsyncClient(transport=ASGITransport(app=MetricsMiddleware(inner, debug=True)),
+                                   base_url="http://test") as ac:
+                r = await ac.get("/loop")
+        assert r.headers["x-db-queries"] == "4"
+        assert r.headers["server-timing"].startswith("db;dur=")
+        assert any("possible N+1 on GET /loop: 4 x SELECT CAST(:i AS int)" in rec.getMessage() for rec in caplog.records)
+    finally:
+        await database.disconnect()
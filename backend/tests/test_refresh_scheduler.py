@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app import reporting
+from app.reporting import RefreshScheduler
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_concurrent_requests_are_coalesced(monkeypatch):
+    calls = []
+
+    async def _fake_refresh(concurrently=False):
+        calls.append(concurrently)
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(reporting, "refresh_matviews", _fake_refresh)
+    s = RefreshScheduler(min_interval=0, source="matviews")
+    await s.start()
+    try:
+        for _ in range(10):
+            assert s.request()["queued"] is True
+        await asyncio.sleep(0.2)
+        assert calls == [True]  # un seul REFRESH ... CONCURRENTLY pour 10 demandes
+        st = s.status()
+        assert st["coalesced"] == 9
+        assert st["staleness_seconds"] is not None and st["last_error"] is None
+    finally:
+        await s.stop()
+
+@pytest.mark.anyio
+async def test_min_interval_and_company_reconcile(monkeypatch):
+    refreshed, rebuilt = [], []
+
+    async def _fake_refresh(concurrently=False):
+        refreshed.append(asyncio.get_running_loop().time())
+
+    async def _fake_rebuild(company_id=None):
+        rebuilt.append(company_id)
+
+    monkeypatch.setattr(reporting, "refresh_matviews", _fake_refresh)
+    monkeypatch.setattr(reporting, "rebuild_quote_aggregates", _fake_rebuild)
+    s = RefreshScheduler(min_interval=0.2)
+    await s.start()
+    try:
+        s.request()
+        await asyncio.sleep(0.05)
+        s.request()
+        s.request(company_id=3)
+        s.request(company_id=3)
+        await asyncio.sleep(0.4)
+        assert rebuilt == [3]
+        assert len(refreshed) == 2
+        assert refreshed[1] - refreshed[0] >= 0.19
+    finally:
+        await s.stop()
+
+class _NoCache:
+    async def invalidate(self, company_id=None):
+        pass
+
+@pytest.mark.anyio
+async def test_freshness_tracks_reconciles_in_aggregates_mode(monkeypatch):
+    async def _fake_rebuild(company_id=None):
+        if company_id == 4:
+            raise RuntimeError("db down")
+
+    monkeypatch.setattr(reporting, "rebuild_quote_aggregates", _fake_rebuild)
+    monkeypatch.setattr(reporting, "report_cache", _NoCache())
+    s = RefreshScheduler(min_interval=0, source="aggregates")
+    try:
+        assert s.status(3)["last_refresh_at"] is None
+        s.request(company_id=3)
+        s.request(company_id=4)
+        await asyncio.sleep(0.05)
+        st = s.status(3)
+        assert st["last_refresh_at"] is not None and 0 <= st["staleness_seconds"] < 1
+        assert st["last_matview_refresh_at"] is None   # aucun REFRESH : sans rapport avec les agrégats
+        assert s.status(4)["last_refresh_at"] is None   # réconciliation échouée
+        assert s.status()["last_refresh_at"] == st["last_refresh_at"]
+    finally:
+        await s.stop()
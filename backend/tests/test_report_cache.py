@@ -0,0 +1,96 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database, engine
+from app import models
+from app.deps import get_current_user
+from app.report_cache import MemoryBackend, PostgresGenerationBackend, ReportCache
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture(autouse=True)
+def generations_table():
+    models.ReportCacheGeneration.__table__.create(bind=engine, checkfirst=True)
+
+@pytest.mark.anyio
+async def test_single_flight_and_generation_invalidation():
+    cache = ReportCache(MemoryBackend(maxsize=16, ttl=60), ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [{"n": len(calls)}]
+
+    results = await asyncio.gather(*(cache.get_or_compute(1, "status", {}, compute) for _ in range(20)))
+    assert len(calls) == 1 and all(r == [{"n": 1}] for r in results)
+    assert await cache.get_or_compute(1, "status", {}, compute) == [{"n": 1}]
+    assert await cache.get_or_compute(1, "monthly", {"months": 3}, compute) == [{"n": 2}]
+
+    await cache.invalidate(2)  # autre company : sans effet
+    assert await cache.get_or_compute(1, "status", {}, compute) == [{"n": 1}]
+    await cache.invalidate(1)
+    assert await cache.get_or_compute(1, "status", {}, compute) == [{"n": 3}]
+    await cache.invalidate()
+    assert await cache.get_or_compute(1, "status", {}, compute) == [{"n": 4}]
+
+    async def boom():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_compute(9, "status", {}, boom)
+    assert cache.stats()["inflight"] == 0
+
+@pytest.mark.anyio
+async def test_invalidation_reaches_other_workers():
+    # deux workers : chacun ses valeurs en mémoire, compteurs de génération partagés
+    worker_a = ReportCache(PostgresGenerationBackend(database), ttl=60, prefix=f"test-{uuid.uuid4().hex[:8]}")
+    worker_b = ReportCache(PostgresGenerationBackend(database), ttl=60, prefix=worker_a.prefix)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    await database.connect()
+    try:
+        assert await worker_a.get_or_compute(1, "status", {}, compute) == 1
+        assert await worker_b.get_or_compute(1, "status", {}, compute) == 2
+        assert await worker_b.get_or_compute(1, "status", {}, compute) == 2   # en cache côté B
+
+        await worker_a.invalidate(1)
+        assert await worker_b.get_or_compute(1, "status", {}, compute) == 3
+        await worker_a.invalidate()
+        assert await worker_b.get_or_compute(1, "status", {}, compute) == 4
+        assert worker_b.stats()["misses"] == 3
+    finally:
+        await database.disconnect()
+
+@pytest.mark.anyio
+async def test_report_endpoint_cached_until_quote_change():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"RC {suf}"))
+        cid = await database.execute(models.Client.__table__.insert().values(name="C", company_id=company_id))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            assert (await ac.get("/reports/status")).json() == []
+            # écriture hors API : le trigger des agrégats incrémente aussi la génération de la company
+            await database.execute(models.Quote.__table__.insert().values(
+                number=f"RC-{suf}", title="x", amount_cents=5, status="draft", client_id=cid, company_id=company_id,
+            ))
+            assert (await ac.get("/reports/status")).json() == [{"status": "draft", "count": 1, "amount_cents": 5}]
+            # écriture via l'API : invalidation de la company
+            await ac.post("/quotes/", json={"title": "Q", "amount_cents": 10, "client_id": cid})
+            assert (await ac.get("/reports/status")).json() == [{"status": "draft", "count": 2, "amount_cents": 15}]
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from app.db import database
+from app import models
+from app.reporting import ensure_quote_aggregates, rebuild_quote_aggregates
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+async def _snapshot(company_id: int):
+    status = await database.fetch_all(text(
+        "SELECT status, count, amount_cents FROM report_quotes_by_status WHERE company_id=:c ORDER BY status"
+    ).bindparams(c=company_id))
+    monthly = await database.fetch_all(text(
+        "SELECT month, amount_cents FROM report_monthly_revenue WHERE company_id=:c ORDER BY month"
+    ).bindparams(c=company_id))
+    return [tuple(r._mapping.values()) for r in status], [tuple(r._mapping.values()) for r in monthly]
+
+@pytest.mark.anyio
+async def test_trigger_deltas_match_full_rebuild():
+    await database.connect()
+    try:
+        await ensure_quote_aggregates()
+        suf = uuid.uuid4().hex[:8]
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"Agg {suf}"))
+        cid = await database.execute(models.Client.__table__.insert().values(name="C", company_id=company_id))
+        qtbl = models.Quote.__table__
+        ids = []
+        for n, (status, amount) in enumerate([("draft", 100), ("accepted", 200), ("accepted", 300)]):
+            ids.append(await database.execute(qtbl.insert().values(
+                number=f"AGG-{suf}-{n}", title="t", amount_cents=amount, status=status,
+                client_id=cid, company_id=company_id,
+            )))
+        await database.execute(qtbl.update().where(qtbl.c.id == ids[0]).values(status="accepted", amount_cents=150))
+        await database.execute(qtbl.delete().where(qtbl.c.id == ids[1]))
+
+        status, monthly = await _snapshot(company_id)
+        assert status == [("accepted", 2, 450)]
+        assert [m[1] for m in monthly] == [450]
+
+        await rebuild_quote_aggregates(company_id)
+        assert await _snapshot(company_id) == (status, monthly)
+
+        await database.execute(qtbl.delete().where(qtbl.c.company_id == company_id))
+        assert await _snapshot(company_id) == ([], [])
+    finally:
+        await database.disconnect()
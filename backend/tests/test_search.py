@@ -0,0 +1,62 @@
+import uuid
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.main import app
+from app.db import database
+from app import models
+from app.deps import get_current_user
+from app.search import prefix_tsquery
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def test_prefix_tsquery_sanitizes_input():
+    assert prefix_tsquery("Dupont SA") == "dupont:* & sa:*"
+    assert prefix_tsquery("a|b & !c:*") == "a:* & b:* & c:*"
+    assert prefix_tsquery("  -- ") == ""
+
+@pytest.mark.anyio
+async def test_search_ranked_prefix_and_tenant_scoped():
+    await database.connect()
+    try:
+        suf = uuid.uuid4().hex[:8]
+        ctbl = models.Client.__table__
+        company_id = await database.execute(models.Company.__table__.insert().values(name=f"S {suf}"))
+        other_id = await database.execute(models.Company.__table__.insert().values(name=f"SO {suf}"))
+        cid = await database.execute(ctbl.insert().values(name="Dupontel Plomberie", email="contact@dupontel.fr", company_id=company_id))
+        await database.execute(ctbl.insert().values(name="Martin", email="martin@dupontel.fr", company_id=company_id))
+        await database.execute(ctbl.insert().values(name="Dupontel Hidden", company_id=other_id))
+        await database.execute(models.Quote.__table__.insert().values(
+            number=f"Q-{suf}", title="Rénovation salle de bain Dupontel", amount_cents=1, status="draft",
+            client_id=cid, company_id=company_id,
+        ))
+        for number in ("F-2024-0001", "F-5e82304a"):  # découpés par Postgres en nombres signés / flottant
+            await database.execute(models.Invoice.__table__.insert().values(
+                number=number, title="Chaudière", status="sent", currency="EUR", total_cents=1,
+                client_id=cid, company_id=company_id,
+            ))
+        app.dependency_overrides[get_current_user] = lambda: {"company_id": company_id}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            hits = (await ac.get("/search/", params={"q": "dupon"})).json()
+            assert {(h["type"], h["label"]) for h in hits} == {
+                ("client", "Dupontel Plomberie"), ("client", "Martin"), ("quote", "Rénovation salle de bain Dupontel"),
+            }
+            assert hits[0]["label"] == "Dupontel Plomberie"  # nom + e-mail : meilleur rang
+
+            hits = (await ac.get("/search/", params={"q": "dupontel plomb"})).json()
+            assert [h["label"] for h in hits] == ["Dupontel Plomberie"]
+
+            for q, number in (("F-2024-0001", "F-2024-0001"), ("f-2024-00", "F-2024-0001"), ("F-5e82304a", "F-5e82304a")):
+                hits = (await ac.get("/search/", params={"q": q, "types": "invoices"})).json()
+                assert [(h["type"], h["detail"]) for h in hits] == [("invoice", number)], q
+
+            assert (await ac.get("/search/", params={"q": "chaud", "types": "quotes"})).json() == []
+            assert (await ac.get("/search/", params={"q": "x"})).status_code == 422
+            assert (await ac.get("/search/", params={"q": "xx", "types": "users"})).status_code == 400
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        await database.disconnect()
@@ -0,0 +1,12 @@
+import os
+
+from bench.startup import HEAVY_MODULES, probe
+
+# large : on vérifie surtout qu'aucune dépendance lourde ne revient dans le chemin d'import
+IMPORT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", "5"))
+
+
+def test_app_import_stays_light():
+    result = probe()
+    assert result["heavy"] == [], f"imported at startup: {result['heavy']} (expected lazy: {HEAVY_MODULES})"
+    assert result["import_seconds"] < IMPORT_BUDGET